@@ -0,0 +1,375 @@
+"""
+Python: 3.7.9
+
+Price alert rules checked against every tick
+
+Rules:
+    {"symbol": "AAPL", "field": "close", "op": ">", "value": 120}
+        the field crosses the value ("AAPL close > 120")
+    {"symbol": "AAPL", "field": "close", "op": ">", "change": 3, "window": 5}
+        the % change of the field over the last `window` minutes crosses `change`
+        ("AAPL close change > 3% in 5m")
+
+A rule fires when a tick moves its value across the threshold (from not matching to
+matching), so it fires again on every new crossing, not on every tick.
+
+Thresholds are indexed per symbol, field and operator in sorted lists: a tick moving
+the value from prev to value only looks at the thresholds between the two (bisect).
+Every (field, window) of a symbol also keeps the gap between the two stored thresholds
+around its last value (none while the last value is a threshold: a tick moving off it
+can cross it), a tick staying inside the gap (most ticks) is skipped with two
+comparisons, and only the fields some rule uses are read from a batch. The cost of a
+tick grows with the thresholds of its symbol close to the value (the narrower the gaps,
+the more ticks are looked up), not with the total number of rules.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from itertools import count
+import re
+from threading import Lock
+from typing import Any, Dict, List
+import numpy as np
+from candles import minute_keys
+import wire_format
+
+
+INFINITY = float("inf")
+OPERATORS = (">", ">=", "<", "<=")
+FIELDS = ("open", "high", "low", "close", "average", "volume")
+MAX_WINDOW = 24 * 60
+RULE_PATTERN = re.compile(
+    r"^\s*(?P<symbol>[A-Za-z0-9]+)\s+(?P<field>[a-z]+)\s+"
+    r"(?:(?P<change>change)\s+)?(?P<op>>=|<=|>|<)\s*(?P<value>-?[0-9.]+)\s*%?"
+    r"(?:\s+in\s+(?P<window>[0-9]+)\s*m(?:in)?)?\s*$"
+)
+
+
+def parse_rule(text: str) -> dict:
+    """
+    "AAPL close > 120" / "AAPL close change > 3% in 5m" -> rule dict
+    """
+    match = RULE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"! Invalid rule: {text} !")
+    rule = {
+        "symbol": match.group("symbol").upper(),
+        "field": match.group("field"),
+        "op": match.group("op"),
+    }
+    if match.group("change"):
+        rule["change"] = float(match.group("value"))
+        rule["window"] = int(match.group("window") or 1)
+    else:
+        rule["value"] = float(match.group("value"))
+    return rule
+
+
+class Rule:
+    """
+    A registered rule, owner is the client it belongs to (ex: a Socket.IO sid)
+    """
+
+    def __init__(self, rule_id: int, rule: dict, owner: Any = None):
+        self.id = rule_id
+        self.owner = owner
+        self.symbol = str(rule["symbol"]).upper()
+        self.field = rule.get("field", "close")
+        self.op = rule.get("op", ">")
+        self.window = int(rule["window"]) if "change" in rule else None
+        self.threshold = float(rule["change"] if "change" in rule else rule["value"])
+        if self.field not in FIELDS:
+            raise ValueError(f"! field must be one of {list(FIELDS)} !")
+        if self.op not in OPERATORS:
+            raise ValueError(f"! op must be one of {list(OPERATORS)} !")
+        if self.window is not None and not 0 < self.window <= MAX_WINDOW:
+            raise ValueError(f"! window must be 1 to {MAX_WINDOW} minutes !")
+
+    def __str__(self) -> str:
+        if self.window is None:
+            return f"{self.symbol} {self.field} {self.op} {self.threshold:g}"
+        return f"{self.symbol} {self.field} change {self.op} {self.threshold:g}% in {self.window}m"
+
+    def key(self) -> tuple:
+        """
+        Value the rule is checked against: (field, None) or (field, % change window)
+        """
+        return (self.field, self.window)
+
+    def to_dict(self) -> dict:
+        rule = {"id": self.id, "symbol": self.symbol, "field": self.field, "op": self.op}
+        if self.window is None:
+            rule["value"] = self.threshold
+        else:
+            rule["change"] = self.threshold
+            rule["window"] = self.window
+        rule["rule"] = str(self)
+        return rule
+
+
+class ThresholdIndex:
+    """
+    Sorted thresholds (and their rule ids) of one symbol, field, operator and window
+    """
+
+    def __init__(self, op: str):
+        self.op = op
+        self.thresholds = []
+        self.ids = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, threshold: float, rule_id: int) -> None:
+        idx = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(idx, threshold)
+        self.ids.insert(idx, rule_id)
+
+    def remove(self, threshold: float, rule_id: int) -> None:
+        lo = bisect_left(self.thresholds, threshold)
+        hi = bisect_right(self.thresholds, threshold)
+        idx = self.ids.index(rule_id, lo, hi)
+        del self.thresholds[idx]
+        del self.ids[idx]
+
+    def crossed(self, prev: float, value: float) -> List[int]:
+        """
+        Ids of the rules that do not match prev but match value (prev None: all matching)
+        """
+        thresholds = self.thresholds
+        op = self.op
+        if op == ">":
+            # prev <= t < value
+            lo = 0 if prev is None else bisect_left(thresholds, prev)
+            hi = bisect_left(thresholds, value)
+        elif op == ">=":
+            # prev < t <= value
+            lo = 0 if prev is None else bisect_right(thresholds, prev)
+            hi = bisect_right(thresholds, value)
+        elif op == "<":
+            # value < t <= prev
+            lo = bisect_right(thresholds, value)
+            hi = len(thresholds) if prev is None else bisect_right(thresholds, prev)
+        else:
+            # value <= t < prev
+            lo = bisect_left(thresholds, value)
+            hi = len(thresholds) if prev is None else bisect_left(thresholds, prev)
+        return self.ids[lo:hi] if lo < hi else []
+
+
+class SymbolAlerts:
+    """
+    Indexes and last values of one symbol
+    """
+
+    def __init__(self):
+        # (field, window) -> op -> ThresholdIndex
+        self.indexes = {}
+        # (field, window) -> previous value (window None) or previous % change
+        self.last = {}
+        # (field, window) -> sorted thresholds of all the operators
+        self.thresholds = {}
+        # (field, window) -> (lower, upper) thresholds around the last value, none between
+        self.gaps = {}
+        # field -> rules using it
+        self.fields = {}
+        # field -> (minute keys, values) of the last max_window minutes, for % changes
+        self.history = {}
+        self.max_window = 0
+
+    def add(self, rule: Rule) -> None:
+        key = rule.key()
+        by_op = self.indexes.setdefault(key, {})
+        index = by_op.get(rule.op)
+        if index is None:
+            index = by_op[rule.op] = ThresholdIndex(rule.op)
+        index.add(rule.threshold, rule.id)
+        insort(self.thresholds.setdefault(key, []), rule.threshold)
+        self.gaps.pop(key, None)
+        self.fields[rule.field] = self.fields.get(rule.field, 0) + 1
+        if rule.window is not None:
+            self.history.setdefault(rule.field, (deque(), deque()))
+            self.max_window = max(self.max_window, rule.window)
+
+    def remove(self, rule: Rule) -> None:
+        key = rule.key()
+        self.indexes[key][rule.op].remove(rule.threshold, rule.id)
+        thresholds = self.thresholds[key]
+        del thresholds[bisect_left(thresholds, rule.threshold)]
+        self.gaps.pop(key, None)
+        self.fields[rule.field] -= 1
+        if not self.fields[rule.field]:
+            del self.fields[rule.field]
+
+    def check(self, minute: int, values: Dict[str, float]) -> List[tuple]:
+        """
+        Returns (rule id, value) of the rules crossed by a tick
+        """
+        crossed = []
+        changes = {}
+        for field, value in values.items():
+            history = self.history.get(field)
+            if history is None:
+                continue
+            minutes, past = history
+            minutes.append(minute)
+            past.append(value)
+            while len(minutes) > 1 and minutes[1] <= minute - self.max_window:
+                minutes.popleft()
+                past.popleft()
+
+        last = self.last
+        gaps = self.gaps
+        for key, by_op in self.indexes.items():
+            field, window = key
+            value = values.get(field)
+            if value is None:
+                continue
+            if window is not None:
+                value = changes[key] = self.__change(field, minute, window)
+                if value is None:
+                    continue
+            # The gap holds the last value, no threshold between it and value
+            gap = gaps.get(key)
+            if gap is not None and gap[0] < value < gap[1]:
+                continue
+            prev = last.get(key)
+            if prev != value:
+                for index in by_op.values():
+                    if index.ids:
+                        for rule_id in index.crossed(prev, value):
+                            crossed.append((rule_id, value))
+            thresholds = self.thresholds[key]
+            idx = bisect_right(thresholds, value)
+            if idx and thresholds[idx - 1] == value:
+                gaps.pop(key, None)
+                continue
+            gaps[key] = (
+                thresholds[idx - 1] if idx else -INFINITY,
+                thresholds[idx] if idx < len(thresholds) else INFINITY
+            )
+
+        for field, value in values.items():
+            self.last[(field, None)] = value
+        self.last.update(changes)
+        return crossed
+
+    def __change(self, field: str, minute: int, window: int) -> float:
+        """
+        % change of the field against the last value at least `window` minutes old
+        """
+        minutes, past = self.history[field]
+        idx = bisect_right(minutes, minute - window) - 1
+        if idx < 0 or not past[idx]:
+            return None
+        return (past[-1] - past[idx]) / past[idx] * 100.0
+
+
+class AlertEngine:
+    """
+    Registered rules of every symbol, check(batch) returns the alerts a batch triggers
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.symbols = {}
+        # owner -> ids of its rules
+        self.owners = {}
+        # field -> rules using it, only these columns are read from a batch
+        self.fields = {}
+        self.__ids = count(1)
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<AlertEngine(rules={len(self.rules)}, symbols={len(self.symbols)})>"
+
+    def add(self, rule: Any, owner: Any = None) -> Rule:
+        """
+        Register a rule (dict or "AAPL close > 120" string), raises ValueError when invalid
+        """
+        if isinstance(rule, str):
+            rule = parse_rule(rule)
+        try:
+            rule = Rule(next(self.__ids), rule, owner)
+        except KeyError as err:
+            raise ValueError(f"! Rule is missing: {err} !")
+        except TypeError as err:
+            raise ValueError(f"! Invalid rule: {err} !")
+        with self.__lock:
+            alerts = self.symbols.get(rule.symbol)
+            if alerts is None:
+                alerts = self.symbols[rule.symbol] = SymbolAlerts()
+            alerts.add(rule)
+            self.fields[rule.field] = self.fields.get(rule.field, 0) + 1
+            self.rules[rule.id] = rule
+            self.owners.setdefault(owner, set()).add(rule.id)
+        return rule
+
+    def remove(self, rule_id: int) -> bool:
+        with self.__lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is None:
+                return False
+            owned = self.owners.get(rule.owner)
+            if owned:
+                owned.discard(rule_id)
+                if not owned:
+                    del self.owners[rule.owner]
+            self.symbols[rule.symbol].remove(rule)
+            self.fields[rule.field] -= 1
+            if not self.fields[rule.field]:
+                del self.fields[rule.field]
+            return True
+
+    def remove_owner(self, owner: Any) -> int:
+        """
+        Remove every rule of an owner (ex: a disconnected client)
+        """
+        with self.__lock:
+            rule_ids = list(self.owners.pop(owner, ()))
+        for rule_id in rule_ids:
+            self.remove(rule_id)
+        return len(rule_ids)
+
+    def rules_of(self, owner: Any) -> List[dict]:
+        with self.__lock:
+            return [self.rules[rule_id].to_dict() for rule_id in sorted(self.owners.get(owner, ()))]
+
+    def check(self, batch: np.ndarray) -> List[dict]:
+        """
+        Check a TICK_DTYPE batch (in time order per symbol) against the rules.
+        Returns the triggered alerts: rule dict + owner, current value, label and date.
+        """
+        alerts = []
+        if not len(batch):
+            return alerts
+        symbols = np.char.decode(batch["symbol"], "ascii").tolist()
+        keys = minute_keys(batch).tolist()
+        with self.__lock:
+            columns = {
+                field: batch[field].astype(np.float64).tolist() for field in self.fields
+            }
+            for row, symbol in enumerate(symbols):
+                symbol_alerts = self.symbols.get(symbol)
+                if symbol_alerts is None:
+                    continue
+                values = {}
+                for field in symbol_alerts.fields:
+                    value = columns[field][row]
+                    # NaN (no trade in the minute) is skipped
+                    if value == value:
+                        values[field] = value
+                for rule_id, value in symbol_alerts.check(keys[row], values):
+                    rule = self.rules[rule_id]
+                    alert = rule.to_dict()
+                    alert["owner"] = rule.owner
+                    alert["current"] = value
+                    alert["row"] = row
+                    alerts.append(alert)
+        if alerts:
+            rows = np.asarray([alert.pop("row") for alert in alerts])
+            labels = wire_format.format_minutes(batch["minute"][rows])
+            dates = wire_format.format_dates(batch["date"][rows])
+            for alert, label, date in zip(alerts, labels, dates):
+                alert["label"] = label
+                alert["date"] = date
+        return alerts
@@ -0,0 +1,124 @@
+"""
+Python: 3.7.9
+
+Shared boto3 clients and the thread pool behind the asyncio API of kinesis_api
+
+One session is built from the environment and one client per service is shared by
+every KinesisAPI/DynamoDbAPI of the process (boto3 clients are thread safe), so they
+all reuse the same pool of HTTP connections.
+
+set_client() replaces the client of a service for the whole process, so the producer,
+consumer and server can run against in-memory stand-ins (local_aws) without credentials.
+
+Clients are tuned for many requests in flight:
+    max_pool_connections : Connections kept open per client (urllib3 pool, HTTP keep-alive)
+    tcp_keepalive        : TCP keep-alive probes on idle connections (botocore >= 1.27)
+    retries              : "adaptive" mode, standard retries + client side rate limiting
+                           when the service throttles
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from os import getenv
+from threading import Lock
+from typing import Any, Callable
+from boto3 import Session as BotoSession
+from botocore.config import Config
+
+
+# Connections per client, also the number of threads running the asyncio calls
+MAX_POOL_CONNECTIONS = 50
+MAX_ATTEMPTS = 8
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+_session = None
+_clients = {}
+_executor = None
+_lock = Lock()
+
+
+def client_config(max_pool_connections: int = MAX_POOL_CONNECTIONS) -> Config:
+    options = {
+        "max_pool_connections": max_pool_connections,
+        "connect_timeout": CONNECT_TIMEOUT,
+        "read_timeout": READ_TIMEOUT,
+        "retries": {"max_attempts": MAX_ATTEMPTS, "mode": "adaptive"},
+    }
+    if "tcp_keepalive" in Config.OPTION_DEFAULTS:
+        options["tcp_keepalive"] = True
+    return Config(**options)
+
+
+def session_from_env() -> BotoSession:
+    """
+    boto3 session from AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_REGION_NAME
+    """
+    credentials = {}
+    for name, option in [
+        ("AWS_ACCESS_KEY_ID", "aws_access_key_id"),
+        ("AWS_SECRET_ACCESS_KEY", "aws_secret_access_key"),
+        ("AWS_REGION_NAME", "region_name"),
+    ]:
+        value = getenv(name)
+        if value is None:
+            raise ValueError(f"! {name} was not found/not set in environment variables. !")
+        credentials[option] = value
+    return BotoSession(**credentials)
+
+
+def get_client(service: str) -> Any:
+    """
+    Shared client of a service ("kinesis", "dynamodb"), created on first use
+    """
+    global _session
+    with _lock:
+        client = _clients.get(service)
+        if client is None:
+            if _session is None:
+                _session = session_from_env()
+            # Sessions are not thread safe, clients are created under the lock
+            client = _clients[service] = _session.client(service, config=client_config())
+        return client
+
+
+def set_client(service: str, client: Any) -> None:
+    """
+    Use `client` as the shared client of a service (ex: local_aws.LocalKinesisClient)
+    """
+    with _lock:
+        _clients[service] = client
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Shared thread pool of the asyncio calls, sized to the connection pool
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_POOL_CONNECTIONS, thread_name_prefix="aws-io"
+            )
+        return _executor
+
+
+async def run_async(func: Callable, *args, **kwargs) -> Any:
+    """
+    Await a blocking client call on the shared thread pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
+
+
+def reset() -> None:
+    """
+    Drop the shared session and clients, set ones included (ex: after the environment changed)
+    """
+    global _session, _executor
+    with _lock:
+        _session = None
+        _clients.clear()
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,8 @@
+"""
+Benchmarks for the stock streaming pipeline.
+
+Run from the backend directory so the backend modules are importable:
+
+$ cd backend
+$ python -m benchmarks.<benchmark_name> --help
+"""
@@ -0,0 +1,174 @@
+"""
+Python: 3.7.9
+
+Benchmark of the alert rule engine: per-tick latency of checking GBM minute batches
+against an increasing number of registered rules (80% price thresholds, 20% % change
+rules), vs scanning every threshold rule of the tick's symbol.
+
+Before measuring, checks that the engine fires the same threshold alerts as the scan on
+whole-number prices and thresholds, so ticks often land exactly on a threshold
+(ex: "AAPL close > 120" with the ticks 110 -> 120 -> 121 fires at 121).
+
+$ python -m benchmarks.alerts --symbols 1000 --rules 0 1000 10000 100000 --minutes 60
+"""
+from argparse import ArgumentParser
+import sys
+from time import perf_counter
+import numpy as np
+from alerts import FIELDS, OPERATORS, AlertEngine
+from simulator import GBMGenerator
+import wire_format
+
+
+def make_rules(count: int, symbols: list, prices: np.ndarray, seed: int = 3) -> list:
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(symbols), count)
+    ops = rng.integers(0, len(OPERATORS), count)
+    offsets = rng.normal(0.0, 0.05, count)
+    changes = rng.uniform(0.1, 2.0, count)
+    windows = rng.choice([1, 5, 15], count)
+    rules = []
+    for idx, row in enumerate(rows.tolist()):
+        op = OPERATORS[ops[idx]]
+        rule = {"symbol": symbols[row], "field": "close", "op": op}
+        if idx % 5 == 4:
+            rule["change"] = float(changes[idx]) * (1 if op[0] == ">" else -1)
+            rule["window"] = int(windows[idx])
+        else:
+            rule["value"] = float(prices[row] * (1 + offsets[idx]))
+        rules.append(rule)
+    return rules
+
+
+class ScanAlerts:
+    """
+    Baseline: every threshold rule of the tick's symbol is evaluated on every tick
+    """
+    CHECKS = {
+        ">": lambda value, threshold: value > threshold,
+        ">=": lambda value, threshold: value >= threshold,
+        "<": lambda value, threshold: value < threshold,
+        "<=": lambda value, threshold: value <= threshold,
+    }
+
+    def __init__(self, rules: list):
+        self.rules = {}
+        self.last = {}
+        for rule_id, rule in enumerate(rules):
+            if "value" in rule:
+                self.rules.setdefault(rule["symbol"], []).append((rule_id, rule))
+
+    def check(self, batch: np.ndarray) -> list:
+        alerts = []
+        symbols = np.char.decode(batch["symbol"], "ascii").tolist()
+        columns = {field: batch[field].astype(np.float64).tolist() for field in FIELDS}
+        for row, symbol in enumerate(symbols):
+            for rule_id, rule in self.rules.get(symbol, ()):
+                check = self.CHECKS[rule["op"]]
+                value = columns[rule["field"]][row]
+                prev = self.last.get((symbol, rule["field"]))
+                if check(value, rule["value"]) and (prev is None or not check(prev, rule["value"])):
+                    alerts.append(rule_id)
+            for field, column in columns.items():
+                self.last[(symbol, field)] = column[row]
+        return alerts
+
+
+def price_batch(symbols: list, prices: list, minute: int) -> np.ndarray:
+    """
+    One tick per symbol, every field at its price
+    """
+    batch = np.zeros(len(symbols), dtype=wire_format.TICK_DTYPE)
+    batch["date"] = 20201022
+    batch["minute"] = minute
+    batch["symbol"] = symbols
+    for field in FIELDS:
+        batch[field] = prices
+    return batch
+
+
+def verify(symbols: int = 20, minutes: int = 300, seed: int = 5) -> bool:
+    """
+    Threshold alerts of the engine vs the scan, with the prices and thresholds on whole
+    numbers. Returns False (printed) when they differ.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"S{idx}" for idx in range(symbols)]
+    rules = [
+        {"symbol": "S0", "field": "close", "op": op, "value": 120.0} for op in OPERATORS
+    ]
+    for idx in range(symbols * 20):
+        rules.append({
+            "symbol": names[idx % symbols], "field": "close",
+            "op": OPERATORS[idx % len(OPERATORS)], "value": float(rng.integers(110, 131))
+        })
+    engine = AlertEngine()
+    for rule in rules:
+        engine.add(rule)
+    scan = ScanAlerts(rules)
+    # S0 walks 110 -> 120 -> 121 -> 120 -> 119 first, then every symbol random walks
+    prices = [110.0, 120.0, 121.0, 120.0, 119.0]
+    walk = np.clip(120 + np.cumsum(rng.integers(-2, 3, (minutes, symbols)), axis=0), 105, 135)
+    for minute in range(minutes):
+        batch = price_batch(
+            names,
+            [prices[minute]] * symbols if minute < len(prices) else walk[minute].tolist(),
+            minute
+        )
+        # Engine ids start at 1, scan ids are the rule positions
+        fired = sorted(alert["id"] - 1 for alert in engine.check(batch))
+        expected = sorted(scan.check(batch))
+        if fired != expected:
+            print(f"! Minute {minute}: engine fired {fired}, scan fired {expected} !")
+            return False
+    return True
+
+
+def run(engine, batches: list, warmup: int) -> tuple:
+    latencies = []
+    alerts = 0
+    for minute, batch in enumerate(batches):
+        start = perf_counter()
+        fired = engine.check(batch)
+        elapsed = perf_counter() - start
+        if minute >= warmup:
+            latencies.append(elapsed / len(batch))
+            alerts += len(fired)
+    latencies = np.asarray(latencies) * 1e6
+    return float(np.mean(latencies)), float(np.percentile(latencies, 99)), alerts
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Alert rule engine benchmark")
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[0, 1000, 10000, 100000])
+    parser.add_argument("--minutes", type=int, default=60, help="Minute batches per run")
+    parser.add_argument("--no-scan", action="store_true", help="Skip the scan baseline")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Alert Rule Engine Benchmark")
+    print("====================================")
+    if not verify():
+        sys.exit(1)
+    print("engine alerts match the scan on ticks landing on thresholds")
+    batches = list(GBMGenerator(symbols=args.symbols, minutes=args.minutes + 15, seed=1))
+    symbols = np.char.decode(batches[0]["symbol"], "ascii").tolist()
+    prices = batches[0]["close"]
+    for count in args.rules:
+        rules = make_rules(count, symbols, prices)
+        engine = AlertEngine()
+        for rule in rules:
+            engine.add(rule)
+        # First 15 minutes fill the % change windows
+        mean, p99, alerts = run(engine, batches, warmup=15)
+        print(
+            f"{count:>7,} rules | engine {mean:>6.2f} us/tick (p99 {p99:>6.2f}) "
+            f"| alerts: {alerts:>7,}"
+        )
+        if not args.no_scan:
+            mean, p99, alerts = run(ScanAlerts(rules), batches, warmup=15)
+            print(
+                f"{'':>13} | scan   {mean:>6.2f} us/tick (p99 {p99:>6.2f}) "
+                f"| alerts: {alerts:>7,} (threshold rules only)"
+            )
@@ -0,0 +1,107 @@
+"""
+Python: 3.7.9
+
+Benchmark of the asyncio API of kinesis_api (Kinesis put_record, DynamoDB get/query)
+against the local stand-ins: throughput and latency percentiles of blocking calls in
+a loop vs N requests kept in flight on the shared aws_clients thread pool.
+
+$ python -m benchmarks.aws_async --requests 2000 --concurrency 1 4 16 64 --latency 0.005
+"""
+from argparse import ArgumentParser
+import asyncio
+from time import perf_counter
+import numpy as np
+from aws_clients import MAX_POOL_CONNECTIONS
+from kinesis_api import DynamoDbAPI, KinesisAPI
+from local_aws import LocalDynamoDbClient, LocalKinesisClient
+
+
+DYNAMO_DB_TABLE = "stock-stream-data"
+KINESIS_STREAM_NAME = "stock-stream"
+SYMBOLS = [f"S{idx:03d}" for idx in range(20)]
+MINUTES = [f"09:{minute:02d}" for minute in range(30, 60)]
+OPERATIONS = ["put_record", "get", "query"]
+
+
+def make_apis(latency: float) -> tuple:
+    db_client = LocalDynamoDbClient([DYNAMO_DB_TABLE], latency=latency)
+    db_api = DynamoDbAPI(DYNAMO_DB_TABLE, client=db_client)
+    db_client.latency = 0.0
+    db_api.put_batch([
+        {"symbol": symbol, "minute": minute, "open": 100.0}
+        for symbol in SYMBOLS for minute in MINUTES
+    ])
+    db_client.latency = latency
+    stream = LocalKinesisClient(KINESIS_STREAM_NAME, shard_count=4, latency=latency)
+    return KinesisAPI(KINESIS_STREAM_NAME, client=stream), db_api
+
+
+def call(kinesis_api: KinesisAPI, db_api: DynamoDbAPI, operation: str, idx: int, run_async):
+    symbol = SYMBOLS[idx % len(SYMBOLS)]
+    if operation == "put_record":
+        method = kinesis_api.write_record_async if run_async else kinesis_api.write_record
+        return method({"symbol": symbol, "open": 100.0}, symbol)
+    if operation == "get":
+        method = db_api.get_async if run_async else db_api.get
+        return method({"symbol": symbol, "minute": MINUTES[idx % len(MINUTES)]})
+    method = db_api.query_async if run_async else db_api.query
+    return method("symbol", symbol, sort_key="minute", since="09:50")
+
+
+def run_sync(apis: tuple, operation: str, requests: int) -> tuple:
+    latencies = []
+    start = perf_counter()
+    for idx in range(requests):
+        sent = perf_counter()
+        call(*apis, operation, idx, False)
+        latencies.append(perf_counter() - sent)
+    return perf_counter() - start, latencies
+
+
+async def run_concurrent(apis: tuple, operation: str, requests: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request(idx: int) -> None:
+        async with semaphore:
+            sent = perf_counter()
+            await call(*apis, operation, idx, True)
+            latencies.append(perf_counter() - sent)
+
+    start = perf_counter()
+    await asyncio.gather(*[request(idx) for idx in range(requests)])
+    return perf_counter() - start, latencies
+
+
+def report(label: str, requests: int, elapsed: float, latencies: list) -> None:
+    p50, p99 = np.percentile(np.asarray(latencies) * 1e3, [50, 99])
+    print(
+        f"  {label:<14} | {requests / elapsed:>9,.0f} req/sec | "
+        f"p50 {p50:>7.2f} ms | p99 {p99:>7.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Async Kinesis/DynamoDB client benchmark")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Simulated round trip per call (seconds)"
+    )
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Async AWS Client Benchmark")
+    print("====================================")
+    print(f"Thread pool / connection pool size: {MAX_POOL_CONNECTIONS}")
+    apis = make_apis(args.latency)
+    for operation in args.operations:
+        print(f"{operation}:")
+        requests = min(args.requests, 400)
+        report("sync", requests, *run_sync(apis, operation, requests))
+        for concurrency in args.concurrency:
+            elapsed, latencies = asyncio.run(
+                run_concurrent(apis, operation, args.requests, concurrency)
+            )
+            report(f"async x{concurrency}", args.requests, elapsed, latencies)
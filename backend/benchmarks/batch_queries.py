@@ -0,0 +1,83 @@
+"""
+Python: 3.7.9
+
+Benchmark of a dashboard page load of --symbols symbols (Flask test client, no network),
+one request per symbol vs one batched request:
+
+    intraday   : /api/get_intraday_data per stock vs /api/get_intraday_data_batch, every
+                 symbol cold (queried from the local DynamoDB stand-in, --db-latency)
+    historical : /api/get_historical_data per stock vs /api/get_historical_data_batch
+                 (columnar shape, historical cache warm)
+
+Reports the HTTP round trips, DynamoDB queries, server time and response bytes.
+
+$ python -m benchmarks.batch_queries --symbols 10 --minutes 390 --db-latency 0.02
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from kinesis_api import DynamoDbAPI
+from local_aws import LocalDynamoDbClient
+from simulator import GBMGenerator
+from timeseries_store import TimeSeriesStore
+import consumer
+import server
+
+
+def page_load(client, urls: list, db_client: LocalDynamoDbClient) -> tuple:
+    queries = db_client.calls.get("query", 0)
+    size = 0
+    started = perf_counter()
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+        size += len(response.data)
+    elapsed = perf_counter() - started
+    return len(urls), db_client.calls.get("query", 0) - queries, elapsed, size
+
+
+def report(name: str, method: str, result: tuple) -> None:
+    requests, queries, elapsed, size = result
+    print(
+        f"{name:<10} | {method:<6} | {requests:>3} round trips | {queries:>3} DynamoDB queries "
+        f"| {elapsed * 1e3:8.1f} ms | {size / 1e3:8.1f} KB"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Batched query API benchmark")
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--minutes", type=int, default=390)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="DynamoDB round trip")
+    parser.add_argument("--db-workers", type=int, default=8, help="Parallel queries")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Batched Query API Benchmark")
+    print("====================================")
+    db_client = LocalDynamoDbClient([consumer.DYNAMO_DB_TABLE])
+    db_api = DynamoDbAPI(consumer.DYNAMO_DB_TABLE, client=db_client, batch_workers=args.db_workers)
+    generator = GBMGenerator(symbols=args.symbols, minutes=args.minutes, seed=11)
+    symbols = [symbol.decode("ascii") for symbol in generator.symbols.tolist()]
+    for batch in generator:
+        consumer.insert_db(db_api, batch)
+    db_client.latency = args.db_latency
+    client = server.app.test_client()
+
+    for method in ["single", "batch"]:
+        # Cold live cache and store: every symbol is queried from DynamoDB
+        server.tick_store = TimeSeriesStore()
+        server.init_db(db_api)
+        if method == "single":
+            urls = [f"/api/get_intraday_data?stock={symbol}" for symbol in symbols]
+        else:
+            urls = [f"/api/get_intraday_data_batch?stocks={','.join(symbols)}"]
+        report("intraday", method, page_load(client, urls, db_client))
+
+    stocks = ["AAPL", "AMZN", "FB", "GOOGL", "INTC", "MSFT", "NFLX", "NVDA", "QCOM", "TSLA"]
+    server.historical_store.preload(stocks)
+    for method in ["single", "batch"]:
+        if method == "single":
+            urls = [f"/api/get_historical_data?stock={stock}&shape=columnar" for stock in stocks]
+        else:
+            urls = [f"/api/get_historical_data_batch?stocks={','.join(stocks)}"]
+        report("historical", method, page_load(client, urls, db_client))
@@ -0,0 +1,51 @@
+"""
+Python: 3.7.9
+
+Benchmark of the incremental candle aggregator (5m/15m/1h) on one core: one GBM
+minute batch of every symbol at a time, as the consumer sees them, plus the server
+side mirror (upsert of the published head candles).
+
+$ python -m benchmarks.candles --symbols 1000 5000 10000 --minutes 120
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from candles import CandleAggregator, decode_candles, encode_candles
+from simulator import GBMGenerator
+
+
+def run(symbols: int, minutes: int) -> None:
+    batches = list(GBMGenerator(symbols=symbols, minutes=minutes, seed=1))
+    aggregator = CandleAggregator()
+    mirror = CandleAggregator()
+    update_time = mirror_time = 0.0
+    for batch in batches:
+        start = perf_counter()
+        rows = aggregator.update(batch)
+        heads = aggregator.head_candles(rows)
+        update_time += perf_counter() - start
+
+        message = encode_candles(heads)
+        start = perf_counter()
+        for timeframe, candles in decode_candles(message).items():
+            mirror.upsert(timeframe, candles)
+        mirror_time += perf_counter() - start
+
+    ticks = symbols * minutes
+    print(
+        f"{symbols:>6} symbols | update {update_time / minutes * 1e3:>7.2f} ms/minute "
+        f"({ticks / update_time:>10,.0f} ticks/sec) | mirror "
+        f"{mirror_time / minutes * 1e3:>7.2f} ms/minute"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Incremental candle aggregator benchmark")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--minutes", type=int, default=120, help="Minute batches per run")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Candle Aggregator Benchmark")
+    print("====================================")
+    for symbols in args.symbols:
+        run(symbols, args.minutes)
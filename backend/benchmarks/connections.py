@@ -0,0 +1,234 @@
+"""
+Python: 3.7.9
+
+Load test of the connected dashboards one server process holds, per Socket.IO runtime
+(--async-modes, serve.py): starts the server in a child process against the local
+DynamoDB stand-in, feeds it one minute of --symbols symbols every 1 / --rate seconds on
+the tick channel and connects the clients (websocket, delta mode) in steps of --step.
+
+Every step reports the clients connected (and failed), the time to connect them, the
+delivery lag of the graph_delta (client receive time - server send time) while they are
+held for --hold seconds, and the server RSS and CPU. The load test stops at the first step
+with failed or dropped clients or a p99 lag above --max-lag: the previous step is the
+capacity of the node. The clients run in one asyncio process of the same machine.
+
+Needs the asyncio Socket.IO client: pip install "python-socketio[asyncio_client]"
+and eventlet/gevent for the cooperative runtimes
+
+$ python -m benchmarks.connections --async-modes threading eventlet gevent --step 1000 --max-clients 8000
+"""
+from argparse import ArgumentParser
+import asyncio
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import logging
+import multiprocessing
+from os import environ, path, remove, sysconf
+from secrets import token_hex
+from threading import Event, Thread
+from time import perf_counter, sleep, time
+import serve
+
+
+NAMESPACE = "/api/socket.io"
+CLK_TCK = sysconf("SC_CLK_TCK")
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_server(async_mode: str, port: int, tick_address: str) -> None:
+    """
+    Child process: the server on a runtime, patched before importing it
+    """
+    serve.patch(async_mode)
+    from kinesis_api import DynamoDbAPI
+    from local_aws import LocalDynamoDbClient
+    import server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server.TICK_CHANNEL_ADDRESS = tick_address
+    db_api = DynamoDbAPI("stock-stream-data", client=LocalDynamoDbClient(["stock-stream-data"]))
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        server.start("127.0.0.1", port, db_api)
+
+
+def run_clients(conn, port: int, symbols: list, window: float) -> None:
+    """
+    Child process: asyncio Socket.IO clients, driven by the commands received on conn
+    ("grow", n) -> connect up to n clients | ("hold", seconds) -> lags | ("stop", None)
+    """
+    import socketio
+
+    clients = []
+    lags = []
+
+    async def connect(idx: int) -> bool:
+        client = socketio.AsyncClient(reconnection=False)
+        snapshot = asyncio.Event()
+
+        async def on_data(resp):
+            snapshot.set()
+
+        async def on_delta(resp):
+            lags.append(time() - resp["sent_at"])
+
+        client.on("graph_data", on_data, namespace=NAMESPACE)
+        client.on("graph_delta", on_delta, namespace=NAMESPACE)
+        try:
+            await client.connect(
+                f"http://127.0.0.1:{port}", namespaces=[NAMESPACE], transports=["websocket"],
+                wait_timeout=30
+            )
+            clients.append(client)
+            await client.emit(
+                "get_live_data",
+                {"symbol": symbols[idx % len(symbols)], "mode": "delta", "window": window},
+                namespace=NAMESPACE
+            )
+            await asyncio.wait_for(snapshot.wait(), 30.0)
+            return True
+        except Exception:
+            return False
+
+    async def grow(count: int) -> tuple:
+        # 50 handshakes at a time, like dashboards opened over a few seconds
+        limit = asyncio.Semaphore(50)
+
+        async def limited(idx):
+            async with limit:
+                return await connect(idx)
+
+        started = perf_counter()
+        results = await asyncio.gather(*[limited(idx) for idx in range(len(clients), count)])
+        return sum(results), len(results) - sum(results), perf_counter() - started
+
+    async def hold(seconds: float) -> tuple:
+        lags.clear()
+        await asyncio.sleep(seconds)
+        values = list(lags)
+        connected = sum(1 for client in clients if client.connected)
+        return percentile(values, 50), percentile(values, 99), len(values), connected
+
+    async def main() -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            command, value = await loop.run_in_executor(None, conn.recv)
+            if command == "grow":
+                conn.send(await grow(value))
+            elif command == "hold":
+                conn.send(await hold(value))
+            else:
+                if clients:
+                    await asyncio.wait(
+                        [asyncio.ensure_future(client.disconnect()) for client in clients],
+                        timeout=30.0
+                    )
+                conn.send(None)
+                return
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+def process_stats(pid: int) -> tuple:
+    """
+    RSS (MB) and CPU seconds of a process (Linux /proc)
+    """
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/status") as status:
+        rss = next(int(line.split()[1]) for line in status if line.startswith("VmRSS"))
+    return rss / 1024.0, (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def feed(publisher, generator, rate: float, stop: Event) -> None:
+    """
+    Stand-in for the consumer: one minute of every symbol every 1 / rate seconds
+    """
+    import wire_format
+
+    for batch in generator:
+        if stop.wait(1.0 / rate):
+            return
+        publisher.publish(
+            {"batch": wire_format.encode_records(batch), "trace": {"produced": time()}}
+        )
+
+
+def run(async_mode: str, args) -> None:
+    from simulator import GBMGenerator
+    from tick_channel import AUTHKEY_ENV, RUNTIME_DIR, TickPublisher
+
+    spawn = multiprocessing.get_context("spawn")
+    tick_address = path.join(RUNTIME_DIR, f"ticks-load-{args.port}.sock")
+    # Inherited by the spawned server
+    environ.setdefault(AUTHKEY_ENV, token_hex(16))
+    publisher = TickPublisher(tick_address)
+    generator = iter(GBMGenerator(symbols=args.symbols, minutes=390, days=30, seed=3))
+    symbols = [symbol.decode("ascii") for symbol in next(generator)["symbol"].tolist()]
+    stop = Event()
+    Thread(target=feed, args=(publisher, generator, args.rate, stop), daemon=True).start()
+
+    server_process = spawn.Process(target=run_server, args=(async_mode, args.port, tick_address))
+    server_process.start()
+    conn, child_conn = spawn.Pipe()
+    clients_process = spawn.Process(
+        target=run_clients, args=(child_conn, args.port, symbols, args.window)
+    )
+    clients_process.start()
+    # Server start up (historical data, indicators backfill) and first ticks
+    sleep(args.startup)
+
+    capacity = 0
+    for count in range(args.step, args.max_clients + 1, args.step):
+        conn.send(("grow", count))
+        connected, failed, elapsed = conn.recv()
+        _, cpu_before = process_stats(server_process.pid)
+        conn.send(("hold", args.hold))
+        p50, p99, deltas, held = conn.recv()
+        rss, cpu_after = process_stats(server_process.pid)
+        print(
+            f"{async_mode:<9} | {held:>5} clients ({failed} failed) connected in {elapsed:5.1f}s "
+            f"| lag p50 {p50 * 1e3:7.1f} ms, p99 {p99 * 1e3:7.1f} ms ({deltas:,} deltas) "
+            f"| server {rss:6.1f} MB, CPU {(cpu_after - cpu_before) / args.hold:4.2f} s/s"
+        )
+        if failed or held < count or not deltas or p99 > args.max_lag:
+            break
+        capacity = count
+    print(f"{async_mode:<9} | capacity: {capacity} clients with a p99 lag under {args.max_lag}s")
+
+    conn.send(("stop", None))
+    conn.recv()
+    clients_process.join(30.0)
+    server_process.terminate()
+    server_process.join()
+    stop.set()
+    publisher.close()
+    if path.exists(tick_address):
+        remove(tick_address)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Concurrent connections load test")
+    parser.add_argument("--async-modes", nargs="+", choices=serve.ASYNC_MODES,
+                        default=[serve.default_async_mode()])
+    parser.add_argument("--step", type=int, default=250, help="Clients added per step")
+    parser.add_argument("--max-clients", type=int, default=3000)
+    parser.add_argument("--hold", type=float, default=10.0, help="Seconds measured per step")
+    parser.add_argument("--max-lag", type=float, default=1.0, help="Max p99 delivery lag")
+    parser.add_argument("--symbols", type=int, default=10, help="Symbols spread over clients")
+    parser.add_argument("--rate", type=float, default=0.2, help="Minutes fed per second")
+    parser.add_argument("--window", type=float, default=0.5, help="Delta coalescing window")
+    parser.add_argument("--startup", type=float, default=5.0, help="Seconds to start the server")
+    parser.add_argument("--port", type=int, default=5057)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Concurrent Connections Load Test")
+    print("====================================")
+    for async_mode in args.async_modes:
+        run(async_mode, args)
@@ -0,0 +1,106 @@
+"""
+Python: 3.7.9
+
+Benchmark of loading all symbols from the CSV files vs the memory-mapped columnar
+datasets (data/data_editor.py), cold (files dropped from the page cache with
+posix_fadvise DONTNEED) and warm. Every load runs in a fresh process.
+
+open : time until the data is usable (CSV parsed / columns memory-mapped)
+read : time until every value was read
+
+$ python -m benchmarks.data_load
+$ python -m benchmarks.data_load --intraday /tmp/stock-merge-data --columnar-dir /tmp/stock-columnar
+"""
+from argparse import ArgumentParser
+from os import O_RDONLY, close, listdir, open as os_open, path, posix_fadvise, walk
+from os import POSIX_FADV_DONTNEED
+import subprocess
+import sys
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from market_data import ColumnarDataset, is_columnar
+
+DATA_DIR = path.join(path.dirname(path.dirname(path.realpath(__file__))), "..", "data")
+sys.path.insert(0, DATA_DIR)
+from data_editor import historical_to_columnar, intraday_to_columnar  # noqa: E402
+
+
+FORMATS = ["csv", "columnar"]
+
+
+def drop_cache(dir_path: str) -> None:
+    for root, _, names in walk(dir_path):
+        for name in names:
+            fd = os_open(path.join(root, name), O_RDONLY)
+            try:
+                posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED)
+            finally:
+                close(fd)
+
+
+def load_csv(dir_path: str) -> tuple:
+    start = perf_counter()
+    frames = [
+        pd.read_csv(path.join(dir_path, name)) for name in sorted(listdir(dir_path))
+        if name.endswith(".csv")
+    ]
+    opened = perf_counter() - start
+    rows = sum(len(df) for df in frames)
+    # Parsing already read every value
+    return rows, opened, opened
+
+
+def load_columnar(dir_path: str) -> tuple:
+    start = perf_counter()
+    dataset = ColumnarDataset(dir_path)
+    opened = perf_counter() - start
+    for values in dataset.columns.values():
+        np.array(values)
+    return dataset.rows, opened, perf_counter() - start
+
+
+def run_load(fmt: str, dir_path: str) -> None:
+    rows, opened, read = (load_csv if fmt == "csv" else load_columnar)(dir_path)
+    print(f"{rows:>10,} rows | open {opened * 1e3:>9.2f} ms | read {read * 1e3:>9.2f} ms")
+
+
+def measure(name: str, fmt: str, dir_path: str) -> None:
+    for state in ["cold", "warm"]:
+        if state == "cold":
+            drop_cache(dir_path)
+        print(f"{name:<10} | {fmt:<8} | {state:<4} | ", end="", flush=True)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.data_load", "--run", fmt, dir_path], check=True
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="CSV vs columnar data load benchmark")
+    parser.add_argument("--intraday", default=path.join(DATA_DIR, "intraday-22-oct"))
+    parser.add_argument("--historical", default=path.join(DATA_DIR, "historical_data"))
+    parser.add_argument("--columnar-dir", default=path.join(DATA_DIR, "columnar"))
+    parser.add_argument("--run", nargs=2, metavar=("FORMAT", "DIR"), help="Load one dataset")
+    args = parser.parse_args()
+
+    if args.run:
+        run_load(*args.run)
+        sys.exit(0)
+
+    print("====================================")
+    print("CSV vs Columnar Load Benchmark")
+    print("====================================")
+    datasets = {
+        "intraday": (args.intraday, path.join(args.columnar_dir, path.basename(args.intraday))),
+        "historical": (args.historical, path.join(args.columnar_dir, "historical_data")),
+    }
+    for name, (csv_dir, columnar_dir) in datasets.items():
+        if not is_columnar(columnar_dir):
+            print(f"Converting {csv_dir} to {columnar_dir}...")
+            if name == "intraday":
+                intraday_to_columnar(csv_dir, columnar_dir)
+            else:
+                historical_to_columnar(csv_dir, columnar_dir)
+    for name, (csv_dir, columnar_dir) in datasets.items():
+        measure(name, "csv", csv_dir)
+        measure(name, "columnar", columnar_dir)
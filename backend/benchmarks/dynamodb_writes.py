@@ -0,0 +1,98 @@
+"""
+Python: 3.7.9
+
+Benchmark per-row PutItem writes against batched, parallel BatchWriteItem writes
+using the local DynamoDB stand-in.
+
+$ python -m benchmarks.dynamodb_writes --items 2000 --latency 0.005 --workers 4
+"""
+from argparse import ArgumentParser
+from csv import DictReader
+from itertools import cycle, islice
+from os import path
+from time import perf_counter
+from kinesis_api import DynamoDbAPI
+from local_aws import LocalDynamoDbClient
+
+
+CUR_DIR = path.realpath(path.dirname(__file__))
+BASE_DIR = path.dirname(path.dirname(CUR_DIR))
+CSV_FILE = path.join(BASE_DIR, "data", "intraday-22-oct-merged.csv")
+DYNAMO_DB_TABLE = "stock-stream-data"
+COLUMNS = ["minute", "symbol", "open", "high", "low", "close", "volume"]
+
+
+def load_rows(count: int) -> list:
+    """
+    Read `count` rows from the merged intraday CSV (repeated if needed).
+    Minute is suffixed with the repetition so every row has a unique key.
+    """
+    with open(CSV_FILE, newline="") as csv_file:
+        rows = [
+            {
+                "minute": row["minute"],
+                "symbol": row["symbol"],
+                "open": float(row["open"]),
+                "high": float(row["high"]),
+                "low": float(row["low"]),
+                "close": float(row["close"]),
+                "volume": int(row["volume"]),
+            }
+            for row in DictReader(csv_file)
+            if row["open"]
+        ]
+    result = []
+    for idx, row in enumerate(islice(cycle(rows), count)):
+        row = dict(row)
+        row["minute"] = f"{row['minute']}#{idx // len(rows)}"
+        result.append(row)
+    return result
+
+
+def run(rows: list, latency: float, workers: int, unprocessed_rate: float) -> None:
+    # Per-row PutItem
+    client = LocalDynamoDbClient([DYNAMO_DB_TABLE], latency=latency)
+    db_api = DynamoDbAPI(DYNAMO_DB_TABLE, client=client)
+    start = perf_counter()
+    for row in rows:
+        db_api.put(row)
+    elapsed = perf_counter() - start
+    print(
+        f"per-row  : {len(rows)} items in {elapsed:8.3f}s -> {len(rows) / elapsed:10.1f} items/sec"
+        f" | calls: {client.calls.get('put_item', 0)}"
+    )
+    db_api.close()
+
+    # Batched BatchWriteItem on a bounded thread pool
+    client = LocalDynamoDbClient(
+        [DYNAMO_DB_TABLE], latency=latency, unprocessed_rate=unprocessed_rate
+    )
+    db_api = DynamoDbAPI(DYNAMO_DB_TABLE, client=client, batch_workers=workers)
+    start = perf_counter()
+    result = db_api.put_batch(rows)
+    elapsed = perf_counter() - start
+    print(
+        f"batched  : {len(rows)} items in {elapsed:8.3f}s -> {len(rows) / elapsed:10.1f} items/sec"
+        f" | calls: {client.calls.get('batch_write_item', 0)}, retries: {result['retries']}"
+    )
+    assert len(client.tables[DYNAMO_DB_TABLE]) == len(rows), "Not all items were written"
+    db_api.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="DynamoDB per-row vs batched write benchmark")
+    parser.add_argument("--items", type=int, default=2000, help="Number of items to write")
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Simulated round trip per call (seconds)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Parallel batch writers")
+    parser.add_argument(
+        "--unprocessed-rate", type=float, default=0.05,
+        help="Fraction of batch items returned as UnprocessedItems"
+    )
+    args = parser.parse_args()
+
+    print("====================================")
+    print("DynamoDB Write Benchmark")
+    print("====================================")
+    run(load_rows(args.items), args.latency, args.workers, args.unprocessed_rate)
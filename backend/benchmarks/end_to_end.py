@@ -0,0 +1,278 @@
+"""
+Python: 3.7.9
+
+End-to-end benchmark of producer -> Kinesis -> consumer -> DynamoDB / server, in one
+process against the in-memory stand-ins of local_aws, injected as the shared clients
+(aws_clients.set_client) so every component is built exactly like in production:
+
+    producer : producer.simulate with GBM ticks for `--symbols`, `--rate` minutes/sec
+    consumer : consumer.build_pipeline (shard readers, parsers, DynamoDB writers)
+    server   : server.init_db + the tick channel subscriber, emitting to the rooms
+
+Reports the throughput of every stage, the latency of the batches from the producer
+to the socket emit (traces), the AWS call latencies and the peak memory, and writes
+them to a JSON file. --compare prints the change from a previous result file.
+
+$ python -m benchmarks.end_to_end --symbols 500 --rate 2 --minutes 60 --shards 2
+$ python -m benchmarks.end_to_end --compare benchmarks/results/end_to_end-<time>.json
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from json import dump, load
+from os import environ, getpid, makedirs, path
+from secrets import token_hex
+from subprocess import DEVNULL, check_output
+from time import perf_counter, sleep
+from local_aws import LocalDynamoDbClient, LocalKinesisClient
+from kinesis_api import DynamoDbAPI, KinesisAPI
+from shard_consumer import CheckpointStore
+from simulator import GBMGenerator
+from tick_channel import AUTHKEY_ENV, RUNTIME_DIR, LatencyStats, TickPublisher
+import aws_clients
+import consumer
+import metrics
+import producer
+import server
+
+try:
+    from resource import RUSAGE_SELF, getrusage
+except ImportError:
+    # Not available on Windows
+    getrusage = None
+
+
+RESULTS_DIR = path.join(path.dirname(path.realpath(__file__)), "results")
+# Seconds to wait for the consumer and the server to catch up once production ends
+DRAIN_TIMEOUT = 60.0
+
+
+def peak_rss_mb() -> float:
+    if getrusage is None:
+        return float("nan")
+    # Kilobytes on Linux
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit() -> str:
+    try:
+        return check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=path.dirname(RESULTS_DIR),
+            stderr=DEVNULL
+        ).decode("ascii").strip()
+    except Exception:
+        return ""
+
+
+def wait_until(condition, timeout: float) -> float:
+    """
+    Poll condition() until true, returns the seconds waited (inf on timeout)
+    """
+    started = perf_counter()
+    while not condition():
+        if perf_counter() - started > timeout:
+            return float("inf")
+        sleep(0.01)
+    return perf_counter() - started
+
+
+def wait_settled(value, target: float, timeout: float, settle: float = 1.0) -> float:
+    """
+    Poll value() until it reaches target or stops changing for `settle` seconds (messages
+    dropped on the way), returns the seconds until its last change
+    """
+    started = last_change = perf_counter()
+    last = value()
+    while last < target and perf_counter() - last_change < settle:
+        if perf_counter() - started > timeout:
+            break
+        sleep(0.01)
+        current = value()
+        if current != last:
+            last, last_change = current, perf_counter()
+    return last_change - started
+
+
+def operation_latencies() -> dict:
+    """
+    Calls and latency (ms, upper bound of the bucket) of every operation in the metrics
+    """
+    return {
+        operation: {
+            "calls": histogram.count,
+            "errors": metrics.OPERATION_ERRORS.labels(operation).value,
+            "p50_ms": histogram.quantile(0.5) * 1e3,
+            "p99_ms": histogram.quantile(0.99) * 1e3,
+        }
+        for (operation,), histogram in sorted(metrics.OPERATION_SECONDS.children.items())
+        if histogram.count
+    }
+
+
+def run(args) -> dict:
+    stream = LocalKinesisClient(
+        producer.KINESIS_STREAM_NAME, shard_count=args.shards,
+        latency=args.kinesis_latency, read_limit=5
+    )
+    db_client = LocalDynamoDbClient([consumer.DYNAMO_DB_TABLE], latency=args.db_latency)
+    aws_clients.set_client("kinesis", stream)
+    aws_clients.set_client("dynamodb", db_client)
+    address = path.join(RUNTIME_DIR, f"ticks-bench-{getpid()}.sock")
+    environ.setdefault(AUTHKEY_ENV, token_hex(16))
+
+    # Server: DynamoDB for the live cache, every batch of the tick channel traced
+    server.tick_latency = LatencyStats(size=10 ** 6)
+    server.init_db()
+    subscriber = server.start_tick_subscriber(address)
+
+    publisher = TickPublisher(address)
+    api = KinesisAPI(consumer.KINESIS_STREAM_NAME)
+    db_api = DynamoDbAPI(consumer.DYNAMO_DB_TABLE)
+    pipeline = consumer.build_pipeline(api, db_api, publisher, CheckpointStore())
+    pipeline.consumer.poll_interval = args.poll_interval
+    pipeline.start()
+    sleep(0.5)
+    memory_start = peak_rss_mb()
+
+    generator = GBMGenerator(symbols=args.symbols, minutes=args.minutes, seed=args.seed)
+    started = perf_counter()
+    with redirect_stdout(StringIO()):
+        producer.simulate(speed=args.rate * 60, synthetic=generator)
+    produced_in = perf_counter() - started
+    produced = int(metrics.rows("produced").value)
+
+    expected = {
+        shard_id: records[-1]["SequenceNumber"]
+        for shard_id, records in stream.records.items() if records
+    }
+    stored_wait = wait_until(
+        lambda: pipeline.consumer.checkpoint_store.all() == expected, DRAIN_TIMEOUT
+    )
+    stored_in = perf_counter() - started
+    emitted = metrics.rows("emitted")
+    emitted_wait = wait_settled(lambda: emitted.value, produced, DRAIN_TIMEOUT)
+    stats = pipeline.stats()
+    pipeline.stop()
+    pipeline.join()
+    subscriber.stop()
+    publisher.close()
+
+    stored = len(db_client.tables[consumer.DYNAMO_DB_TABLE])
+    return {
+        "rows": {
+            "produced": produced,
+            "consumed": int(metrics.rows("consumed").value),
+            "stored": stored,
+            "emitted": int(emitted.value),
+            "dropped_tick_messages": publisher.dropped,
+        },
+        "throughput": {
+            "target_rows_per_sec": args.symbols * args.rate,
+            "produced_rows_per_sec": produced / produced_in,
+            "stored_rows_per_sec": stored / stored_in,
+            # Time for the last rows to be stored / emitted after production ended
+            "store_drain_sec": stored_wait,
+            "emit_drain_sec": emitted_wait,
+        },
+        "latency_ms": server.tick_latency.summary(),
+        "operations": operation_latencies(),
+        "pipeline": {
+            stage: {
+                "utilization": stats[stage]["utilization"], "failed": stats[stage]["failed"]
+            }
+            for stage in ["parse", "sink"]
+        },
+        "memory_mb": {"start": memory_start, "peak": peak_rss_mb()},
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(current: dict, previous: dict) -> None:
+    print(f"\nChange from {previous.get('started')} ({previous.get('commit') or '?'}):")
+    before = flatten(previous.get("results", {}))
+    for key, value in flatten(current["results"]).items():
+        if key not in before or not before[key]:
+            continue
+        change = (value - before[key]) / abs(before[key]) * 100
+        print(f"  {key:<48} {before[key]:>12,.2f} -> {value:>12,.2f} ({change:+6.1f}%)")
+
+
+def report(result: dict) -> None:
+    results = result["results"]
+    rows = results["rows"]
+    throughput = results["throughput"]
+    print(
+        f"rows     : produced {rows['produced']:,} | stored {rows['stored']:,} "
+        f"| emitted {rows['emitted']:,} | dropped tick messages {rows['dropped_tick_messages']}"
+    )
+    print(
+        f"rows/sec : target {throughput['target_rows_per_sec']:,.0f} "
+        f"| produced {throughput['produced_rows_per_sec']:,.0f} "
+        f"| stored {throughput['stored_rows_per_sec']:,.0f}"
+    )
+    print(
+        f"drain    : stored {throughput['store_drain_sec']:.2f}s | emitted "
+        f"{throughput['emit_drain_sec']:.2f}s after the last minute was produced"
+    )
+    print("latency  :")
+    for stage, stats in results["latency_ms"].items():
+        print(f"  {stage:22s} p50 {stats['p50_ms']:9.2f} ms | p99 {stats['p99_ms']:9.2f} ms")
+    print("aws/emit :")
+    for operation, stats in results["operations"].items():
+        print(
+            f"  {operation:22s} {stats['calls']:>7,} calls | p50 <= {stats['p50_ms']:7.2f} ms "
+            f"| p99 <= {stats['p99_ms']:7.2f} ms"
+        )
+    memory = results["memory_mb"]
+    print(f"memory   : {memory['start']:.0f} MB at start, {memory['peak']:.0f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=2.0, help="Minutes of data per second")
+    parser.add_argument("--minutes", type=int, default=60, help="Minutes of data to produce")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="Consumer poll (s)")
+    parser.add_argument("--kinesis-latency", type=float, default=0.01)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--output", default=None, help="Result file (default: results/<time>)")
+    parser.add_argument("--compare", default=None, help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("End-to-End Pipeline Benchmark")
+    print("====================================")
+    started = datetime.now()
+    result = {
+        "benchmark": "end_to_end",
+        "started": started.isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in {"output", "compare"}
+        },
+        "results": run(args),
+    }
+    report(result)
+
+    output = args.output or path.join(
+        RESULTS_DIR, f"end_to_end-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    makedirs(path.dirname(path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        dump(result, file, indent=2, default=float)
+    print(f"\nResults: {output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(result, load(file))
@@ -0,0 +1,54 @@
+"""
+Python: 3.7.9
+
+Benchmark of the indicators (SMA, EMA, RSI, MACD, Bollinger) for thousands of symbols:
+incremental updates with one GBM minute batch of every symbol at a time, and the batch
+(backfill) mode over the same closes. Checks that both give the same values.
+
+$ python -m benchmarks.indicators --symbols 10000 --minutes 390
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+import numpy as np
+from indicators import VALUE_FIELDS, IndicatorEngine, compute
+from simulator import GBMGenerator
+
+
+def run(symbols: int, minutes: int) -> None:
+    batches = list(GBMGenerator(symbols=symbols, minutes=minutes, seed=1))
+    engine = IndicatorEngine()
+    start = perf_counter()
+    for batch in batches:
+        engine.update(batch)
+    incremental = perf_counter() - start
+
+    # Every batch has the symbols in the same order
+    closes = np.stack([batch["close"] for batch in batches], axis=1)
+    start = perf_counter()
+    result = compute(closes)
+    backfill = perf_counter() - start
+
+    rows = engine.rows_of(batches[0]["symbol"].tolist())
+    match = all(
+        np.allclose(engine.values[field][rows], result[field][:, -1], equal_nan=True)
+        for field in VALUE_FIELDS
+    )
+    ticks = symbols * minutes
+    print(
+        f"{symbols:>6} symbols x {minutes} minutes | incremental "
+        f"{incremental / minutes * 1e3:>6.2f} ms/minute ({ticks / incremental:>10,.0f} ticks/sec)"
+        f" | batch {backfill:>6.2f}s ({ticks / backfill:>10,.0f} ticks/sec) | match: {match}"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Indicators benchmark")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--minutes", type=int, default=390, help="Minute batches per run")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Indicators Benchmark")
+    print("====================================")
+    for symbols in args.symbols:
+        run(symbols, args.minutes)
@@ -0,0 +1,106 @@
+"""
+Python: 3.7.9
+
+Benchmark of GetRecords polling strategies of the shard consumer against the local
+Kinesis stand-in, which throttles shards above 5 reads per second like Kinesis.
+A producer writes bursts of records separated by idle periods:
+
+    tight    : no pause between reads (previous read_records loop)
+    fixed    : fixed 1s pause after every empty read
+    adaptive : polling.PollScheduler (back off when empty, catch up when behind,
+               token bucket of 5 reads/sec, jittered retries when throttled)
+
+Reports API calls (cost), empty and throttled reads, and the freshness of the records
+(arrival in the stream -> handler).
+
+$ python -m benchmarks.kinesis_polling --duration 20 --rate 200 --shards 2
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+from threading import Thread
+from time import perf_counter, sleep
+import numpy as np
+from kinesis_api import KinesisAPI
+from local_aws import LocalKinesisClient
+from shard_consumer import ShardConsumer
+
+
+KINESIS_STREAM_NAME = "stock-stream"
+# name -> ShardConsumer polling options
+STRATEGIES = {
+    "tight": {"poll_interval": 0.0, "max_poll_interval": 0.0, "reads_per_second": 1e6},
+    "fixed": {"poll_interval": 1.0, "max_poll_interval": 1.0, "reads_per_second": 1e6},
+    "adaptive": {"poll_interval": 0.2, "max_poll_interval": 5.0, "reads_per_second": 5.0},
+}
+
+
+def produce(client: LocalKinesisClient, duration: float, rate: int) -> None:
+    """
+    `rate` records/sec in 10 batches per second, bursts of 2s then 3s idle
+    """
+    start = perf_counter()
+    idx = 0
+    while perf_counter() - start < duration:
+        if (perf_counter() - start) % 5.0 < 2.0:
+            count = max(1, rate // 10)
+            client.put_records(StreamName=KINESIS_STREAM_NAME, Records=[
+                {"Data": f'{{"idx": {idx + offset}}}', "PartitionKey": f"SYM{idx + offset}"}
+                for offset in range(count)
+            ])
+            idx += count
+        sleep(0.1)
+
+
+def run(strategy: str, shards: int, duration: float, rate: int, latency: float) -> None:
+    client = LocalKinesisClient(
+        KINESIS_STREAM_NAME, shard_count=shards, latency=latency, read_limit=5
+    )
+    api = KinesisAPI(KINESIS_STREAM_NAME, client=client)
+    freshness = []
+
+    def handler(shard_id, records):
+        now = datetime.now()
+        freshness.extend(
+            (now - record["arrival_timestamp"]).total_seconds() for record in records
+        )
+
+    consumer = ShardConsumer(
+        api, handler, initial_position="LATEST", records_limit=1000, **STRATEGIES[strategy]
+    )
+    consumer.start()
+    producer = Thread(target=produce, args=(client, duration, rate))
+    producer.start()
+    producer.join()
+    # Let the consumer catch up with the last burst
+    sleep(2.0)
+    consumer.stop()
+    consumer.join()
+
+    stats = consumer.stats()
+    p50, p99 = np.percentile(np.asarray(freshness or [0.0]) * 1e3, [50, 99])
+    print(
+        f"{strategy:<8} | records: {stats['records']:>6,} | get_records: "
+        f"{stats['get_records']:>6,} ({stats['empty_reads']:>6,} empty, "
+        f"{stats['throttled']:>5,} throttled) | freshness p50 {p50:>6.0f} ms, "
+        f"p99 {p99:>6.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Kinesis polling strategy benchmark")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of production")
+    parser.add_argument("--rate", type=int, default=200, help="Records/sec during bursts")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Simulated round trip per call (seconds)"
+    )
+    parser.add_argument(
+        "--strategies", nargs="+", choices=list(STRATEGIES), default=list(STRATEGIES)
+    )
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Kinesis Polling Benchmark")
+    print("====================================")
+    for strategy in args.strategies:
+        run(strategy, args.shards, args.duration, args.rate, args.latency)
@@ -0,0 +1,83 @@
+"""
+Python: 3.7.9
+
+Benchmark the shard aware consumer against the local Kinesis stand-in.
+Throughput should grow roughly linearly with the shard count.
+
+$ python -m benchmarks.kinesis_shards --records 20000 --shards 1 2 4 8 --latency 0.01
+"""
+from argparse import ArgumentParser
+from threading import Event, Lock
+from time import perf_counter
+from kinesis_api import KinesisAPI
+from local_aws import LocalKinesisClient
+from shard_consumer import ShardConsumer, CheckpointStore
+
+
+KINESIS_STREAM_NAME = "stock-stream"
+
+
+def run(
+    shard_count: int, records: int, latency: float, records_limit: int, reads_per_second: float
+) -> float:
+    client = LocalKinesisClient(KINESIS_STREAM_NAME, shard_count=shard_count)
+    for idx in range(records):
+        client.put_record(
+            StreamName=KINESIS_STREAM_NAME, Data=f'{{"idx": {idx}}}', PartitionKey=f"SYM{idx}"
+        )
+    # Only reads pay the simulated round trip
+    client.latency = latency
+
+    api = KinesisAPI(KINESIS_STREAM_NAME, client=client)
+    done = Event()
+    lock = Lock()
+    consumed = [0]
+
+    def handler(shard_id, batch):
+        with lock:
+            consumed[0] += len(batch)
+            if consumed[0] >= records:
+                done.set()
+
+    store = CheckpointStore()
+    consumer = ShardConsumer(
+        api, handler, checkpoint_store=store, records_limit=records_limit, poll_interval=0.05,
+        reads_per_second=reads_per_second
+    )
+    start = perf_counter()
+    consumer.start()
+    done.wait()
+    elapsed = perf_counter() - start
+    consumer.stop()
+    consumer.join()
+
+    assert len(store.all()) == shard_count, "Every shard must be checkpointed"
+    rate = consumed[0] / elapsed
+    print(
+        f"shards: {shard_count:3d} | {consumed[0]} records in {elapsed:8.3f}s "
+        f"-> {rate:10.1f} records/sec | get_records calls: {client.calls.get('get_records', 0)}"
+    )
+    return rate
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Multi-shard Kinesis consumer benchmark")
+    parser.add_argument("--records", type=int, default=20000, help="Records in the stream")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Simulated GetRecords round trip (seconds)"
+    )
+    parser.add_argument("--limit", type=int, default=1000, help="Records per GetRecords call")
+    parser.add_argument(
+        "--reads-per-second", type=float, default=5.0, help="GetRecords calls per shard and second"
+    )
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Kinesis Multi-Shard Read Benchmark")
+    print("====================================")
+    base = None
+    for shard_count in args.shards:
+        rate = run(shard_count, args.records, args.latency, args.limit, args.reads_per_second)
+        base = base or rate
+        print(f"            speedup vs {args.shards[0]} shard(s): {rate / base:6.2f}x")
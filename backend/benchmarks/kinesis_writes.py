@@ -0,0 +1,82 @@
+"""
+Python: 3.7.9
+
+Benchmark per-record PutRecord writes against the buffered PutRecords writer
+using the local Kinesis stand-in.
+
+$ python -m benchmarks.kinesis_writes --records 5000 --latency 0.005 --failure-rate 0.02
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from kinesis_api import KinesisAPI
+from kinesis_writer import BufferedKinesisWriter
+from local_aws import LocalKinesisClient
+
+
+KINESIS_STREAM_NAME = "stock-stream"
+SYMBOLS = ["AAPL", "AMZN", "FB", "GOOGL", "INTC", "MSFT", "NFLX", "NVDA", "QCOM", "TSLA"]
+
+
+def make_records(count: int) -> list:
+    return [
+        (
+            {
+                "minute": {str(idx): f"{9 + idx // 60 % 7:02d}:{idx % 60:02d}"},
+                "symbol": {str(idx): SYMBOLS[idx % len(SYMBOLS)]},
+                "open": {str(idx): 117.42}, "high": {str(idx): 117.825},
+                "low": {str(idx): 117.4}, "close": {str(idx): 117.825},
+                "volume": {str(idx): 16300},
+            },
+            SYMBOLS[idx % len(SYMBOLS)]
+        )
+        for idx in range(count)
+    ]
+
+
+def report(name: str, count: int, elapsed: float, client: LocalKinesisClient) -> None:
+    stored = sum(len(records) for records in client.records.values())
+    print(
+        f"{name:10s}: {count} records in {elapsed:8.3f}s -> {count / elapsed:10.1f} records/sec"
+        f" | calls: {dict(client.calls)} | stored: {stored}"
+    )
+
+
+def run(records: list, shards: int, latency: float, failure_rate: float) -> None:
+    # One PutRecord call per record
+    client = LocalKinesisClient(KINESIS_STREAM_NAME, shard_count=shards, latency=latency)
+    api = KinesisAPI(KINESIS_STREAM_NAME, client=client)
+    start = perf_counter()
+    for data, partition_key in records:
+        api.write_record(data, partition_key)
+    report("put_record", len(records), perf_counter() - start, client)
+
+    # Buffered PutRecords, retrying only the failed entries
+    client = LocalKinesisClient(
+        KINESIS_STREAM_NAME, shard_count=shards, latency=latency, failure_rate=failure_rate
+    )
+    api = KinesisAPI(KINESIS_STREAM_NAME, client=client)
+    start = perf_counter()
+    with BufferedKinesisWriter(api, linger=0.05) as writer:
+        for data, partition_key in records:
+            writer.put(data, partition_key)
+    report("buffered", len(records), perf_counter() - start, client)
+    print(f"            writer stats: {writer.stats}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Kinesis PutRecord vs buffered PutRecords benchmark")
+    parser.add_argument("--records", type=int, default=5000, help="Number of records to write")
+    parser.add_argument("--shards", type=int, default=4, help="Shards in the local stream")
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="Simulated round trip per call (seconds)"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.02,
+        help="Fraction of PutRecords entries failed by the stand-in"
+    )
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Kinesis Producer Write Benchmark")
+    print("====================================")
+    run(make_records(args.records), args.shards, args.latency, args.failure_rate)
@@ -0,0 +1,231 @@
+"""
+Python: 3.7.9
+
+Benchmark of the live feed protocols (live_feed.py) with hundreds of dashboards: runs
+the server in-process, its store warmed with --start-minutes minutes of GBM ticks, opens
+the Socket.IO clients in a child process and feeds one minute of every symbol to the
+server every 1 / --rate seconds, like the tick channel.
+
+    full          : get_live_data "AAPL", one graph_update per minute and symbol
+    delta         : graph_delta coalesced over --window seconds, JSON
+    delta-msgpack : same, msgpack encoded (binary packets)
+
+Reports the bytes and packets the server sent per second (Socket.IO packets, without the
+transport framing) and the server CPU seconds per second, for the snapshots and the
+updates. The clients check the sequence numbers of the deltas ("gaps" also counts the
+deltas the Python client handled out of order: it runs every message on its own thread).
+
+Needs the Socket.IO client: pip install "python-socketio[client]" (and msgpack)
+
+$ python -m benchmarks.live_feed --clients 500 --symbols 10 --duration 20 --rate 4
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import logging
+import multiprocessing
+from multiprocessing import Process, Queue
+from threading import Event, Thread
+from time import perf_counter, process_time, sleep
+from kinesis_api import DynamoDbAPI
+from live_feed import msgpack
+from local_aws import LocalDynamoDbClient
+from simulator import GBMGenerator
+import server
+import wire_format
+
+try:
+    import socketio
+except ImportError:
+    raise SystemExit('! Socket.IO client is required: pip install "python-socketio[client]" !')
+
+
+METHODS = ["full", "delta", "delta-msgpack"]
+
+
+def serve(port: int) -> None:
+    try:
+        server.socketio.run(server.app, port=port, allow_unsafe_werkzeug=True)
+    except TypeError:
+        # Flask-SocketIO < 5 does not know allow_unsafe_werkzeug
+        server.socketio.run(server.app, port=port)
+
+
+def subscription(method: str, symbol: str, window: float):
+    if method == "full":
+        return symbol
+    fmt = "msgpack" if method == "delta-msgpack" else "json"
+    return {"symbol": symbol, "mode": "delta", "window": window, "format": fmt}
+
+
+def run_clients(method, args, symbols, ready, stop, results) -> None:
+    """
+    Child process: connect the clients, subscribe them and count what they receive
+    """
+    namespace = server.SOCKETIO_NAMESPACE
+    totals = {"points": 0, "events": 0, "gaps": 0}
+    clients = []
+
+    def make_client(symbol):
+        client = socketio.Client(reconnection=False)
+        state = {"seq": 0, "snapshot": False}
+
+        def on_data(resp):
+            state["seq"] = resp.get("seq", len(resp["labels"]))
+            state["snapshot"] = True
+
+        def on_update(resp):
+            totals["events"] += 1
+            totals["points"] += len(resp["labels"])
+
+        def on_delta(resp):
+            if isinstance(resp, bytes):
+                resp = msgpack.unpackb(resp, raw=False)
+            totals["events"] += 1
+            if resp["seq"] > state["seq"]:
+                totals["gaps"] += 1
+            new = resp["seq"] + len(resp["labels"]) - state["seq"]
+            if new > 0:
+                totals["points"] += new
+                state["seq"] += new
+
+        client.on("graph_data", on_data, namespace=namespace)
+        client.on("graph_update", on_update, namespace=namespace)
+        client.on("graph_delta", on_delta, namespace=namespace)
+        client.connect(f"http://127.0.0.1:{args.port}", namespaces=[namespace])
+        client.emit("get_live_data", subscription(method, symbol, args.window), namespace)
+        return client, state
+
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        for idx in range(args.clients):
+            try:
+                clients.append(make_client(symbols[idx % len(symbols)]))
+            except Exception:
+                pass
+        deadline = perf_counter() + 30.0
+        while perf_counter() < deadline and not all(state["snapshot"] for _, state in clients):
+            sleep(0.05)
+        ready.set()
+        stop.wait()
+        results.put({"connected": len(clients), **totals})
+        closers = [Thread(target=client.disconnect, daemon=True) for client, _ in clients]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join(5.0)
+
+
+class SendCounter:
+    """
+    Wraps the engine.io sends of the server to count the packets and bytes sent
+    (send_packet: emits to rooms in python-socketio 5, send: everything else)
+    """
+
+    def __init__(self, eio):
+        self.packets = 0
+        self.bytes = 0
+        self.__send = eio.send
+        eio.send = self.send
+        self.__send_packet = getattr(eio, "send_packet", None)
+        if self.__send_packet is not None:
+            eio.send_packet = self.send_packet
+
+    def send(self, sid, data, *args, **kwargs):
+        self.packets += 1
+        self.bytes += len(data)
+        return self.__send(sid, data, *args, **kwargs)
+
+    def send_packet(self, sid, pkt):
+        self.packets += 1
+        self.bytes += len(pkt.data) if pkt.data is not None else 0
+        return self.__send_packet(sid, pkt)
+
+    def read(self) -> tuple:
+        return self.packets, self.bytes, process_time()
+
+
+def feed(generator, rate: float, stop) -> None:
+    """
+    Stand-in for the tick channel: one minute of every symbol every 1 / rate seconds
+    """
+    for batch in generator:
+        if stop.wait(1.0 / rate):
+            return
+        server.on_tick_batch({"batch": wire_format.encode_records(batch)})
+
+
+def run(method: str, args, symbols: list, counter: SendCounter, generator) -> str:
+    ready, stop, results = multiprocessing.Event(), multiprocessing.Event(), Queue()
+    before = counter.read()
+    started = perf_counter()
+    clients = Process(target=run_clients, args=(method, args, symbols, ready, stop, results))
+    clients.start()
+    ready.wait(60.0)
+    subscribed = perf_counter() - started
+    snapshots = counter.read()
+
+    stop_feed = Event()
+    feeder = Thread(target=feed, args=(generator, args.rate, stop_feed), daemon=True)
+    feeder.start()
+    sleep(args.duration)
+    stop_feed.set()
+    feeder.join()
+    # Let the last windows be sent
+    sleep(args.window + 0.5)
+    updates = counter.read()
+    stop.set()
+    received = results.get(timeout=60.0)
+    clients.join(60.0)
+
+    packets = updates[0] - snapshots[0]
+    sent = updates[1] - snapshots[1]
+    cpu = updates[2] - snapshots[2]
+    elapsed = args.duration + args.window + 0.5
+    return (
+        f"{method:<13} | {received['connected']} clients | snapshots "
+        f"{(snapshots[1] - before[1]) / 1e6:6.2f} MB in {subscribed:5.2f}s "
+        f"| updates {sent / elapsed / 1e3:8.1f} KB/s, {packets / elapsed:7.0f} packets/s, "
+        f"{sent / max(1, received['points']):5.1f} B/point "
+        f"| server CPU {cpu / elapsed:5.2f} s/s | points {received['points']:,} "
+        f"in {received['events']:,} events, gaps {received['gaps']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Live feed protocol benchmark")
+    parser.add_argument("--clients", type=int, default=500, help="Simulated dashboards")
+    parser.add_argument("--symbols", type=int, default=10, help="Symbols spread over clients")
+    parser.add_argument("--start-minutes", type=int, default=300, help="Minutes in the store")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of updates")
+    parser.add_argument("--rate", type=float, default=4.0, help="Minutes fed per second")
+    parser.add_argument("--window", type=float, default=0.5, help="Delta coalescing window")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    args = parser.parse_args()
+    if msgpack is None and "delta-msgpack" in args.methods:
+        args.methods.remove("delta-msgpack")
+        print("! msgpack is not installed, skipping delta-msgpack !")
+
+    print("====================================")
+    print("Live Feed Protocol Benchmark")
+    print("====================================")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # Minutes of the day for the warm start and every method
+    minutes = args.start_minutes + int(args.rate * (args.duration + 5) * len(args.methods))
+    generator = iter(GBMGenerator(symbols=args.symbols, minutes=minutes, seed=9))
+    symbols = [symbol.decode("ascii") for symbol in next(generator)["symbol"].tolist()]
+    for _ in range(args.start_minutes - 1):
+        server.tick_store.append(next(generator))
+    server.init_db(DynamoDbAPI("stock-stream-data", client=LocalDynamoDbClient(
+        ["stock-stream-data"]
+    )))
+    server.app.config["DEBUG"] = False
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        Thread(target=serve, args=(args.port,), daemon=True).start()
+        sleep(1.0)
+    counter = SendCounter(server.socketio.server.eio)
+    for method in args.methods:
+        # Keep the server's prints out of the report
+        with redirect_stdout(StringIO()):
+            line = run(method, args, symbols, counter, generator)
+        print(line)
@@ -0,0 +1,125 @@
+"""
+Python: 3.7.9
+
+Benchmark of merging per-symbol intraday files minute by minute: the previous
+read-everything + concat + sort_values vs the streaming k-way heap merge
+(market_data.merge_ticks). Every method runs in its own process so peak RSS is its own.
+
+Generates a synthetic dataset (default 500 symbols x 52 days x 390 minutes ~ 10M rows)
+in --data-dir, again when --symbols or --days differ from the dataset found there.
+
+$ python -m benchmarks.market_merge --symbols 500 --days 52 --data-dir /tmp/stock-merge-data
+"""
+from argparse import ArgumentParser
+from glob import glob
+from json import dump, load
+from os import makedirs, path, remove
+from resource import RUSAGE_SELF, getrusage
+import subprocess
+import sys
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from market_data import CHUNK_ROWS, merge_ticks, records_to_frame
+from simulator import GBMGenerator
+
+
+METHODS = ["concat_sort", "heap_merge"]
+# Parameters of the generated dataset, in the data directory
+DATASET_FILE = "dataset.json"
+
+
+def data_files(data_dir: str) -> list:
+    return sorted(glob(path.join(data_dir, "*.csv")))
+
+
+def dataset_matches(data_dir: str, symbols: int, days: int) -> bool:
+    dataset_file = path.join(data_dir, DATASET_FILE)
+    if not path.isfile(dataset_file) or not data_files(data_dir):
+        return False
+    with open(dataset_file) as json_file:
+        return load(json_file) == {"symbols": symbols, "days": days}
+
+
+def generate(data_dir: str, symbols: int, days: int) -> None:
+    """
+    One CSV file per symbol, sorted by date and minute
+    """
+    makedirs(data_dir, exist_ok=True)
+    for file_path in data_files(data_dir):
+        remove(file_path)
+    generator = GBMGenerator(symbols=symbols, days=days, seed=7)
+    print(f"Generating {generator} in {data_dir}...")
+    start = perf_counter()
+    minutes = []
+    written = set()
+    for batch in generator:
+        minutes.append(batch)
+        if len(minutes) < generator.minutes:
+            continue
+        # One day at a time, appended to every symbol's file
+        df = records_to_frame(np.concatenate(minutes))
+        minutes = []
+        for symbol, rows in df.groupby("symbol", sort=False):
+            file_path = path.join(data_dir, f"{symbol}.csv")
+            rows.to_csv(file_path, index=False, mode="a", header=symbol not in written)
+            written.add(symbol)
+    with open(path.join(data_dir, DATASET_FILE), "w") as json_file:
+        dump({"symbols": symbols, "days": days}, json_file)
+    print(f"Generated in {perf_counter() - start:.1f}s\n")
+
+
+def concat_sort(files: list) -> int:
+    """
+    Previous data_editor.merge_stocks: every file in memory, one global sort
+    """
+    merged = pd.concat([pd.read_csv(file_path) for file_path in files])
+    merged = merged.sort_values(["date", "minute", "symbol"])
+    return len(merged)
+
+
+def heap_merge(files: list, chunk_rows: int = CHUNK_ROWS) -> int:
+    rows = 0
+    for batch in merge_ticks(files, chunk_rows):
+        rows += len(batch)
+    return rows
+
+
+def run_method(method: str, data_dir: str, chunk_rows: int) -> None:
+    files = data_files(data_dir)
+    start = perf_counter()
+    rows = concat_sort(files) if method == "concat_sort" else heap_merge(files, chunk_rows)
+    elapsed = perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak_mb = getrusage(RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{method:<12} | rows: {rows:>11,} | {elapsed:>7.2f}s | "
+        f"{rows / elapsed:>12,.0f} rows/sec | peak RSS: {peak_mb:>8.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Intraday file merge benchmark")
+    parser.add_argument("--symbols", type=int, default=500, help="Synthetic symbols (files)")
+    parser.add_argument("--days", type=int, default=52, help="Synthetic days of 390 minutes")
+    parser.add_argument("--data-dir", default="/tmp/stock-merge-data")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Heap merge chunk")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    parser.add_argument("--run", choices=METHODS, help="Run one method (in this process)")
+    args = parser.parse_args()
+
+    if args.run:
+        run_method(args.run, args.data_dir, args.chunk_rows)
+        sys.exit(0)
+
+    print("====================================")
+    print("Intraday Files Merge Benchmark")
+    print("====================================")
+    if not dataset_matches(args.data_dir, args.symbols, args.days):
+        generate(args.data_dir, args.symbols, args.days)
+    for method in args.methods:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.market_merge", "--run", method,
+             "--data-dir", args.data_dir, "--chunk-rows", str(args.chunk_rows)],
+            check=True
+        )
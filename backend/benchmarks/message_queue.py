@@ -0,0 +1,238 @@
+"""
+Python: 3.7.9
+
+Load test of several server processes sharing a Socket.IO message queue (serve.py
+--workers): starts --workers servers against the local DynamoDB stand-in and the local
+Redis stand-in (local_redis.py), feeds them one minute of --symbols symbols every
+1 / --rate seconds on the tick channel and connects --clients delta mode clients to every
+worker.
+
+With the queue (setup "queue") the first worker is the broadcaster: the graph_delta the
+clients of the other workers get were emitted by it, through the queue. Without it
+(setup "local") every worker sends the ticks to its own clients. Per worker, reports the
+clients that got deltas, the deltas, the gaps and duplicates against their series (seq)
+and the delivery lag (client receive time - server send time) over --hold seconds. Fails
+when a client of a worker gets no delta or a gap.
+
+Needs the asyncio Socket.IO client and the Redis client:
+pip install "python-socketio[asyncio_client]" redis
+
+$ python -m benchmarks.message_queue --workers 2 --clients 200 --symbols 10 --hold 20
+"""
+from argparse import ArgumentParser
+import asyncio
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import logging
+import multiprocessing
+from os import environ, path, remove
+from secrets import token_hex
+import sys
+from threading import Event, Thread
+from time import sleep, time
+from benchmarks.connections import NAMESPACE, feed, percentile
+import serve
+
+
+SETUPS = ["queue", "local"]
+
+
+def run_server(
+    async_mode: str, port: int, tick_address: str, message_queue: str, broadcaster: bool
+) -> None:
+    """
+    Child process: one worker, configured like serve.py does before importing the server
+    """
+    if message_queue:
+        environ["SOCKETIO_MESSAGE_QUEUE"] = message_queue
+    environ["SERVER_BROADCASTER"] = "1" if broadcaster else "0"
+    serve.patch(async_mode)
+    from kinesis_api import DynamoDbAPI
+    from local_aws import LocalDynamoDbClient
+    import server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server.TICK_CHANNEL_ADDRESS = tick_address
+    db_api = DynamoDbAPI("stock-stream-data", client=LocalDynamoDbClient(["stock-stream-data"]))
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        server.start("127.0.0.1", port, db_api)
+
+
+def run_clients(ports: list, clients: int, symbols: list, window: float, hold: float) -> list:
+    """
+    Connect that many delta mode clients to every port, hold them for hold seconds and
+    return (port, deltas, gaps, duplicates, lags) per client
+    """
+    import socketio
+
+    async def client_task(port: int, symbol: str, ready: asyncio.Event, started: list):
+        client = socketio.AsyncClient(reconnection=False)
+        snapshot = asyncio.Event()
+        # Points of the client's series, deltas, gaps, duplicates and lags once measured
+        state = {"date": None, "points": 0, "deltas": 0, "gaps": 0, "duplicates": 0}
+        lags = []
+
+        async def on_data(resp):
+            state["date"] = resp["date"]
+            state["points"] = resp["seq"]
+            snapshot.set()
+
+        async def on_delta(resp):
+            if not snapshot.is_set():
+                return
+            seq = resp["seq"]
+            if resp["date"] != state["date"] or seq > state["points"]:
+                state["gaps"] += 1
+            elif seq + len(resp["labels"]) <= state["points"]:
+                state["duplicates"] += 1
+            state["date"] = resp["date"]
+            state["points"] = max(state["points"], seq + len(resp["labels"]))
+            if started:
+                state["deltas"] += 1
+                lags.append(time() - resp["sent_at"])
+
+        client.on("graph_data", on_data, namespace=NAMESPACE)
+        client.on("graph_delta", on_delta, namespace=NAMESPACE)
+        try:
+            await client.connect(
+                f"http://127.0.0.1:{port}", namespaces=[NAMESPACE], transports=["websocket"],
+                wait_timeout=30
+            )
+            await client.emit(
+                "get_live_data", {"symbol": symbol, "mode": "delta", "window": window},
+                namespace=NAMESPACE
+            )
+            await asyncio.wait_for(snapshot.wait(), 30.0)
+        except Exception:
+            pass
+        ready.set()
+        # Gaps are counted from the start of the measure, after every client subscribed
+        while not started:
+            await asyncio.sleep(0.1)
+        state["gaps"] = state["duplicates"] = 0
+        await asyncio.sleep(hold)
+        if client.connected:
+            await client.disconnect()
+        return port, state["deltas"], state["gaps"], state["duplicates"], lags
+
+    async def main() -> list:
+        started = []
+        readies = []
+        tasks = []
+        for port in ports:
+            for idx in range(clients):
+                ready = asyncio.Event()
+                readies.append(ready)
+                tasks.append(asyncio.ensure_future(
+                    client_task(port, symbols[idx % len(symbols)], ready, started)
+                ))
+                # Dashboards opened over a few seconds
+                if idx % 50 == 49:
+                    await asyncio.sleep(0.1)
+        for ready in readies:
+            await ready.wait()
+        # Let the broadcaster get the rooms announced by the other workers
+        await asyncio.sleep(2.0)
+        started.append(True)
+        return await asyncio.gather(*tasks)
+
+    return asyncio.get_event_loop().run_until_complete(main())
+
+
+def report(setup: str, ports: list, results: list) -> bool:
+    """
+    Print the results per worker, returns False when a client missed deltas
+    """
+    passed = True
+    for idx, port in enumerate(ports):
+        rows = [result for result in results if result[0] == port]
+        deltas = [result[1] for result in rows]
+        gaps = sum(result[2] for result in rows)
+        duplicates = sum(result[3] for result in rows)
+        lags = [lag for result in rows for lag in result[4]]
+        served = sum(1 for count in deltas if count)
+        role = "broadcaster" if setup == "queue" and idx == 0 else "worker"
+        print(
+            f"{setup:<5} | {role:<11} :{port} | {served:>4}/{len(rows)} clients with deltas "
+            f"| {sum(deltas):>7,} deltas | gaps {gaps:>3} | duplicates {duplicates:>3} "
+            f"| lag p50 {percentile(lags, 50) * 1e3:6.1f} ms, "
+            f"p99 {percentile(lags, 99) * 1e3:6.1f} ms"
+        )
+        passed = passed and served == len(rows) and not gaps
+    return passed
+
+
+def run(setup: str, args) -> bool:
+    from local_redis import LocalRedisServer
+    from simulator import GBMGenerator
+    from tick_channel import AUTHKEY_ENV, RUNTIME_DIR, TickPublisher
+
+    spawn = multiprocessing.get_context("spawn")
+    tick_address = path.join(RUNTIME_DIR, f"ticks-queue-{args.port}.sock")
+    # Inherited by the spawned servers
+    environ.setdefault(AUTHKEY_ENV, token_hex(16))
+    redis_server = LocalRedisServer(port=args.redis_port).start() if setup == "queue" else None
+    message_queue = redis_server.url if redis_server else None
+    publisher = TickPublisher(tick_address)
+    generator = iter(GBMGenerator(symbols=args.symbols, minutes=390, days=30, seed=3))
+    symbols = [symbol.decode("ascii") for symbol in next(generator)["symbol"].tolist()]
+    stop = Event()
+    Thread(target=feed, args=(publisher, generator, args.rate, stop), daemon=True).start()
+
+    ports = [args.port + idx for idx in range(args.workers)]
+    servers = [
+        spawn.Process(
+            target=run_server,
+            args=(args.async_mode, port, tick_address, message_queue, idx == 0 or not redis_server)
+        )
+        for idx, port in enumerate(ports)
+    ]
+    for server_process in servers:
+        server_process.start()
+    # Server start up (historical data, indicators backfill) and first ticks
+    sleep(args.startup)
+    try:
+        results = run_clients(ports, args.clients, symbols, args.window, args.hold)
+        passed = report(setup, ports, results)
+        if redis_server:
+            print(
+                f"{setup:<5} | message queue: {redis_server.published:,} messages published, "
+                f"{redis_server.delivered:,} delivered"
+            )
+        return passed
+    finally:
+        for server_process in servers:
+            server_process.terminate()
+            server_process.join()
+        stop.set()
+        publisher.close()
+        if redis_server:
+            redis_server.shutdown()
+            redis_server.server_close()
+        if path.exists(tick_address):
+            remove(tick_address)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Message queue load test of several server workers")
+    parser.add_argument("--setups", nargs="+", choices=SETUPS, default=SETUPS)
+    parser.add_argument("--async-mode", choices=serve.ASYNC_MODES,
+                        default=serve.default_async_mode())
+    parser.add_argument("--workers", type=int, default=2, help="Server processes")
+    parser.add_argument("--clients", type=int, default=200, help="Clients per worker")
+    parser.add_argument("--hold", type=float, default=20.0, help="Seconds measured")
+    parser.add_argument("--symbols", type=int, default=10, help="Symbols spread over clients")
+    parser.add_argument("--rate", type=float, default=1.0, help="Minutes fed per second")
+    parser.add_argument("--window", type=float, default=0.5, help="Delta coalescing window")
+    parser.add_argument("--startup", type=float, default=5.0, help="Seconds to start the servers")
+    parser.add_argument("--port", type=int, default=5067, help="Port of the first worker")
+    parser.add_argument("--redis-port", type=int, default=6389)
+    args = parser.parse_args()
+    if args.workers < 2:
+        parser.error("--workers must be at least 2")
+
+    print("====================================")
+    print("Message Queue Load Test")
+    print("====================================")
+    results = [run(setup, args) for setup in args.setups]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,73 @@
+"""
+Python: 3.7.9
+
+Compare the previous dict based parse_record with the columnar consumer.parse_record
+on JSON and binary batches of 10, 100 and 10,000 rows.
+
+$ python -m benchmarks.parse_record --rows 10 100 10000 --repeat 20
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from os import path
+from time import perf_counter
+import pandas as pd
+from consumer import parse_record
+import wire_format
+
+
+CUR_DIR = path.realpath(path.dirname(__file__))
+BASE_DIR = path.dirname(path.dirname(CUR_DIR))
+CSV_FILE = path.join(BASE_DIR, "data", "intraday-22-oct-merged.csv")
+
+
+def legacy_parse_record(data):
+    """
+    parse_record before the columnar rewrite (only correct for batches of 10 rows)
+    """
+    required_keys = ["minute", "symbol", "open",
+                     "high", "low", "close", "volume"]
+    parsed_data = {key: data[key] for key in required_keys}
+    arrayed = []
+    for _ in range(10):
+        arrayed.append({key: '0' for key in required_keys})
+    for key, value in parsed_data.items():
+        for subkey in sorted(value):
+            arrayed[int(subkey) % 10][key] = value[subkey]
+    return arrayed
+
+
+def timeit(func, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - start) / repeat
+
+
+def run(df: pd.DataFrame, rows: int, repeat: int) -> None:
+    batch = pd.concat([df] * (rows // len(df) + 1), ignore_index=True).head(rows)
+    json_data = loads(dumps(batch.to_dict()))
+    binary_data = wire_format.decode(wire_format.encode_frame(batch))
+
+    parsed = parse_record(json_data)
+    assert len(parsed) == rows, "Every row must be parsed"
+
+    for name, func in (
+        ("legacy (json)", lambda: legacy_parse_record(json_data)),
+        ("columnar (json)", lambda: parse_record(json_data)),
+        ("columnar (binary)", lambda: parse_record(binary_data)),
+    ):
+        print(f"rows: {rows:6d} | {name:18s} | {timeit(func, repeat) * 1e6:12.1f} us")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="parse_record micro-benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=20, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("parse_record Benchmark")
+    print("====================================")
+    data = pd.read_csv(CSV_FILE)
+    for count in args.rows:
+        run(data, count, args.repeat)
@@ -0,0 +1,140 @@
+"""
+Python: 3.7.9
+
+Benchmark of the consumer with a slow DynamoDB (local stand-ins): every shard read
+parsed and written before the next read (as consumer.handle_records) vs the staged
+pipeline (pipeline.Pipeline: fetch -> parse pool -> sink pool, bounded queues).
+Both must store every row and checkpoint every shard at its last record, with the
+same number of parallel DynamoDB writes. Reports when every row was parsed (pushed
+to the server) and when every row was stored.
+
+$ python -m benchmarks.pipeline --symbols 200 --minutes 390 --shards 2 --db-latency 0.02
+"""
+from argparse import ArgumentParser
+from time import perf_counter, sleep
+from kinesis_api import DynamoDbAPI, KinesisAPI
+from local_aws import LocalDynamoDbClient, LocalKinesisClient
+from pipeline import Pipeline
+from shard_consumer import CheckpointStore, ShardConsumer
+from simulator import GBMGenerator
+import consumer
+import wire_format
+
+
+DYNAMO_DB_TABLE = "stock-stream-data"
+KINESIS_STREAM_NAME = "stock-stream"
+METHODS = ["sequential", "pipeline"]
+
+
+def fill_stream(stream: LocalKinesisClient, symbols: int, minutes: int, per_record: int) -> int:
+    """
+    One binary record per `per_record` symbols of every minute, returns the row count
+    """
+    rows = 0
+    for batch in GBMGenerator(symbols=symbols, minutes=minutes, seed=5):
+        records = [
+            {
+                "Data": wire_format.encode_records(batch[idx:idx + per_record]),
+                "PartitionKey": batch["symbol"][idx].decode("ascii")
+            }
+            for idx in range(0, len(batch), per_record)
+        ]
+        stream.put_records(StreamName=KINESIS_STREAM_NAME, Records=records)
+        rows += len(batch)
+    return rows
+
+
+def last_sequence_numbers(stream: LocalKinesisClient) -> dict:
+    return {
+        shard_id: records[-1]["SequenceNumber"]
+        for shard_id, records in stream.records.items() if records
+    }
+
+
+def run(method: str, args) -> None:
+    stream = LocalKinesisClient(KINESIS_STREAM_NAME, shard_count=args.shards)
+    rows = fill_stream(stream, args.symbols, args.minutes, args.per_record)
+    stream.latency = args.kinesis_latency
+    stream.read_limit = 5
+    db_client = LocalDynamoDbClient([DYNAMO_DB_TABLE], latency=args.db_latency)
+    db_api = DynamoDbAPI(DYNAMO_DB_TABLE, client=db_client, batch_workers=args.db_workers)
+    store = CheckpointStore()
+    parsed = [0, 0.0]
+
+    def parse(records):
+        batch = consumer.process_records(None, records)
+        parsed[0] += len(batch)
+        if parsed[0] == rows:
+            parsed[1] = perf_counter()
+        return batch
+
+    reader = ShardConsumer(
+        KinesisAPI(KINESIS_STREAM_NAME, client=stream), handler=None,
+        checkpoint_store=store, records_limit=args.records_limit
+    )
+    if method == "sequential":
+        def handler(shard_id, records):
+            consumer.insert_db(db_api, parse(records))
+            store.put(shard_id, records[-1]["sequence_number"])
+
+        reader.handler = handler
+        reader.auto_checkpoint = False
+        runner = reader
+    else:
+        runner = Pipeline(
+            reader,
+            parse=parse,
+            sink=lambda batch: consumer.insert_db(db_api, batch),
+            parsers=args.parsers,
+            sinks=args.sinks
+        )
+
+    expected = last_sequence_numbers(stream)
+    start = perf_counter()
+    runner.start()
+    while store.all() != expected:
+        sleep(0.01)
+    elapsed = perf_counter() - start
+    runner.stop()
+    runner.join()
+
+    stored = len(db_client.tables[DYNAMO_DB_TABLE])
+    assert stored == rows, f"Stored {stored} of {rows} rows"
+    print(
+        f"{method:<10} | {rows:>7,} rows | parsed in {parsed[1] - start:>6.2f}s "
+        f"| stored in {elapsed:>6.2f}s -> {rows / elapsed:>7,.0f} rows/sec "
+        f"| get_records: {stream.calls.get('get_records', 0):>4}"
+    )
+    if method == "pipeline":
+        stats = runner.stats()
+        print(
+            f"{'':>10} | fetch blocked {stats['fetch']['blocked'] * 100:>5.0f}% "
+            f"| parse busy {stats['parse']['utilization'] * 100:>5.1f}% "
+            f"| sink busy {stats['sink']['utilization'] * 100:>5.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Consumer pipeline benchmark")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--minutes", type=int, default=390)
+    parser.add_argument("--per-record", type=int, default=50, help="Symbols per Kinesis record")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--records-limit", type=int, default=100, help="Records per GetRecords")
+    parser.add_argument(
+        "--kinesis-latency", type=float, default=0.01, help="Simulated GetRecords round trip"
+    )
+    parser.add_argument(
+        "--db-latency", type=float, default=0.02, help="Simulated BatchWriteItem round trip"
+    )
+    parser.add_argument("--parsers", type=int, default=2)
+    parser.add_argument("--sinks", type=int, default=4)
+    parser.add_argument("--db-workers", type=int, default=8, help="Parallel BatchWriteItem calls")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Consumer Pipeline Benchmark")
+    print("====================================")
+    for method in args.methods:
+        run(method, args)
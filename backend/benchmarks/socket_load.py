@@ -0,0 +1,145 @@
+"""
+Python: 3.7.9
+
+Load test of the live feed: runs the server in-process against the local DynamoDB
+stand-in, opens hundreds of Socket.IO clients and reports the emit latency of the
+graph_update broadcasts and the DynamoDB calls per minute.
+
+Needs the Socket.IO client: pip install "python-socketio[client]"
+
+$ python -m benchmarks.socket_load --clients 300 --symbols 10 --duration 30
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+import logging
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep, time
+from kinesis_api import DynamoDbAPI
+from local_aws import LocalDynamoDbClient
+import server
+
+try:
+    import socketio
+except ImportError:
+    raise SystemExit('! Socket.IO client is required: pip install "python-socketio[client]" !')
+
+
+SYMBOLS = ["AAPL", "AMZN", "FB", "GOOGL", "INTC", "MSFT", "NFLX", "NVDA", "QCOM", "TSLA"]
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def serve(port: int) -> None:
+    try:
+        server.socketio.run(server.app, port=port, allow_unsafe_werkzeug=True)
+    except TypeError:
+        # Flask-SocketIO < 5 does not know allow_unsafe_werkzeug
+        server.socketio.run(server.app, port=port)
+
+
+def feed(db_api: DynamoDbAPI, symbols: list, interval: float, stop: Event) -> None:
+    """
+    Stand-in for the consumer: one new minute per symbol every `interval` seconds
+    """
+    minute = 9 * 60 + 30
+    while not stop.wait(interval):
+        db_api.put_batch([
+            {"symbol": symbol, "minute": f"{minute // 60:02d}:{minute % 60:02d}", "open": 100.0}
+            for symbol in symbols
+        ])
+        minute += 1
+
+
+def run(args, report) -> None:
+    symbols = SYMBOLS[:args.symbols]
+    db_client = LocalDynamoDbClient(["stock-stream-data"], latency=args.db_latency)
+    db_api = DynamoDbAPI("stock-stream-data", client=db_client)
+    server.init_db(db_api)
+    server.LIVE_POLL_INTERVAL = args.poll_interval
+    server.app.config["DEBUG"] = False
+
+    Thread(target=serve, args=(args.port,), daemon=True).start()
+    sleep(1.0)
+
+    latencies = []
+    received = [0]
+    lock = Lock()
+
+    def on_update(payload):
+        with lock:
+            latencies.append(time() - payload["sent_at"])
+            received[0] += 1
+
+    clients = []
+    start = perf_counter()
+    for idx in range(args.clients):
+        client = socketio.Client(reconnection=False)
+        client.on("graph_update", on_update, namespace=server.SOCKETIO_NAMESPACE)
+        try:
+            client.connect(
+                f"http://127.0.0.1:{args.port}", namespaces=[server.SOCKETIO_NAMESPACE]
+            )
+            client.emit(
+                "get_live_data", symbols[idx % len(symbols)], namespace=server.SOCKETIO_NAMESPACE
+            )
+            clients.append(client)
+        except Exception as err:
+            print(f"! Client {idx} failed to connect: {err} !", file=report)
+    print(f"{len(clients)} clients connected in {perf_counter() - start:.2f}s", file=report)
+
+    calls_before = db_client.calls.get("query", 0)
+    stop = Event()
+    feeder = Thread(target=feed, args=(db_api, symbols, args.minute_interval, stop), daemon=True)
+    feeder.start()
+    sleep(args.duration)
+    stop.set()
+    queries = db_client.calls.get("query", 0) - calls_before
+
+    closers = [Thread(target=client.disconnect, daemon=True) for client in clients]
+    for closer in closers:
+        closer.start()
+    for closer in closers:
+        closer.join(5.0)
+
+    with lock:
+        values = list(latencies)
+    print(f"updates received   : {received[0]}", file=report)
+    print(
+        f"emit latency (ms)  : p50 {percentile(values, 50) * 1e3:.2f} | "
+        f"p95 {percentile(values, 95) * 1e3:.2f} | p99 {percentile(values, 99) * 1e3:.2f}",
+        file=report
+    )
+    print(
+        f"DynamoDB queries   : {queries} ({queries / (args.duration / 60.0):.1f} per minute)",
+        file=report
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Live feed Socket.IO load test")
+    parser.add_argument("--clients", type=int, default=300, help="Simulated dashboards")
+    parser.add_argument("--symbols", type=int, default=10, help="Symbols spread over clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Server poll interval")
+    parser.add_argument(
+        "--minute-interval", type=float, default=2.0, help="Seconds between new minutes"
+    )
+    parser.add_argument("--db-latency", type=float, default=0.005, help="DynamoDB round trip")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Live Feed Socket.IO Load Test")
+    print("====================================")
+    # Keep the server's request/connection logs out of the report
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    report = StringIO()
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        run(args, report)
+    print(report.getvalue())
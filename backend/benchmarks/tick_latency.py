@@ -0,0 +1,153 @@
+"""
+Python: 3.7.9
+
+End-to-end tick-to-browser latency over the direct consumer -> server channel.
+
+Producer -> local Kinesis -> consumer (parse, publish, DynamoDB side branch)
+-> tick channel -> server -> Socket.IO client, all in one process. Reports the
+latency seen by the clients and the server's per-stage breakdown.
+
+Needs the Socket.IO client: pip install "python-socketio[client]"
+
+$ python -m benchmarks.tick_latency --batches 50 --interval 0.2
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from os import environ, getpid, path
+from secrets import token_hex
+from threading import Lock, Thread
+from time import sleep, time
+import logging
+import numpy as np
+from kinesis_api import KinesisAPI, DynamoDbAPI
+from kinesis_writer import BufferedKinesisWriter
+from local_aws import LocalKinesisClient, LocalDynamoDbClient
+from shard_consumer import ShardConsumer
+from tick_channel import AUTHKEY_ENV, RUNTIME_DIR, TickPublisher
+import consumer
+import server
+import wire_format
+
+try:
+    import socketio
+except ImportError:
+    raise SystemExit('! Socket.IO client is required: pip install "python-socketio[client]" !')
+
+
+SYMBOLS = ["AAPL", "AMZN", "FB", "GOOGL", "INTC", "MSFT", "NFLX", "NVDA", "QCOM", "TSLA"]
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float("nan")
+
+
+def serve(port: int) -> None:
+    try:
+        server.socketio.run(server.app, port=port, allow_unsafe_werkzeug=True)
+    except TypeError:
+        server.socketio.run(server.app, port=port)
+
+
+def produce(writer: BufferedKinesisWriter, batches: int, interval: float) -> None:
+    for idx in range(batches):
+        minute = 9 * 60 + 30 + idx
+        for symbol in SYMBOLS:
+            rows = np.zeros(1, dtype=wire_format.TICK_DTYPE)
+            rows["minute"] = minute
+            rows["symbol"] = symbol.encode("ascii")
+            rows["open"] = 100.0 + idx
+            writer.put(wire_format.encode_records(rows, batch_id=idx), partition_key=symbol)
+        sleep(interval)
+
+
+def run(args, report) -> None:
+    address = path.join(RUNTIME_DIR, f"ticks-{getpid()}.sock")
+    environ.setdefault(AUTHKEY_ENV, token_hex(16))
+    stream = LocalKinesisClient(shard_count=args.shards, latency=args.kinesis_latency)
+    db_api = DynamoDbAPI(
+        "stock-stream-data", client=LocalDynamoDbClient(latency=args.db_latency)
+    )
+    server.init_db(db_api)
+    server.app.config["DEBUG"] = False
+    Thread(target=serve, args=(args.port,), daemon=True).start()
+    server.start_tick_subscriber(address)
+
+    publisher = TickPublisher(address)
+    db_executor = ThreadPoolExecutor(max_workers=4)
+    reader = ShardConsumer(
+        KinesisAPI("stock-stream", client=stream),
+        lambda shard_id, records: consumer.handle_records(
+            db_api, publisher, shard_id, records, db_executor
+        ),
+        poll_interval=args.poll_interval,
+        max_poll_interval=args.max_poll_interval
+    )
+    reader.start()
+    sleep(1.0)
+
+    latencies = []
+    lock = Lock()
+
+    def on_update(payload):
+        trace = payload.get("trace") or {}
+        if "produced" in trace:
+            with lock:
+                latencies.append(time() - trace["produced"])
+
+    client = socketio.Client(reconnection=False)
+    client.on("graph_update", on_update, namespace=server.SOCKETIO_NAMESPACE)
+    client.connect(f"http://127.0.0.1:{args.port}", namespaces=[server.SOCKETIO_NAMESPACE])
+    for symbol in SYMBOLS:
+        client.emit("get_live_data", symbol, namespace=server.SOCKETIO_NAMESPACE)
+    sleep(1.0)
+
+    writer = BufferedKinesisWriter(KinesisAPI("stock-stream", client=stream), linger=args.linger)
+    produce(writer, args.batches, args.interval)
+    writer.close()
+    sleep(2.0)
+
+    reader.stop()
+    client.disconnect()
+    with lock:
+        values = list(latencies)
+    print(f"updates received        : {len(values)}", file=report)
+    print(
+        f"tick-to-client (ms)     : p50 {percentile(values, 50) * 1e3:.1f} | "
+        f"p99 {percentile(values, 99) * 1e3:.1f} | max {max(values or [0]) * 1e3:.1f}",
+        file=report
+    )
+    print("server stage breakdown  :", file=report)
+    for stage, stats in server.tick_latency.summary().items():
+        print(
+            f"  {stage:22s} p50 {stats['p50_ms']:8.2f} ms | p99 {stats['p99_ms']:8.2f} ms",
+            file=report
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Tick-to-browser latency benchmark")
+    parser.add_argument("--batches", type=int, default=50, help="Minutes to produce")
+    parser.add_argument("--interval", type=float, default=0.2, help="Seconds between minutes")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--linger", type=float, default=0.05, help="Producer linger (s)")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Consumer poll (s)")
+    parser.add_argument(
+        "--max-poll-interval", type=float, default=consumer.SHARD_MAX_POLL_INTERVAL,
+        help="Consumer poll of an idle shard (s)"
+    )
+    parser.add_argument("--kinesis-latency", type=float, default=0.01)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Tick-to-Browser Latency Benchmark")
+    print("====================================")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    report = StringIO()
+    with redirect_stdout(StringIO()), redirect_stderr(StringIO()):
+        run(args, report)
+    print(report.getvalue())
@@ -0,0 +1,103 @@
+"""
+Python: 3.7.9
+
+Benchmark of the live queries of a symbol's day (--minutes minutes of GBM ticks):
+
+    dynamodb : DynamoDB Query of the symbol (local stand-in holding --db-symbols symbols,
+               no network) and float() of every "N" string, what LiveDataCache did
+               for every uncached symbol
+    day      : TimeSeriesStore.day, the full day of the symbol
+    range    : TimeSeriesStore.range over --window minutes
+    latest   : TimeSeriesStore.latest, the last --window minutes
+
+Also times appending one minute batch of every symbol (the tick channel) and a warm start
+from the intraday data of the repo.
+
+$ python -m benchmarks.timeseries_store --symbols 500 --minutes 390 --queries 2000
+"""
+from argparse import ArgumentParser
+from os import path
+from time import perf_counter
+from kinesis_api import DynamoDbAPI
+from local_aws import LocalDynamoDbClient
+from simulator import GBMGenerator
+from timeseries_store import TimeSeriesStore
+import numpy as np
+import consumer
+
+
+DATA_DIR = path.join(path.dirname(path.dirname(path.dirname(path.realpath(__file__)))), "data")
+METHODS = ["dynamodb", "day", "range", "latest"]
+
+
+def query_dynamodb(db_api: DynamoDbAPI, symbol: str) -> list:
+    resp = db_api.query(
+        "symbol", symbol, sort_key="minute",
+        projection_expr="#m, #o", expr_attr_names={"#m": "minute", "#o": "open"}
+    )
+    return [float(item["open"]["N"]) for item in resp["items"]]
+
+
+def run(method: str, args, store: TimeSeriesStore, db_api: DynamoDbAPI) -> None:
+    symbols = store.symbols[:args.db_symbols] if method == "dynamodb" else store.symbols
+    rng = np.random.default_rng(1)
+    picks = [symbols[idx] for idx in rng.integers(0, len(symbols), args.queries).tolist()]
+    last_key = store.last_key(symbols[0])
+    start = last_key - args.window + 1
+    queries = args.queries if method != "dynamodb" else max(1, args.queries // 10)
+
+    started = perf_counter()
+    for symbol in picks[:queries]:
+        if method == "dynamodb":
+            query_dynamodb(db_api, symbol)
+        elif method == "day":
+            store.day(symbol)
+        elif method == "range":
+            store.range(symbol, start, last_key)
+        else:
+            store.latest(symbol, args.window)
+    elapsed = perf_counter() - started
+    print(f"{method:<8} | {queries:>6,} queries | {elapsed / queries * 1e6:>10,.1f} us/query")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Time-series store benchmark")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--minutes", type=int, default=390, help="Minutes of the day")
+    parser.add_argument("--window", type=int, default=30, help="Minutes per range/latest query")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--db-symbols", type=int, default=10, help="Symbols in DynamoDB")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Time-Series Store Benchmark")
+    print("====================================")
+    db_client = LocalDynamoDbClient([consumer.DYNAMO_DB_TABLE])
+    db_api = DynamoDbAPI(consumer.DYNAMO_DB_TABLE, client=db_client)
+    store = TimeSeriesStore()
+    db_symbols = GBMGenerator(symbols=args.db_symbols).symbols
+    append = 0.0
+    for batch in GBMGenerator(symbols=args.symbols, minutes=args.minutes, seed=5):
+        started = perf_counter()
+        store.append(batch)
+        append += perf_counter() - started
+        if "dynamodb" in args.methods:
+            consumer.insert_db(db_api, batch[np.isin(batch["symbol"], db_symbols)])
+    print(
+        f"append   | {args.minutes} batches of {args.symbols} symbols "
+        f"| {append / args.minutes * 1e3:>8.2f} ms/batch ({len(store):,} rows)"
+    )
+    for method in args.methods:
+        run(method, args, store, db_api)
+
+    sources = [
+        path.join(DATA_DIR, "columnar", "intraday-22-oct"),
+        path.join(DATA_DIR, "intraday-22-oct-merged.csv"),
+    ]
+    for source in sources:
+        if path.exists(source):
+            started = perf_counter()
+            rows = TimeSeriesStore().warm([source])
+            elapsed = perf_counter() - started
+            print(f"warm     | {path.basename(source)}: {rows:,} rows in {elapsed * 1e3:.1f} ms")
@@ -0,0 +1,135 @@
+"""
+Python: 3.7.9
+
+Benchmark of the consumer through a DynamoDB slowdown and outage (local stand-ins):
+
+    direct     : pipeline writers write to DynamoDB (retried, then given up)
+    wal        : pipeline writers append to the write-ahead log (msync per append),
+                 a drainer loads it into DynamoDB
+    wal-nosync : same, without msync (durable against a crash of the process only)
+
+The stream is filled up front, the table is slow (--db-latency) and fails every write
+for --outage seconds from the start. Reports when every shard was checkpointed
+(ingestion) and when every row was in the table, and the batches given up.
+
+$ python -m benchmarks.wal --symbols 200 --minutes 120 --db-latency 0.05 --outage 10
+"""
+from argparse import ArgumentParser
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+from botocore.exceptions import ClientError
+from kinesis_api import DynamoDbAPI, KinesisAPI
+from local_aws import LocalDynamoDbClient, LocalKinesisClient
+from pipeline import Pipeline
+from shard_consumer import CheckpointStore, ShardConsumer
+from simulator import GBMGenerator
+from wal import WriteAheadLog
+import consumer
+import wire_format
+
+
+DYNAMO_DB_TABLE = "stock-stream-data"
+KINESIS_STREAM_NAME = "stock-stream"
+METHODS = ["direct", "wal", "wal-nosync"]
+
+
+class FailingDynamoDbClient(LocalDynamoDbClient):
+    """
+    Local DynamoDB failing every BatchWriteItem until `failing_until` (perf_counter)
+    """
+    failing_until = 0.0
+
+    def batch_write_item(self, RequestItems: dict, **kwargs) -> dict:
+        if perf_counter() < self.failing_until:
+            raise ClientError(
+                {"Error": {"Code": "InternalServerError", "Message": "Outage"}}, "BatchWriteItem"
+            )
+        return super().batch_write_item(RequestItems=RequestItems, **kwargs)
+
+
+def run(method: str, args) -> None:
+    stream = LocalKinesisClient(KINESIS_STREAM_NAME, shard_count=args.shards)
+    rows = 0
+    for batch in GBMGenerator(symbols=args.symbols, minutes=args.minutes, seed=3):
+        stream.put_records(StreamName=KINESIS_STREAM_NAME, Records=[
+            {
+                "Data": wire_format.encode_records(batch[idx:idx + args.per_record]),
+                "PartitionKey": batch["symbol"][idx].decode("ascii")
+            }
+            for idx in range(0, len(batch), args.per_record)
+        ])
+        rows += len(batch)
+    stream.latency = args.kinesis_latency
+    stream.read_limit = 5
+    db_client = FailingDynamoDbClient([DYNAMO_DB_TABLE], latency=args.db_latency)
+    db_api = DynamoDbAPI(DYNAMO_DB_TABLE, client=db_client, batch_workers=2)
+    table = db_client.tables[DYNAMO_DB_TABLE]
+    store = CheckpointStore()
+    reader = ShardConsumer(
+        KinesisAPI(KINESIS_STREAM_NAME, client=stream), handler=None,
+        checkpoint_store=store, records_limit=args.records_limit
+    )
+
+    directory = mkdtemp(prefix="stock-wal-")
+    log = None
+    sink = lambda batch: consumer.insert_db(db_api, batch)
+    if method != "direct":
+        log = WriteAheadLog(directory, sink=sink, sync=method == "wal")
+        log.start()
+        sink = log.append
+    pipeline = Pipeline(
+        reader, parse=lambda records: consumer.process_records(None, records), sink=sink
+    )
+
+    expected = {
+        shard_id: records[-1]["SequenceNumber"]
+        for shard_id, records in stream.records.items() if records
+    }
+    started = perf_counter()
+    db_client.failing_until = started + args.outage
+    pipeline.start()
+    ingested = stored = None
+    while perf_counter() - started < args.timeout and (ingested is None or stored is None):
+        now = perf_counter() - started
+        if ingested is None and store.all() == expected:
+            ingested = now
+        if stored is None and len(table) == rows:
+            stored = now
+        sleep(0.01)
+    stats = pipeline.stats()
+    pipeline.stop()
+    pipeline.join()
+    if log is not None:
+        log.close()
+    rmtree(directory)
+
+    def seconds(value):
+        return f"{value:>6.2f}s" if value is not None else f"{'never':>7}"
+
+    print(
+        f"{method:<10} | {rows:,} rows | checkpointed in {seconds(ingested)} "
+        f"| stored in {seconds(stored)} ({len(table):,} rows) "
+        f"| batches given up: {stats['sink']['failed']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Write-ahead log benchmark")
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--minutes", type=int, default=120)
+    parser.add_argument("--per-record", type=int, default=50, help="Symbols per Kinesis record")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--records-limit", type=int, default=100, help="Records per GetRecords")
+    parser.add_argument("--kinesis-latency", type=float, default=0.01)
+    parser.add_argument("--db-latency", type=float, default=0.05, help="BatchWriteItem round trip")
+    parser.add_argument("--outage", type=float, default=10.0, help="Seconds the table fails")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=METHODS)
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Write-Ahead Log Benchmark")
+    print("====================================")
+    for method in args.methods:
+        run(method, args)
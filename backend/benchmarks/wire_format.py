@@ -0,0 +1,64 @@
+"""
+Python: 3.7.9
+
+Compare the JSON (DataFrame.to_dict) and binary (wire_format) record formats:
+bytes per row and encode/decode time per batch.
+
+$ python -m benchmarks.wire_format --batch-sizes 1 10 100 1000 --repeat 200
+"""
+from argparse import ArgumentParser
+from json import dumps, loads
+from os import path
+from time import perf_counter
+import pandas as pd
+import wire_format
+
+
+CUR_DIR = path.realpath(path.dirname(__file__))
+BASE_DIR = path.dirname(path.dirname(CUR_DIR))
+CSV_FILE = path.join(BASE_DIR, "data", "intraday-22-oct-merged.csv")
+
+
+def timeit(func, repeat: int) -> float:
+    """
+    Mean seconds per call
+    """
+    start = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - start) / repeat
+
+
+def run(df: pd.DataFrame, batch_size: int, repeat: int) -> None:
+    batch = df.head(batch_size)
+
+    json_blob = dumps(batch.to_dict()).encode("utf-8")
+    json_encode = timeit(lambda: dumps(batch.to_dict()).encode("utf-8"), repeat)
+    json_decode = timeit(lambda: loads(json_blob), repeat)
+
+    binary_blob = wire_format.encode_frame(batch)
+    binary_encode = timeit(lambda: wire_format.encode_frame(batch), repeat)
+    binary_decode = timeit(lambda: wire_format.decode(binary_blob), repeat)
+
+    for name, blob, encode, decode in (
+        ("json", json_blob, json_encode, json_decode),
+        ("binary", binary_blob, binary_encode, binary_decode),
+    ):
+        print(
+            f"rows: {batch_size:6d} | {name:6s} | {len(blob) / batch_size:8.1f} bytes/row"
+            f" | encode: {encode * 1e6:10.1f} us | decode: {decode * 1e6:10.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="JSON vs binary wire format benchmark")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    print("====================================")
+    print("Wire Format Benchmark")
+    print("====================================")
+    data = pd.read_csv(CSV_FILE)
+    for size in args.batch_sizes:
+        run(data, size, args.repeat)
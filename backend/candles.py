@@ -0,0 +1,282 @@
+"""
+Python: 3.7.9
+
+Incremental OHLCV candles (5m/15m/1h) of every symbol
+
+Every timeframe keeps a fixed-size ring of candles per symbol, as 2D NumPy arrays
+(symbol row x ring slot). The in-progress candle is the ring's head: a tick either
+updates it (high/low/close/volume/notional) or starts the next candle, O(1) per tick
+and vectorized over all the symbols of a batch. VWAP is notional / volume.
+
+Candles are keyed by their start, in minutes: yyyymmdd * 1440 + minutes since midnight,
+so buckets of timeframes dividing a day line up with the clock (1h: 09:00, 10:00, ...).
+
+The consumer aggregates the ticks and publishes the head candles it updated (CANDLE_DTYPE),
+the server mirrors them with upsert.
+"""
+from threading import Lock
+from typing import Dict, Iterator
+import numpy as np
+import wire_format
+
+
+# name -> (minutes, ring size): 2 trading days of 5m, 4 of 15m and 1h candles
+TIMEFRAMES = {"5m": (5, 156), "15m": (15, 104), "1h": (60, 28)}
+MINUTES_PER_DAY = 24 * 60
+PRICE_FIELDS = ["open", "high", "low", "close"]
+SERIES_KEYS = ["labels", "dates"] + PRICE_FIELDS + ["volume", "vwap"]
+
+# A candle as published by the consumer
+CANDLE_DTYPE = np.dtype([
+    ("symbol", "S8"),
+    ("start", "<i8"),           # yyyymmdd * 1440 + minutes since midnight
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<i8"),
+    ("notional", "<f8"),
+])
+
+
+def minute_keys(batch: np.ndarray) -> np.ndarray:
+    """
+    TICK_DTYPE rows -> yyyymmdd * 1440 + minutes since midnight
+    """
+    return batch["date"].astype(np.int64) * MINUTES_PER_DAY + batch["minute"]
+
+
+def rounds(rows: np.ndarray) -> Iterator[np.ndarray]:
+    """
+    Sorted rows -> masks selecting every row at most once, in order: the first
+    tick of every row, then the second, ... (one round for one tick per symbol)
+    """
+    if not len(rows):
+        return
+    positions = np.arange(len(rows))
+    firsts = np.concatenate(([True], rows[1:] != rows[:-1]))
+    rank = positions - np.maximum.accumulate(np.where(firsts, positions, 0))
+    for turn in range(int(rank.max()) + 1):
+        yield rank == turn
+
+
+class CandleRing:
+    """
+    Fixed-size rings of one timeframe's candles, one ring per symbol row
+    """
+
+    def __init__(self, minutes: int, size: int, capacity: int):
+        self.minutes = minutes
+        self.size = size
+        self.late = 0
+        self.heads = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.starts = np.full((capacity, size), -1, dtype=np.int64)
+        self.fields = {field: np.full((capacity, size), np.nan) for field in PRICE_FIELDS}
+        self.fields["volume"] = np.zeros((capacity, size), dtype=np.int64)
+        self.fields["notional"] = np.zeros((capacity, size))
+
+    def grow(self, capacity: int) -> None:
+        extra = capacity - len(self.heads)
+        self.heads = np.concatenate((self.heads, np.zeros(extra, dtype=np.int64)))
+        self.counts = np.concatenate((self.counts, np.zeros(extra, dtype=np.int64)))
+        self.starts = np.vstack((self.starts, np.full((extra, self.size), -1, np.int64)))
+        for field, values in self.fields.items():
+            if field in PRICE_FIELDS:
+                pad = np.full((extra, self.size), np.nan)
+            else:
+                pad = np.zeros((extra, self.size), dtype=values.dtype)
+            self.fields[field] = np.vstack((values, pad))
+
+    def __advance(self, rows: np.ndarray, heads: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """
+        Move the heads of rows[new] to their next slot, returns the heads of all rows
+        """
+        heads = heads.copy()
+        heads[new] = (heads[new] + 1) % self.size
+        advanced = rows[new]
+        self.heads[advanced] = heads[new]
+        self.counts[advanced] = np.minimum(self.counts[advanced] + 1, self.size)
+        return heads
+
+    def update(self, rows: np.ndarray, keys: np.ndarray, ticks: np.ndarray) -> None:
+        """
+        Add one tick per row (rows must be unique), ticks older than the head are dropped
+        """
+        starts = keys // self.minutes * self.minutes
+        heads = self.heads[rows]
+        current = self.starts[rows, heads]
+        new = starts > current
+        same = starts == current
+        self.late += len(rows) - int(new.sum()) - int(same.sum())
+
+        heads = self.__advance(rows, heads, new)
+        fields = self.fields
+        slot = (rows[new], heads[new])
+        self.starts[slot] = starts[new]
+        for field in ["open", "high", "low", "close", "volume", "notional"]:
+            fields[field][slot] = ticks[field][new]
+
+        slot = (rows[same], heads[same])
+        fields["high"][slot] = np.fmax(fields["high"][slot], ticks["high"][same])
+        fields["low"][slot] = np.fmin(fields["low"][slot], ticks["low"][same])
+        fields["close"][slot] = ticks["close"][same]
+        fields["volume"][slot] += ticks["volume"][same]
+        fields["notional"][slot] += ticks["notional"][same]
+
+    def upsert(self, rows: np.ndarray, candles: np.ndarray) -> None:
+        """
+        Set the head candle of every row (rows must be unique): replaces the head with
+        the same start, appends a newer one, candles older than the head are dropped
+        """
+        heads = self.heads[rows]
+        current = self.starts[rows, heads]
+        new = candles["start"] > current
+        write = new | (candles["start"] == current)
+        self.late += len(rows) - int(write.sum())
+
+        heads = self.__advance(rows, heads, new)
+        slot = (rows[write], heads[write])
+        self.starts[slot] = candles["start"][write]
+        for field, values in self.fields.items():
+            values[slot] = candles[field][write]
+
+    def head_candles(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Head candles of rows as CANDLE_DTYPE (symbol is left empty)
+        """
+        heads = self.heads[rows]
+        candles = np.zeros(len(rows), dtype=CANDLE_DTYPE)
+        candles["start"] = self.starts[rows, heads]
+        for field, values in self.fields.items():
+            candles[field] = values[rows, heads]
+        return candles
+
+    def series(self, row: int, limit: int = None) -> dict:
+        """
+        Candles of a row, oldest first (at most `limit`)
+        """
+        count = int(self.counts[row])
+        if limit is not None:
+            count = min(count, limit)
+        slots = (self.heads[row] - np.arange(count)[::-1]) % self.size
+        starts = self.starts[row, slots]
+        volume = self.fields["volume"][row, slots]
+        notional = self.fields["notional"][row, slots]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vwap = np.where(volume > 0, notional / volume, np.nan)
+        series = {
+            "labels": wire_format.format_minutes(starts % MINUTES_PER_DAY),
+            "dates": wire_format.format_dates(starts // MINUTES_PER_DAY),
+        }
+        for field in PRICE_FIELDS:
+            series[field] = self.fields[field][row, slots].tolist()
+        series["volume"] = volume.tolist()
+        series["vwap"] = [None if np.isnan(value) else value for value in vwap.tolist()]
+        return series
+
+
+class CandleAggregator:
+    """
+    Rolling candles of every timeframe for any number of symbols
+    """
+
+    def __init__(self, timeframes: Dict[str, tuple] = None, capacity: int = 1024):
+        timeframes = timeframes or TIMEFRAMES
+        self.symbols = []
+        self.index = {}
+        self.rings = {
+            name: CandleRing(minutes, size, capacity)
+            for name, (minutes, size) in timeframes.items()
+        }
+        self.capacity = capacity
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<CandleAggregator(timeframes={list(self.rings)}, symbols={len(self.symbols)})>"
+
+    def rows_of(self, symbols: np.ndarray) -> np.ndarray:
+        """
+        Symbol (bytes) -> row, new symbols get a row
+        """
+        index = self.index
+        symbols = symbols.tolist()
+        rows = [index.get(symbol) for symbol in symbols]
+        if None in rows:
+            rows = [index[symbol] if symbol in index else self.__add(symbol) for symbol in symbols]
+        return np.asarray(rows, dtype=np.int64)
+
+    def __add(self, symbol: bytes) -> int:
+        row = len(self.symbols)
+        if row == self.capacity:
+            self.capacity *= 2
+            for ring in self.rings.values():
+                ring.grow(self.capacity)
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        return row
+
+    def update(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Add a TICK_DTYPE batch (any symbols, any minutes) to every timeframe.
+        Returns the (unique) rows of the updated symbols.
+        """
+        batch = batch[~np.isnan(batch["open"])]
+        if not len(batch):
+            return np.zeros(0, dtype=np.int64)
+        with self.__lock:
+            rows = self.rows_of(batch["symbol"])
+            keys = minute_keys(batch)
+            # Ticks of a symbol in time order, applied in rounds of unique rows
+            order = np.lexsort((keys, rows))
+            rows, keys, batch = rows[order], keys[order], batch[order]
+            for selected in rounds(rows):
+                for ring in self.rings.values():
+                    ring.update(rows[selected], keys[selected], batch[selected])
+            return np.unique(rows)
+
+    def upsert(self, timeframe: str, candles: np.ndarray) -> None:
+        """
+        Mirror head candles (CANDLE_DTYPE, one per symbol) published by another aggregator
+        """
+        if not len(candles):
+            return
+        with self.__lock:
+            self.rings[timeframe].upsert(self.rows_of(candles["symbol"]), candles)
+
+    def head_candles(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        timeframe -> head candles (CANDLE_DTYPE) of the given rows
+        """
+        with self.__lock:
+            heads = {}
+            symbols = np.asarray([self.symbols[row] for row in rows.tolist()], dtype="S8")
+            for name, ring in self.rings.items():
+                candles = ring.head_candles(rows)
+                candles["symbol"] = symbols
+                heads[name] = candles
+            return heads
+
+    def candles(self, symbol: str, timeframe: str, limit: int = None) -> dict:
+        """
+        Candles of a symbol, oldest first: {"labels", "dates", "open", "high", "low",
+        "close", "volume", "vwap"}. Raises KeyError for an unknown timeframe.
+        """
+        ring = self.rings[timeframe]
+        with self.__lock:
+            row = self.index.get(symbol.encode("ascii"))
+            if row is None:
+                return {key: [] for key in SERIES_KEYS}
+            return ring.series(row, limit)
+
+    @property
+    def late(self) -> Dict[str, int]:
+        return {name: ring.late for name, ring in self.rings.items()}
+
+
+def encode_candles(heads: Dict[str, np.ndarray]) -> Dict[str, bytes]:
+    return {name: candles.tobytes() for name, candles in heads.items()}
+
+
+def decode_candles(message: Dict[str, bytes]) -> Dict[str, np.ndarray]:
+    return {name: np.frombuffer(blob, dtype=CANDLE_DTYPE) for name, blob in message.items()}
@@ -0,0 +1,186 @@
+"""
+Python: 3.7.9
+
+Rooms of the clients of several server processes sharing a Socket.IO message queue
+(serve.py --workers N --message-queue redis://...).
+
+One process, the broadcaster, sends the broadcasts of the tick channel and of the
+DynamoDB pollers (graph_update, graph_delta, candle_update, indicator_update) through
+the queue, which delivers them to the clients of every process. To coalesce the delta
+rooms and refresh the symbols of all the clients, it needs the rooms the clients of the
+other workers are in: every worker publishes them on ROOMS_CHANNEL of the queue's Redis
+server when they change and every ANNOUNCE_INTERVAL seconds (a restarted broadcaster
+knows them again within that time). The rooms of a worker not heard from for
+WORKER_TIMEOUT seconds are dropped.
+
+A room is (symbol, window, format) for the delta clients, (symbol, None, None) for a
+symbol watched by any client.
+"""
+from json import dumps, loads
+import logging
+from os import getpid
+from socket import gethostname
+from threading import Lock
+from time import sleep, time
+from typing import Callable, FrozenSet, List, Set, Tuple
+
+try:
+    import redis
+except ImportError:
+    # Single process, without a message queue
+    redis = None
+
+
+ROOMS_CHANNEL = "stock-stream-rooms"
+# Seconds between two announcements of the rooms of a worker
+ANNOUNCE_INTERVAL = 1.0
+# Seconds after which the rooms of a silent worker are dropped
+WORKER_TIMEOUT = 5.0
+
+Room = Tuple[str, float, str]
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    """
+    Id of this process, also its member id in the broadcaster's delta rooms
+    """
+    return f"worker:{gethostname()}:{getpid()}"
+
+
+def connect(url: str) -> "redis.Redis":
+    """
+    Client of the Redis server of the message queue
+    """
+    if redis is None:
+        raise ImportError("! The message queue needs the Redis client: pip install redis !")
+    return redis.Redis.from_url(url)
+
+
+def encode_rooms(worker: str, rooms: List[Room]) -> str:
+    return dumps({"worker": worker, "rooms": [list(room) for room in rooms]})
+
+
+def decode_rooms(message: bytes) -> Tuple[str, FrozenSet[Room]]:
+    """
+    Worker id and rooms of an announcement, raises ValueError when malformed
+    """
+    try:
+        announcement = loads(message)
+        rooms = frozenset(
+            (str(symbol), None if window is None else float(window), fmt)
+            for symbol, window, fmt in announcement["rooms"]
+        )
+        return str(announcement["worker"]), rooms
+    except (KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"! Invalid rooms announcement: {err} !")
+
+
+class RoomAnnouncer:
+    """
+    Publishes the rooms of this worker's clients, rooms() -> list of rooms
+    """
+
+    def __init__(self, url: str, rooms: Callable[[], List[Room]], worker: str = None):
+        self.client = connect(url)
+        self.rooms = rooms
+        self.worker = worker or worker_id()
+
+    def __str__(self) -> str:
+        return f"<RoomAnnouncer(worker={self.worker})>"
+
+    def announce(self) -> bool:
+        """
+        Publish the rooms, returns False (logged) when the Redis server is unreachable
+        """
+        try:
+            self.client.publish(ROOMS_CHANNEL, encode_rooms(self.worker, self.rooms()))
+            return True
+        except redis.RedisError as err:
+            logger.warning("Failed to announce the rooms of %s: %s", self.worker, err)
+            return False
+
+
+class RemoteRooms:
+    """
+    Rooms of the clients of the other workers, on the broadcaster.
+    on_join(worker, room) and on_leave(worker, room) are called for every change.
+    """
+
+    def __init__(
+        self,
+        on_join: Callable[[str, Room], None],
+        on_leave: Callable[[str, Room], None],
+        timeout: float = WORKER_TIMEOUT
+    ):
+        self.on_join = on_join
+        self.on_leave = on_leave
+        self.timeout = timeout
+        # worker -> (last announcement time, rooms)
+        self.workers = {}
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<RemoteRooms(workers={len(self.workers)})>"
+
+    def update(self, worker: str, rooms: FrozenSet[Room], now: float = None) -> None:
+        """
+        Apply an announcement of a worker
+        """
+        now = time() if now is None else now
+        with self.__lock:
+            _, before = self.workers.get(worker, (now, frozenset()))
+            self.workers[worker] = (now, rooms)
+        for room in rooms - before:
+            self.on_join(worker, room)
+        for room in before - rooms:
+            self.on_leave(worker, room)
+
+    def expire(self, now: float = None) -> List[str]:
+        """
+        Drop the rooms of the workers silent for timeout seconds, returns the workers
+        """
+        now = time() if now is None else now
+        with self.__lock:
+            expired = {
+                worker: rooms for worker, (seen_at, rooms) in self.workers.items()
+                if now - seen_at > self.timeout
+            }
+            for worker in expired:
+                del self.workers[worker]
+        for worker, rooms in expired.items():
+            logger.warning("Dropped the rooms of %s, silent for %.0fs", worker, self.timeout)
+            for room in rooms:
+                self.on_leave(worker, room)
+        return list(expired)
+
+    def symbols(self) -> Set[str]:
+        """
+        Symbols watched by the clients of the other workers
+        """
+        with self.__lock:
+            return {room[0] for _, rooms in self.workers.values() for room in rooms}
+
+    def listen(self, url: str) -> None:
+        """
+        Apply the announcements published on ROOMS_CHANNEL, reconnecting when the Redis
+        server is unreachable (run it in a background task)
+        """
+        client = connect(url)
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(ROOMS_CHANNEL)
+                while True:
+                    message = pubsub.get_message(timeout=ANNOUNCE_INTERVAL)
+                    if message is not None:
+                        try:
+                            self.update(*decode_rooms(message["data"]))
+                        except ValueError as err:
+                            logger.warning("%s", err)
+                    self.expire()
+            except redis.RedisError as err:
+                logger.warning("Rooms channel failed, reconnecting: %s", err)
+                self.expire()
+                sleep(ANNOUNCE_INTERVAL)
@@ -4,98 +4,236 @@ Date:
 Python: 3.7.9
 
 Consumer for AWS Kinesis Stock Data Stream
+
+Runs as a pipeline (pipeline.Pipeline): shard readers, parsers pushing the ticks to
+the server, and writers appending the rows to a local write-ahead log (wal.py) that a
+background drainer loads into DynamoDB. Shards are only checkpointed once their rows
+are in the log, so a slow or failing table never stalls (or crashes) the ingestion.
+LOG_LEVEL=DEBUG logs every parsed batch.
+Counters, latencies and queue depths are served on http://localhost:METRICS_PORT/metrics.
 """
-from datetime import datetime
-import time
+import logging
+from os import getenv, path
+from time import time
+import numpy as np
 from kinesis_api import KinesisAPI, DynamoDbAPI
-
-
+from shard_consumer import ShardConsumer, FileCheckpointStore
+from pipeline import Pipeline
+from wal import WriteAheadLog
+from tick_channel import TickPublisher, DEFAULT_ADDRESS
+from candles import CandleAggregator, encode_candles
+from indicators import IndicatorEngine
+import metrics
+import wire_format
+
+
+CUR_DIR = path.realpath(path.dirname(__file__))
+CHECKPOINT_FILE = path.join(CUR_DIR, "checkpoints.json")
+# Write-ahead log of the parsed rows, drained into DynamoDB (python wal.py status|replay)
+WAL_DIR = path.join(CUR_DIR, "wal")
+# msync every append: survives power loss, else only a crash of the consumer
+WAL_SYNC = True
+# Daily closes the indicators are backfilled from
+HISTORICAL_DATA_DIR = path.join(path.dirname(CUR_DIR), "data", "historical_data")
+# Unix socket path (or "host:port") the server subscribes to for new ticks
+TICK_CHANNEL_ADDRESS = DEFAULT_ADDRESS
 KINESIS_STREAM_NAME = "stock-stream"
 KINESIS_SHARD_PARTITION_KEY = "stock"
 DYNAMO_DB_TABLE = "stock-stream-data"
 DYNAMO_DB_PARTITION_KEY = "symbol"
 SYNAMO_DB_SORT_KEY = "minute"
+# Seconds between two reads of a shard at the tip of the stream, and longest delay of an
+# idle shard (empty reads back off up to it). The first tick after a lull is read up to
+# SHARD_MAX_POLL_INTERVAL late: lower it for latency, raise it for fewer GetRecords calls
+# (an idle shard costs 1 / SHARD_MAX_POLL_INTERVAL calls per second, Kinesis allows 5).
+SHARD_POLL_INTERVAL = 0.5
+SHARD_MAX_POLL_INTERVAL = 1.0
+# Seconds between two logs of the pipeline stats (throughput, queues, lag, API calls)
+REPORT_INTERVAL = 60.0
+LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
+# Port of the Prometheus /metrics endpoint (0 to disable)
+METRICS_PORT = int(getenv("METRICS_PORT", "9102"))
+# Parser and DynamoDB writer threads of the pipeline
+PARSERS = 2
+SINKS = 4
+# Columns of a parsed batch stored in DynamoDB
+DB_COLUMNS = ["minute", "date", "symbol", "open", "high", "low", "close", "volume"]
+
+logger = logging.getLogger("consumer")
+CONSUMED_ROWS = metrics.rows("consumed")
+STORED_ROWS = metrics.rows("stored")
+SKIPPED_RECORDS = metrics.REGISTRY.counter(
+    metrics.PREFIX + "skipped_records_total", "Stream records skipped, they failed to parse"
+).labels()
+
+
+def push_data(publisher, data, trace=None):
+    """
+    Push parsed batch (record array) to front end
+
+    The batch is published on the local tick channel the server subscribes to,
+    so it reaches the browser without waiting for the DynamoDB write.
+    """
+    if publisher is None or not len(data):
+        return
+    publisher.publish({
+        "batch": wire_format.encode_records(data, created_at=(trace or {}).get("produced")),
+        "trace": dict(trace or {})
+    })
 
 
-def push_data():
+def push_aggregates(publisher, batch, aggregator=None, indicators=None):
     """
-    Push to front end
+    Update the candles and indicators with a parsed batch and push the latest
+    values of the updated symbols to front end (head candles of every timeframe,
+    INDICATOR_DTYPE rows)
     """
-    pass
+    message = {}
+    if aggregator is not None:
+        message["candles"] = encode_candles(aggregator.head_candles(aggregator.update(batch)))
+    if indicators is not None:
+        message["indicators"] = indicators.update(batch).tobytes()
+    if publisher is None or not message:
+        return
+    publisher.publish(message)
 
 
-def insert_db(db_api, data):
+def insert_db(db_api, data, batched=True):
     """
-    Insert to database
+    Insert parsed batch (record array) to database
+
+    batched=True writes the rows with BatchWriteItem (25 per call, chunks in parallel)
+    batched=False writes one PutItem call per row
     """
-    print("Writing to dynamo DB")
-    for row in data:
-        db_api.put(row)
-    return
+    logger.debug("Writing %d rows to dynamo DB", len(data))
+    if batched:
+        db_api.put_batch(data, columns=DB_COLUMNS)
+    else:
+        for row in wire_format.to_rows(data, DB_COLUMNS):
+            db_api.put(row)
+    STORED_ROWS.inc(len(data))
 
 
 def parse_record(data):
     """
-    parse consumed records
+    parse consumed records into a typed columnar batch
+
+    Returns a wire_format.TICK_DTYPE record array with one row per tick, for any
+    number of rows and symbols. Binary batches are already decoded into one,
+    JSON batches ({column: {row index: value}}) are converted column by column.
+    """
+    if isinstance(data, np.ndarray):
+        return data
+    return wire_format.columns_to_records(data)
+
+
+def process_records(publisher, records, aggregator=None, indicators=None):
     """
-    required_keys = ["minute", "symbol", "open",
-                     "high", "low", "close", "volume"]
+    Parse the records read from a shard and push them to the server: every batch as
+    soon as it is parsed, then the candles and indicators of all of them at once.
+    Returns the parsed rows of all the records (TICK_DTYPE).
 
-    # get relavent keys
-    parsed_data = {key: data[key] for key in required_keys}
+    Every batch carries a trace (id and per-stage timestamps) through to the browser.
+    A record that fails to parse is logged, counted and skipped (a retry would fail the
+    same way), the rows of the others are still returned.
+    """
+    batches = []
+    for record in records:
+        trace = {"id": record.get("trace_id") or record.get("sequence_number"), "consumed": time()}
+        if record.get("produced_at"):
+            trace["produced"] = record["produced_at"]
+        try:
+            parsed_data = parse_record(record.get("data"))
+        except Exception:
+            logger.exception(
+                "Skipped record: %s, it failed to parse", record.get("sequence_number")
+            )
+            SKIPPED_RECORDS.inc()
+            continue
+        trace["parsed"] = time()
+        push_data(publisher, parsed_data, trace)
+        batches.append(parsed_data)
+        logger.debug("Parsed record: %s\n%s", record.get("sequence_number"), parsed_data)
+    if not batches:
+        return np.zeros(0, dtype=wire_format.TICK_DTYPE)
+    batch = np.concatenate(batches)
+    CONSUMED_ROWS.inc(len(batch))
+    push_aggregates(publisher, batch, aggregator, indicators)
+    return batch
+
+
+def handle_records(
+    db_api, publisher, shard_id, records, db_executor=None, aggregator=None, indicators=None
+):
+    """
+    Parse the records read from a shard, push them to the server and store them,
+    all on the calling thread (consume() runs the same steps as a pipeline)
 
-    # Create array structure
-    arrayed = []
-    for _ in range(10):
-        arrayed.append({key: '0' for key in required_keys})
+    The DynamoDB write runs on db_executor when given and is awaited before
+    returning, so the shard is only checkpointed once the rows are stored.
+    """
+    batch = process_records(publisher, records, aggregator, indicators)
+    if db_executor is None:
+        insert_db(db_api, batch)
+    else:
+        db_executor.submit(insert_db, db_api, batch).result()
 
-    # Unpack dict and load to array
-    for key, value in parsed_data.items():
-        for subkey in sorted(value):
-            arrayed[int(subkey) % 10][key] = value[subkey]
 
-    return arrayed
+def build_pipeline(api, db_api, publisher, checkpoint_store=None, log=None):
+    """
+    Consumer pipeline of the stream: shard readers -> parsers (tick channel, candles,
+    indicators) -> writers appending to the write-ahead log when one is given, else
+    writing to DynamoDB. Checkpoints are saved in CHECKPOINT_FILE unless a
+    checkpoint_store is given.
+    """
+    # Rolling 5m/15m/1h candles and indicators of every symbol
+    aggregator = CandleAggregator()
+    indicators = IndicatorEngine()
+    if path.isdir(HISTORICAL_DATA_DIR):
+        logger.info("Indicators backfilled: %d", indicators.backfill_csv(HISTORICAL_DATA_DIR))
+
+    # Read every shard in parallel, resume from the last checkpoint after a restart
+    consumer = ShardConsumer(
+        api=api,
+        handler=None,
+        checkpoint_store=checkpoint_store or FileCheckpointStore(CHECKPOINT_FILE),
+        poll_interval=SHARD_POLL_INTERVAL,
+        max_poll_interval=SHARD_MAX_POLL_INTERVAL
+    )
+    return Pipeline(
+        consumer,
+        parse=lambda records: process_records(publisher, records, aggregator, indicators),
+        sink=log.append if log is not None else lambda batch: insert_db(db_api, batch),
+        parsers=PARSERS,
+        sinks=SINKS
+    )
 
 
 def consume():
     api = KinesisAPI(stream_name=KINESIS_STREAM_NAME)
     db_api = DynamoDbAPI(DYNAMO_DB_TABLE)
-    last_seq_num = ""
-
-    for record in api.read_records(time_limit=1.0):
-        data = record.get("data")
-        last_seq_num = record.get("sequence_number")
-        # print(f"\nDATA: {data}\nLAST_SEQ_NUM: {last_seq_num}\n")
-        print("---------------------------")
-        parsed_data = parse_record(data)
-        print(parsed_data)
-        insert_db(db_api, parsed_data)
-        print("---------------------------")
-
-    starttime = time.time()
-
-    while True:
-        print("Retrieving...")
-        shard_iter = api.get_shard_iterator(
-            iterator_type="AFTER_SEQUENCE_NUMBER",
-            sequence_number=last_seq_num
-        )
-
-        for record in api.read_records(time_limit=1.0, shard_iterator=shard_iter):
-            data = record.get("data")
-            last_seq_num = record.get("sequence_number")
-            # print(f"\nDATA: {data}\nLAST_SEQ_NUM: {last_seq_num}\n")
-            print("---------------------------")
-            parsed_data = parse_record(data)
-            print(parsed_data)
-            insert_db(db_api, parsed_data)
-            print("---------------------------")
-
-        print("Sleeping...")
-        time.sleep(60.0 - ((time.time() - starttime) % 60.0))
+    publisher = TickPublisher(TICK_CHANNEL_ADDRESS)
+    log = WriteAheadLog(WAL_DIR, sink=lambda rows: insert_db(db_api, rows), sync=WAL_SYNC)
+    log.start()
+    pipeline = build_pipeline(api, db_api, publisher, log=log)
+    pipeline.register_metrics()
+    log.register_metrics()
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+        logger.info("Metrics: http://localhost:%d/metrics", METRICS_PORT)
+    logger.info("%s %s %s", pipeline, log, publisher)
+    pipeline.run_forever(report_interval=REPORT_INTERVAL)
+    # Rows not drained yet stay in the log and are loaded after the next start
+    log.close()
+    publisher.close()
+    db_api.close()
+    api.close()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=LOG_LEVEL, format="%(asctime)s %(levelname)s [%(threadName)s] %(message)s"
+    )
     print("====================================")
     print("Stock Data Consumer for AWS Kinesis")
     print("====================================")
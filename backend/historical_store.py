@@ -0,0 +1,223 @@
+"""
+Python: 3.7.9
+
+Cached historical (daily) data store for the server
+
+Every symbol's data is read once (from the memory-mapped columnar dataset when one was
+converted with data/data_editor.py, else from its CSV) and kept in an LRU cache,
+invalidated when the file's mtime changes. Full responses are serialized (and gzipped)
+once per symbol and shape, date ranges are sliced from the cached arrays without
+re-reading the file.
+
+Shapes:
+records  : [{"date": "2020-11-02", "open": 109.11, ...}, ...]
+columnar : {"date": ["2020-11-02", ...], "open": [109.11, ...], ...}
+
+Several symbols are served in one response, spliced from the bodies of the symbols:
+{"data": {"AAPL": <body>, "MSFT": <body>}, "missing": ["XYZ"]}
+"""
+from collections import OrderedDict
+from gzip import compress
+from hashlib import md5
+from json import dumps
+from os import listdir, path, stat
+from threading import Lock
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from market_data import COLUMNAR_INDEX, ColumnarDataset, is_columnar
+
+
+SHAPES = ("records", "columnar")
+
+
+class HistoricalData:
+    """
+    Cached data of one symbol and its serialized responses
+    """
+
+    def __init__(self, symbol: str, file_path: str, mtime_ns: int, columns: dict = None):
+        """
+        columns: {column: array} of the symbol (from a columnar dataset), else file_path is read
+        """
+        self.symbol = symbol
+        self.mtime_ns = mtime_ns
+        if columns is None:
+            df = pd.read_csv(file_path, index_col=0)
+            columns = {column: df[column].to_numpy() for column in df.columns}
+        columns = {
+            column: np.char.decode(values, "ascii") if values.dtype.kind == "S" else values
+            for column, values in columns.items() if column != "symbol"
+        }
+        self.columns = list(columns)
+        # date sorted "YYYY-MM-DD" strings, searchsorted gives the rows of a date range
+        order = np.argsort(columns["date"], kind="stable")
+        self.dates = columns["date"][order].astype(str)
+        self.values = {column: values[order].tolist() for column, values in columns.items()}
+        self.bodies = {}
+        self.__lock = Lock()
+
+    def etag(self, shape: str, start: str = None, end: str = None) -> str:
+        key = f"{self.symbol}:{self.mtime_ns}:{shape}:{start or ''}:{end or ''}"
+        return md5(key.encode("utf-8")).hexdigest()
+
+    def slice(self, start: str = None, end: str = None) -> slice:
+        """
+        Rows with start <= date <= end (both optional)
+        """
+        lo = int(np.searchsorted(self.dates, start, side="left")) if start else 0
+        hi = int(np.searchsorted(self.dates, end, side="right")) if end else len(self.dates)
+        return slice(lo, hi)
+
+    def serialize(self, shape: str, start: str = None, end: str = None) -> bytes:
+        rows = self.slice(start, end)
+        columns = {column: self.values[column][rows] for column in self.columns}
+        if shape == "columnar":
+            return dumps(columns).encode("utf-8")
+        records = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        return dumps(records).encode("utf-8")
+
+    def body(self, shape: str, start: str = None, end: str = None, gzip: bool = False) -> bytes:
+        """
+        Serialized response, full responses are cached (plain and gzipped)
+        """
+        if start or end:
+            body = self.serialize(shape, start, end)
+            return compress(body) if gzip else body
+        with self.__lock:
+            body = self.bodies.get((shape, gzip))
+            if body is None:
+                body = self.bodies.get((shape, False))
+                if body is None:
+                    body = self.bodies[(shape, False)] = self.serialize(shape)
+                if gzip:
+                    body = self.bodies[(shape, True)] = compress(body)
+            return body
+
+
+def batch_etag(
+    datas: Dict[str, HistoricalData],
+    missing: List[str],
+    shape: str,
+    start: str = None,
+    end: str = None
+) -> str:
+    key = ",".join([data.etag(shape, start, end) for data in datas.values()] + missing)
+    return md5(key.encode("utf-8")).hexdigest()
+
+
+def batch_body(
+    datas: Dict[str, HistoricalData],
+    missing: List[str],
+    shape: str,
+    start: str = None,
+    end: str = None,
+    gzip: bool = False
+) -> bytes:
+    """
+    Response of several symbols, the (cached) bodies of the symbols are not re-serialized
+    """
+    body = b"".join([
+        b'{"data": {',
+        b", ".join([
+            dumps(symbol).encode("utf-8") + b": " + data.body(shape, start, end)
+            for symbol, data in datas.items()
+        ]),
+        b'}, "missing": ',
+        dumps(missing).encode("utf-8"),
+        b"}",
+    ])
+    return compress(body) if gzip else body
+
+
+class HistoricalStore:
+    """
+    LRU cache of HistoricalData per symbol, reloaded when the CSV file (or the columnar
+    dataset in columnar_dir) changes
+    """
+
+    def __init__(self, data_dir: str, max_symbols: int = 64, columnar_dir: str = None):
+        self.data_dir = data_dir
+        self.max_symbols = max_symbols
+        self.columnar_dir = columnar_dir
+        self.columnar = None
+        self.cache = OrderedDict()
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<HistoricalStore(data_dir='{self.data_dir}', cached={list(self.cache)})>"
+
+    def file_path(self, symbol: str) -> str:
+        if not symbol or not symbol.isalnum():
+            raise KeyError(symbol)
+        return path.join(self.data_dir, f"hist-{symbol}.csv")
+
+    def columnar_dataset(self) -> ColumnarDataset:
+        """
+        Memory-mapped columnar dataset, reopened when it was rewritten. None without one.
+        """
+        if not self.columnar_dir or not is_columnar(self.columnar_dir):
+            return None
+        mtime_ns = stat(path.join(self.columnar_dir, COLUMNAR_INDEX)).st_mtime_ns
+        if self.columnar is None or self.columnar.mtime_ns != mtime_ns:
+            self.columnar = ColumnarDataset(self.columnar_dir)
+        return self.columnar
+
+    def get(self, symbol: str) -> HistoricalData:
+        """
+        Cached data of a symbol, raises KeyError when there is no data for it
+        """
+        file_path = self.file_path(symbol)
+        dataset = self.columnar_dataset()
+        if dataset is not None and symbol in dataset.groups:
+            mtime_ns = dataset.mtime_ns
+        else:
+            dataset = None
+            try:
+                mtime_ns = stat(file_path).st_mtime_ns
+            except FileNotFoundError:
+                raise KeyError(symbol)
+
+        with self.__lock:
+            data = self.cache.get(symbol)
+            if data is not None and data.mtime_ns == mtime_ns:
+                self.cache.move_to_end(symbol)
+                return data
+
+        columns = dataset.group(symbol) if dataset is not None else None
+        data = HistoricalData(symbol, file_path, mtime_ns, columns)
+        with self.__lock:
+            self.cache[symbol] = data
+            self.cache.move_to_end(symbol)
+            while len(self.cache) > self.max_symbols:
+                self.cache.popitem(last=False)
+        return data
+
+    def get_many(self, symbols: List[str]) -> Tuple[Dict[str, HistoricalData], List[str]]:
+        """
+        Cached data of several symbols, and the symbols without data
+        """
+        datas = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            try:
+                datas[symbol] = self.get(symbol)
+            except KeyError:
+                missing.append(symbol)
+        return datas, missing
+
+    def preload(self, symbols: list = None) -> None:
+        """
+        Load symbols (default: every symbol of the columnar dataset, else every
+        hist-<symbol>.csv in data_dir) at startup
+        """
+        dataset = self.columnar_dataset()
+        if symbols is None and dataset is not None:
+            symbols = list(dataset.groups)
+        if symbols is None:
+            symbols = [
+                name[len("hist-"):-len(".csv")] for name in sorted(listdir(self.data_dir))
+                if name.startswith("hist-") and name.endswith(".csv")
+            ]
+        for symbol in symbols[:self.max_symbols]:
+            self.get(symbol)
@@ -0,0 +1,343 @@
+"""
+Python: 3.7.9
+
+Technical indicators of the close price of every symbol
+
+SMA, EMA, RSI (Wilder), MACD and Bollinger bands, in two modes:
+- incremental: IndicatorEngine.update adds a batch of ticks in constant time per tick
+  (a small ring of the last WINDOW closes plus the EMA/RSI states per symbol),
+  vectorized over all the symbols of the batch
+- batch: compute() returns the full history of every indicator for a 2D array of closes
+  (symbols x time, left padded with NaN), windowed indicators vectorized over time
+
+IndicatorEngine.backfill seeds the incremental state from a batch run (ex: the daily
+closes of data/historical_data/hist-*.csv), ticks then continue the series.
+EMAs start at the first close, the RSI after RSI_PERIOD changes, SMA/Bollinger
+after their period. Values are NaN until then.
+"""
+from os import listdir, path
+from threading import Lock
+from typing import Dict, List
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+import pandas as pd
+from candles import minute_keys, rounds
+
+
+SMA_PERIOD = 20
+EMA_PERIOD = 20
+RSI_PERIOD = 14
+# fast, slow, signal
+MACD_PERIODS = (12, 26, 9)
+# period, number of standard deviations
+BOLLINGER = (20, 2.0)
+# Closes kept per symbol for the windowed indicators
+WINDOW = max(SMA_PERIOD, BOLLINGER[0])
+
+# Latest values of a symbol as published by the consumer
+INDICATOR_DTYPE = np.dtype([
+    ("symbol", "S8"),
+    ("count", "<i8"),           # closes seen
+    ("close", "<f8"),
+    ("sma", "<f8"),
+    ("ema", "<f8"),
+    ("rsi", "<f8"),
+    ("macd", "<f8"),
+    ("macd_signal", "<f8"),
+    ("macd_hist", "<f8"),
+    ("bb_upper", "<f8"),
+    ("bb_middle", "<f8"),
+    ("bb_lower", "<f8"),
+])
+VALUE_FIELDS = list(INDICATOR_DTYPE.names[2:])
+# EMA states: ema, macd fast, macd slow, macd signal
+EMA_STATES = {
+    "ema": EMA_PERIOD, "fast": MACD_PERIODS[0], "slow": MACD_PERIODS[1], "signal": MACD_PERIODS[2]
+}
+
+
+def ema_step(state: np.ndarray, values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Next EMA (alpha = 2 / (period + 1)), starts at the first value, NaN values are skipped
+    """
+    alpha = 2.0 / (period + 1)
+    return np.where(
+        np.isnan(state), values, np.where(np.isnan(values), state, state + alpha * (values - state))
+    )
+
+
+def rsi_step(gain: np.ndarray, loss: np.ndarray, changes: int, up: np.ndarray,
+             down: np.ndarray) -> tuple:
+    """
+    Wilder's RSI with this change being the `changes`-th (vectors): gain/loss are sums
+    up to RSI_PERIOD changes, their mean then, smoothed averages after.
+    Returns (gain, loss, rsi).
+    """
+    period = RSI_PERIOD
+    summing = changes <= period
+    gain = np.where(summing, gain + up, (gain * (period - 1) + up) / period)
+    loss = np.where(summing, loss + down, (loss * (period - 1) + down) / period)
+    first = changes == period
+    gain = np.where(first, gain / period, gain)
+    loss = np.where(first, loss / period, loss)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+    return gain, loss, np.where(changes >= period, rsi, np.nan)
+
+
+def compute(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Batch mode: closes (symbols x time, left padded with NaN) -> {field: symbols x time}
+    and the final incremental state under "state"
+    """
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    symbols, steps = closes.shape
+    out = {field: np.full((symbols, steps), np.nan) for field in VALUE_FIELDS}
+    out["close"] = closes.copy()
+
+    # Windowed indicators, vectorized over time: every window of `period` closes
+    def windows(period: int) -> np.ndarray:
+        if steps < period:
+            return np.zeros((symbols, 0, period))
+        stride_s, stride_t = closes.strides
+        return as_strided(
+            closes, (symbols, steps - period + 1, period), (stride_s, stride_t, stride_t),
+            writeable=False
+        )
+
+    out["sma"][:, SMA_PERIOD - 1:] = windows(SMA_PERIOD).mean(axis=2)
+    period, width = BOLLINGER
+    window = windows(period)
+    middle = window.mean(axis=2)
+    deviation = window.std(axis=2)
+    out["bb_middle"][:, period - 1:] = middle
+    out["bb_upper"][:, period - 1:] = middle + width * deviation
+    out["bb_lower"][:, period - 1:] = middle - width * deviation
+
+    # Recursive indicators, vectorized over symbols
+    emas = {name: np.full(symbols, np.nan) for name in EMA_STATES}
+    gain = np.zeros(symbols)
+    loss = np.zeros(symbols)
+    prev = np.full(symbols, np.nan)
+    counts = np.zeros(symbols, dtype=np.int64)
+    for step in range(steps):
+        values = closes[:, step]
+        valid = ~np.isnan(values)
+        for name, ema_period in EMA_STATES.items():
+            if name != "signal":
+                emas[name] = ema_step(emas[name], values, ema_period)
+        macd = emas["fast"] - emas["slow"]
+        emas["signal"] = ema_step(emas["signal"], np.where(valid, macd, np.nan), MACD_PERIODS[2])
+        out["ema"][:, step] = np.where(valid, emas["ema"], np.nan)
+        out["macd"][:, step] = np.where(valid, macd, np.nan)
+        out["macd_signal"][:, step] = np.where(valid, emas["signal"], np.nan)
+
+        change = values - prev
+        changed = valid & (counts > 0)
+        new_gain, new_loss, rsi = rsi_step(
+            gain, loss, counts, np.fmax(change, 0.0), np.fmax(-change, 0.0)
+        )
+        gain = np.where(changed, new_gain, gain)
+        loss = np.where(changed, new_loss, loss)
+        out["rsi"][:, step] = np.where(changed, rsi, np.nan)
+        prev = np.where(valid, values, prev)
+        counts += valid
+    out["macd_hist"] = out["macd"] - out["macd_signal"]
+    out["state"] = {"emas": emas, "gain": gain, "loss": loss, "prev": prev, "counts": counts}
+    return out
+
+
+class IndicatorEngine:
+    """
+    Incremental indicators of any number of symbols, latest values per symbol
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.symbols = []
+        self.index = {}
+        self.capacity = capacity
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.window = np.full((capacity, WINDOW), np.nan)
+        self.prev = np.full(capacity, np.nan)
+        self.gain = np.zeros(capacity)
+        self.loss = np.zeros(capacity)
+        self.emas = {name: np.full(capacity, np.nan) for name in EMA_STATES}
+        self.values = self.__empty_values(capacity)
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<IndicatorEngine(symbols={len(self.symbols)})>"
+
+    @staticmethod
+    def __empty_values(size: int) -> np.ndarray:
+        values = np.zeros(size, dtype=INDICATOR_DTYPE)
+        for field in VALUE_FIELDS:
+            values[field] = np.nan
+        return values
+
+    def __grow(self) -> None:
+        extra = self.capacity
+        self.capacity *= 2
+        self.counts = np.concatenate((self.counts, np.zeros(extra, dtype=np.int64)))
+        self.window = np.vstack((self.window, np.full((extra, WINDOW), np.nan)))
+        self.prev = np.concatenate((self.prev, np.full(extra, np.nan)))
+        self.gain = np.concatenate((self.gain, np.zeros(extra)))
+        self.loss = np.concatenate((self.loss, np.zeros(extra)))
+        for name, values in self.emas.items():
+            self.emas[name] = np.concatenate((values, np.full(extra, np.nan)))
+        self.values = np.concatenate((self.values, self.__empty_values(extra)))
+
+    def rows_of(self, symbols: List[bytes]) -> np.ndarray:
+        """
+        Symbols (bytes) -> rows, new symbols get a row
+        """
+        index = self.index
+        rows = [index.get(symbol) for symbol in symbols]
+        if None in rows:
+            rows = [index[symbol] if symbol in index else self.__add(symbol) for symbol in symbols]
+        return np.asarray(rows, dtype=np.int64)
+
+    def __add(self, symbol: bytes) -> int:
+        row = len(self.symbols)
+        if row == self.capacity:
+            self.__grow()
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        self.values["symbol"][row] = symbol
+        return row
+
+    def __step(self, rows: np.ndarray, closes: np.ndarray) -> None:
+        """
+        Add one close per row (rows must be unique)
+        """
+        counts = self.counts[rows] + 1
+        self.counts[rows] = counts
+        self.window[rows, (counts - 1) % WINDOW] = closes
+        values = self.values
+        values["count"][rows] = counts
+        values["close"][rows] = closes
+
+        # Last `period` closes of every row, oldest first
+        def last(period: int) -> np.ndarray:
+            slots = (counts[:, None] - period + np.arange(period)) % WINDOW
+            return self.window[rows[:, None], slots]
+
+        values["sma"][rows] = np.where(
+            counts >= SMA_PERIOD, last(SMA_PERIOD).mean(axis=1), np.nan
+        )
+        period, width = BOLLINGER
+        window = last(period)
+        ready = counts >= period
+        middle = np.where(ready, window.mean(axis=1), np.nan)
+        deviation = np.where(ready, window.std(axis=1), np.nan)
+        values["bb_middle"][rows] = middle
+        values["bb_upper"][rows] = middle + width * deviation
+        values["bb_lower"][rows] = middle - width * deviation
+
+        emas = self.emas
+        for name, ema_period in EMA_STATES.items():
+            if name != "signal":
+                emas[name][rows] = ema_step(emas[name][rows], closes, ema_period)
+        macd = emas["fast"][rows] - emas["slow"][rows]
+        emas["signal"][rows] = ema_step(emas["signal"][rows], macd, MACD_PERIODS[2])
+        values["ema"][rows] = emas["ema"][rows]
+        values["macd"][rows] = macd
+        values["macd_signal"][rows] = emas["signal"][rows]
+        values["macd_hist"][rows] = macd - emas["signal"][rows]
+
+        change = closes - self.prev[rows]
+        changed = counts > 1
+        gain, loss, rsi = rsi_step(
+            self.gain[rows], self.loss[rows], counts - 1,
+            np.fmax(change, 0.0), np.fmax(-change, 0.0)
+        )
+        self.gain[rows] = np.where(changed, gain, self.gain[rows])
+        self.loss[rows] = np.where(changed, loss, self.loss[rows])
+        values["rsi"][rows] = np.where(changed, rsi, np.nan)
+        self.prev[rows] = closes
+
+    def update(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Add the closes of a TICK_DTYPE batch (any symbols, any minutes).
+        Returns the latest values (INDICATOR_DTYPE) of the updated symbols.
+        """
+        batch = batch[~np.isnan(batch["close"])]
+        if not len(batch):
+            return self.__empty_values(0)
+        with self.__lock:
+            rows = self.rows_of(batch["symbol"].tolist())
+            order = np.lexsort((minute_keys(batch), rows))
+            rows, closes = rows[order], batch["close"][order]
+            for selected in rounds(rows):
+                self.__step(rows[selected], closes[selected])
+            return self.values[np.unique(rows)].copy()
+
+    def backfill(self, symbols: List[str], closes: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Batch mode over closes (symbols x time, left padded with NaN), seeds the
+        incremental state of the symbols. Returns the batch results (compute()).
+        """
+        result = compute(closes)
+        state = result["state"]
+        steps = closes.shape[1]
+        with self.__lock:
+            rows = self.rows_of([symbol.encode("ascii") for symbol in symbols])
+            counts = state["counts"]
+            self.counts[rows] = counts
+            self.prev[rows] = state["prev"]
+            self.gain[rows] = state["gain"]
+            self.loss[rows] = state["loss"]
+            for name, values in state["emas"].items():
+                self.emas[name][rows] = values
+            # The ring slot of the j-th close is j % WINDOW, the last closes are right aligned
+            for back in range(min(WINDOW, steps)):
+                position = counts - 1 - back
+                filled = position >= 0
+                self.window[rows[filled], position[filled] % WINDOW] = closes[filled, -1 - back]
+            for field in VALUE_FIELDS:
+                self.values[field][rows] = result[field][:, -1] if steps else np.nan
+            self.values["count"][rows] = counts
+        return result
+
+    def backfill_csv(self, data_dir: str) -> List[str]:
+        """
+        Backfill from the daily closes of every hist-<symbol>.csv in data_dir
+        """
+        series = {}
+        for fname in sorted(listdir(data_dir)):
+            if fname.startswith("hist-") and fname.endswith(".csv"):
+                df = pd.read_csv(path.join(data_dir, fname), index_col=0).sort_values("date")
+                series[fname[len("hist-"):-len(".csv")]] = df["close"].dropna().to_numpy()
+        if not series:
+            return []
+        steps = max(len(values) for values in series.values())
+        closes = np.full((len(series), steps), np.nan)
+        for row, values in enumerate(series.values()):
+            closes[row, steps - len(values):] = values
+        self.backfill(list(series), closes)
+        return list(series)
+
+    def upsert(self, values: np.ndarray) -> None:
+        """
+        Mirror latest values (INDICATOR_DTYPE) published by another engine
+        """
+        if not len(values):
+            return
+        with self.__lock:
+            rows = self.rows_of(values["symbol"].tolist())
+            self.values[rows] = values
+
+    def latest(self, symbol: str) -> dict:
+        """
+        Latest values of a symbol ({field: value}, NaN as None), None when unknown
+        """
+        with self.__lock:
+            row = self.index.get(symbol.encode("ascii"))
+            if row is None:
+                return None
+            values = self.values[row]
+            latest = {"count": int(values["count"])}
+            for field in VALUE_FIELDS:
+                value = float(values[field])
+                latest[field] = None if np.isnan(value) else value
+            return latest
@@ -5,55 +5,60 @@ Python: 3.7.9
 
 AWS Kinesis Stream Producer and Consumer API using boto3
 """
-from os import getenv
-from json import dumps, loads
-from typing import List, Any
+import asyncio
+from json import dumps
+from typing import Any, Dict, List, Tuple
 from datetime import datetime, timedelta, date, time
-from boto3 import Session as BotoSession
+from random import random
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from aws_clients import get_client, run_async
+from polling import PollScheduler, is_throttled
+import metrics
+import wire_format
+
+
+# Kinesis PutRecords limits
+MAX_RECORDS_PER_PUT = 500
+MAX_BYTES_PER_PUT = 5 * 1024 * 1024
+# Data blob + partition key of a single record
+MAX_RECORD_BYTES = 1024 * 1024
+
+# DynamoDB BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_WRITE_LIMIT = 25
+# Backoff (seconds) for retrying UnprocessedItems of BatchWriteItem
+BATCH_WRITE_BACKOFF_BASE = 0.05
+BATCH_WRITE_BACKOFF_CAP = 5.0
+
+# Latency and errors of every AWS call (metrics.OPERATION_SECONDS)
+PUT_RECORD = metrics.operation("put_record")
+PUT_RECORDS = metrics.operation("put_records")
+GET_RECORDS = metrics.operation("get_records")
+PUT_ITEM = metrics.operation("put_item")
+BATCH_WRITE_ITEM = metrics.operation("batch_write_item")
+GET_ITEM = metrics.operation("get_item")
+SCAN = metrics.operation("scan")
+QUERY = metrics.operation("query")
 
 
 class KinesisAPI:
-    def __init__(self, stream_name: str):
+    def __init__(self, stream_name: str, client: Any = None):
+        """
+        client : Optional pre-built Kinesis client (ex: local stand-in).
+                 When not given, the shared client of aws_clients is used.
+        """
         if not stream_name:
             raise ValueError("! Stream name (stream_name) is requied !")
         self.stream_name = stream_name
 
-        # Get AWS Access Keys from Environment Varibales
-        self.__access_key_id = getenv("AWS_ACCESS_KEY_ID")
-        self.__secret_access_key = getenv("AWS_SECRET_ACCESS_KEY")
-        self.__region = getenv("AWS_REGION_NAME")
-
-        if self.__access_key_id is None:
-            raise ValueError(
-                "! AWS_ACCESS_KEY_ID was not found/not set in environment variables. !"
-            )
-
-        if self.__secret_access_key is None:
-            raise ValueError(
-                "! AWS_SECRET_ACCESS_KEY was not found/not set in environment variables. !"
-            )
-
-        if self.__region is None:
-            raise ValueError(
-                "! AWS_REGION_NAME was not found/not set in environment variables. !"
-            )
-
-        # Creating a boto3 session, connect to AWS
-        self.session = BotoSession(
-            aws_access_key_id=self.__access_key_id,
-            aws_secret_access_key=self.__secret_access_key,
-            region_name=self.__region
-        )
-
-        # Get the kinesis client
-        self.client = self.session.client("kinesis")
+        # Shared, pooled boto3 client unless a client is given
+        self.client = client if client is not None else get_client("kinesis")
 
-        # Get shard IDs
+        # Get shard IDs (all shards, including closed parents and children of resharding)
         self.shard_ids = None
-        stream = self.client.describe_stream(StreamName=self.stream_name)
         try:
-            shards = stream["StreamDescription"]["Shards"]
-            self.shard_ids = [shard["ShardId"] for shard in shards]
+            self.shard_ids = [shard["ShardId"] for shard in self.list_shards()]
             _ = self.shard_ids[0]
         except Exception as err:
             print("! Failed to get Shard ID's !")
@@ -71,47 +76,102 @@ class KinesisAPI:
     def __str__(self) -> str:
         return f"<KinesisAPI(stream_name='{self.stream_name}', shard_ids={self.shard_ids})>"
 
+    def list_shards(self) -> List[dict]:
+        """
+        List every shard of the stream (follows NextToken pagination)
+
+        Closed parent shards and the child shards created by resharding (split/merge)
+        are all returned. Each shard is a dict with ShardId, ParentShardId,
+        AdjacentParentShardId, HashKeyRange and SequenceNumberRange.
+        """
+        shards = []
+        resp = self.client.list_shards(StreamName=self.stream_name)
+        shards.extend(resp.get("Shards", []))
+        while resp.get("NextToken"):
+            # StreamName must not be passed along with NextToken
+            resp = self.client.list_shards(NextToken=resp["NextToken"])
+            shards.extend(resp.get("Shards", []))
+        return shards
+
+    @staticmethod
+    def encode_data(data: Any) -> bytes:
+        """
+        Serialize a record's data for Kinesis (bytes are sent as is, anything else as JSON)
+        """
+        if isinstance(data, (bytes, bytearray)):
+            return bytes(data)
+        return dumps(data).encode("utf-8")
+
     def write_record(self, data: Any, partition_key: str) -> dict:
         """
         Writes a single data record into an Amazon Kinesis data stream
         """
         try:
-            return self.client.put_record(
-                StreamName=self.stream_name,
-                Data=dumps(data),
-                PartitionKey=f"{partition_key}"
-            )
+            with PUT_RECORD.time():
+                return self.client.put_record(
+                    StreamName=self.stream_name,
+                    Data=self.encode_data(data),
+                    PartitionKey=f"{partition_key}"
+                )
+        except Exception as err:
+            print(f"! Failed to write data to stream: {self.stream_name} !")
+            raise err
+
+    def put_records(self, records: List[dict]) -> dict:
+        """
+        Single PutRecords call for already encoded entries
+        [{"Data": b"...", "PartitionKey": "AAPL"}, ...]
+
+        Response has FailedRecordCount and one result per entry in Records, failed
+        entries carry an ErrorCode (ex: ProvisionedThroughputExceededException).
+        """
+        if len(records) > MAX_RECORDS_PER_PUT:
+            raise ValueError(f"! Number of records exceeded limit({MAX_RECORDS_PER_PUT}) !")
+        try:
+            with PUT_RECORDS.time():
+                return self.client.put_records(
+                    StreamName=self.stream_name,
+                    Records=records
+                )
         except Exception as err:
             print(f"! Failed to write data to stream: {self.stream_name} !")
             raise err
 
-    def write_records(self, data: List[Any], partition_key: str) -> None:
+    def write_records(self, data: List[Any], partition_key: Any) -> dict:
         """
         Writes multiple data records into a Kinesis data stream in a single call
         Limit: 500 records in 'data'
+
+        partition_key is either one key for all records or a list with one key per record.
+        Use kinesis_writer.BufferedKinesisWriter for size aware batching and retries.
         """
-        if len(data) > 500:
-            raise ValueError("! Number of records in data exceeded limit(500) !")
+        if isinstance(partition_key, str):
+            partition_keys = [partition_key] * len(data)
+        else:
+            partition_keys = list(partition_key)
+        if len(partition_keys) != len(data):
+            raise ValueError("! Number of partition keys does not match number of records !")
 
         records = [
-            {"Data": dumps(ele), "PartitionKey": partition_key} for ele in data
+            {"Data": self.encode_data(ele), "PartitionKey": f"{key}"}
+            for ele, key in zip(data, partition_keys)
         ]
-        try:
-            return self.client.put_record(
-                StreamName=self.stream_name,
-                Records=records
-            )
-        except Exception as err:
-            print(f"! Failed to write data to stream: {self.stream_name} !")
-            raise err
+        return self.put_records(records)
 
     def set_shard_iterator_type(self, iterator_type: str) -> None:
         self.iterator_type = iterator_type
 
-    def get_shard_iterator(self, iterator_type: str = None, sequence_number: str = None) -> str:
+    def get_shard_iterator(
+        self,
+        iterator_type: str = None,
+        sequence_number: str = None,
+        shard_id: str = None
+    ) -> str:
         """
         Get the first shard iterator for get_records
 
+        param shard_id (str): Shard to read, defaults to the first shard of the stream
+
         param iterator_type (str): Iterator type
 
         AFTER_SEQUENCE_NUMBER : Start reading right after the position denoted by a specific
@@ -131,18 +191,20 @@ class KinesisAPI:
             else:
                 iterator_type = "TRIM_HORIZON"
         self.iterator_type = iterator_type
+        if not shard_id:
+            shard_id = self.shard_ids[0]
         try:
             if iterator_type == "AFTER_SEQUENCE_NUMBER":
                 iter_resp = self.client.get_shard_iterator(
                     StreamName=self.stream_name,
-                    ShardId=self.shard_ids[0],
+                    ShardId=shard_id,
                     ShardIteratorType=iterator_type,
                     StartingSequenceNumber=sequence_number
                 )
             else:
                 iter_resp = self.client.get_shard_iterator(
                     StreamName=self.stream_name,
-                    ShardId=self.shard_ids[0],
+                    ShardId=shard_id,
                     ShardIteratorType=iterator_type
                 )
             iter_resp["ShardIterator"]
@@ -152,110 +214,147 @@ class KinesisAPI:
         else:
             return iter_resp["ShardIterator"]
 
+    def decode_record(self, record: dict) -> dict:
+        """
+        Deserialize a raw Kinesis record into {"data": ..., "sequence_number": ...}
+
+        Binary tick batches (wire_format) are decoded into a NumPy record array,
+        anything else is read as JSON.
+        """
+        decoded = {
+            "sequence_number": record["SequenceNumber"],
+            "partition_key": record.get("PartitionKey"),
+            "arrival_timestamp": record.get("ApproximateArrivalTimestamp")
+        }
+        try:
+            decoded["data"] = wire_format.decode_data(record["Data"])
+            if wire_format.is_binary(record["Data"]):
+                # When the producer created the batch, and its trace id (symbol/batch)
+                header = wire_format.decode_header(record["Data"])
+                decoded["produced_at"] = header["created_at"]
+                decoded["trace_id"] = f"{decoded['partition_key']}/{header['batch_id']}"
+        except Exception as err:
+            print(f"[WARN] Error deserializing record's data: {err}")
+            decoded["data"] = record["Data"]
+        return decoded
+
+    def fetch_records(self, shard_iterator: str, records_limit: int = 5000) -> dict:
+        """
+        Single GetRecords call for a shard iterator
+
+        Returns decoded records, the next shard iterator (None when the shard is closed
+        and fully read) and how far behind the tip of the stream the iterator is.
+        """
+        with GET_RECORDS.time():
+            record_resp = self.client.get_records(
+                ShardIterator=shard_iterator,
+                Limit=records_limit
+            )
+        return {
+            "records": [self.decode_record(record) for record in record_resp["Records"]],
+            "next_shard_iterator": record_resp.get("NextShardIterator"),
+            "millis_behind_latest": record_resp.get("MillisBehindLatest", 0)
+        }
+
     def read_records(
         self,
         time_limit: float,
         shard_iterator: str = None,
         records_limit: int = 5000,
-        debug: bool = False
+        debug: bool = False,
+        shard_id: str = None
     ) -> dict:
         """
         Gets data records from a Kinesis data stream's shard.
 
         time_limit: Time in MINUTES to keep scanning for records
+        shard_id: Shard to read when shard_iterator is not given (default: first shard)
+                  Use shard_consumer.ShardConsumer to read all shards in parallel.
+
+        Reads are paced by a polling.PollScheduler: empty reads back off, at most
+        5 reads per second, throttled reads are retried after a jittered backoff.
         """
         # Calculate end time
         end_time = datetime.now() + timedelta(minutes=time_limit)
 
         if not shard_iterator:
-            shard_iterator = self.get_shard_iterator()
+            shard_iterator = self.get_shard_iterator(shard_id=shard_id)
 
+        scheduler = PollScheduler()
+        delay = 0.0
         while True:
+            scheduler.wait(delay, sleep)
             try:
                 # Get data
-                record_resp = self.client.get_records(
-                    ShardIterator=shard_iterator,
-                    Limit=records_limit
-                )
-                # Only run for a certain amount of time.
-                # Stop looping if no data returned. This means it's done
-                now = datetime.now()
-
-                if debug:
-                    print("")
-                    print(f"[read_records] ShardIterator: {shard_iterator}")
-                    print(f"[read_records][{now.strftime('%Y-%m-%d %H:%M:%S')}] {record_resp}")
-                    print("")
-
-                if end_time < now or not record_resp:
-                    break
-                # yield data to outside calling iterator
-                for record in record_resp["Records"]:
-                    self.last_sequence_number = record["SequenceNumber"]
-                    try:
-                        yield {
-                            "data": loads(record["Data"]),
-                            "sequence_number": self.last_sequence_number
-                        }
-                    except Exception as err:
-                        print(f"[WARN] Error deserializing record's data: {err}")
-                        yield {
-                            "data": record["Data"],
-                            "sequence_number": self.last_sequence_number
-                        }
-                # Get next iterator for shard from previous request
-                shard_iterator = record_resp["NextShardIterator"]
+                with GET_RECORDS.time():
+                    record_resp = self.client.get_records(
+                        ShardIterator=shard_iterator,
+                        Limit=records_limit
+                    )
             except Exception as err:
+                if is_throttled(err) and datetime.now() < end_time:
+                    delay = scheduler.after_error(err)
+                    continue
                 print(f"! Error getting records from stream: {self.stream_name} !")
                 print(err, "\n")
                 break
+            # Only run for a certain amount of time.
+            # Stop looping if no data returned. This means it's done
+            now = datetime.now()
 
-    def close(self):
-        self.__del__()
+            if debug:
+                print("")
+                print(f"[read_records] ShardIterator: {shard_iterator}")
+                print(f"[read_records][{now.strftime('%Y-%m-%d %H:%M:%S')}] {record_resp}")
+                print("")
+
+            if end_time < now or not record_resp:
+                break
+            # yield data to outside calling iterator
+            for record in record_resp["Records"]:
+                self.last_sequence_number = record["SequenceNumber"]
+                yield self.decode_record(record)
+            # Get next iterator for shard from previous request
+            shard_iterator = record_resp.get("NextShardIterator")
+            if not shard_iterator:
+                # Shard was closed by resharding and is fully read
+                break
+            delay = scheduler.after_read(
+                len(record_resp["Records"]), record_resp.get("MillisBehindLatest", 0)
+            )
+            # Never sleep past the time limit
+            delay = min(delay, max(0.0, (end_time - datetime.now()).total_seconds()))
+
+    async def write_record_async(self, data: Any, partition_key: str) -> dict:
+        return await run_async(self.write_record, data, partition_key)
+
+    async def put_records_async(self, records: List[dict]) -> dict:
+        return await run_async(self.put_records, records)
+
+    async def fetch_records_async(self, shard_iterator: str, records_limit: int = 5000) -> dict:
+        return await run_async(self.fetch_records, shard_iterator, records_limit)
 
-    def __del__(self):
-        self.__access_key_id = None
-        self.__secret_access_key = None
-        self.__region = None
+    def close(self):
+        # The shared client stays open for the other users of aws_clients
         self.client = None
-        self.session = None
 
 
 class DynamoDbAPI():
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, client: Any = None, batch_workers: int = 4):
+        """
+        client        : Optional pre-built DynamoDB client (ex: local stand-in).
+                        When not given, the shared client of aws_clients is used.
+        batch_workers : Max number of BatchWriteItem chunks written (or queries run) in parallel
+        """
         if not table_name:
             raise ValueError("! DynamoDB Table Name is requied !")
         self.table_name = table_name
+        self.batch_workers = max(1, batch_workers)
+        self.__executor = None
+        self.__key_schema = None
 
-        # Get AWS Access Keys from Environment Varibales
-        self.__access_key_id = getenv("AWS_ACCESS_KEY_ID")
-        self.__secret_access_key = getenv("AWS_SECRET_ACCESS_KEY")
-        self.__region = getenv("AWS_REGION_NAME")
-
-        if self.__access_key_id is None:
-            raise ValueError(
-                "! AWS_ACCESS_KEY_ID was not found/not set in environment variables. !"
-            )
-
-        if self.__secret_access_key is None:
-            raise ValueError(
-                "! AWS_SECRET_ACCESS_KEY was not found/not set in environment variables. !"
-            )
-
-        if self.__region is None:
-            raise ValueError(
-                "! AWS_REGION_NAME was not found/not set in environment variables. !"
-            )
-
-        # Creating a boto3 session, connect to AWS
-        self.session = BotoSession(
-            aws_access_key_id=self.__access_key_id,
-            aws_secret_access_key=self.__secret_access_key,
-            region_name=self.__region
-        )
-
-        # Create a DynamoDB client from session
-        self.db = self.session.client("dynamodb")
+        # Shared, pooled boto3 client unless a client is given
+        self.db = client if client is not None else get_client("dynamodb")
 
         # Check if table exists
         assert self.table_name in self.db.list_tables().get("TableNames"), (
@@ -265,6 +364,18 @@ class DynamoDbAPI():
     def __str__(self) -> str:
         return f"<DynamoDbAPI(table_name='{self.table_name}')>"
 
+    @property
+    def key_schema(self) -> List[str]:
+        """
+        Key attribute names of the table (partition key, then sort key), from DescribeTable
+        """
+        if self.__key_schema is None:
+            keys = self.db.describe_table(TableName=self.table_name)["Table"]["KeySchema"]
+            self.__key_schema = [
+                key["AttributeName"] for key in sorted(keys, key=lambda key: key["KeyType"])
+            ]
+        return self.__key_schema
+
     def __get_mapped_data(self, data) -> dict:
         if isinstance(data, (str, date, time, datetime)):
             return {"S": str(data)}
@@ -294,18 +405,122 @@ class DynamoDbAPI():
             item[key] = self.__get_mapped_data(val)
         return item
 
+    def prepare_items(self, records: np.ndarray, columns: List[str] = None) -> List[dict]:
+        """
+        Prepare Items from a wire_format record array, column by column
+        NaN numbers are left out of the item (DynamoDB does not store NaN)
+        """
+        columns = columns or list(records.dtype.names)
+        typed_columns = []
+        for column in columns:
+            values = records[column]
+            if column == "minute":
+                typed = [{"S": val} for val in wire_format.format_minutes(values)]
+            elif column == "date":
+                typed = [{"S": val} for val in wire_format.format_dates(values)]
+            elif values.dtype.kind == "S":
+                typed = [{"S": val.decode("utf-8")} for val in values.tolist()]
+            else:
+                typed = [{"N": str(val)} for val in values.tolist()]
+                if values.dtype.kind == "f":
+                    for idx in np.flatnonzero(np.isnan(values)).tolist():
+                        typed[idx] = None
+            typed_columns.append(typed)
+        return [
+            {column: val for column, val in zip(columns, row) if val is not None}
+            for row in zip(*typed_columns)
+        ]
+
     def put(self, data: dict) -> dict:
         """
         Put data into DynamoDB Table
         """
         item = self.prepare_item(data)
-        resp = self.db.put_item(TableName=self.table_name, Item=item)
+        with PUT_ITEM.time():
+            resp = self.db.put_item(TableName=self.table_name, Item=item)
         resp = {}
         return {
             "request_id": resp.get("ResponseMetadata", {}).get("RequestId"),
             "status_code": resp.get("ResponseMetadata", {}).get("HTTPStatusCode")
         }
 
+    def __write_chunk(self, requests: List[dict], max_retries: int) -> int:
+        """
+        Write one chunk (<= 25 requests) with BatchWriteItem.
+        UnprocessedItems are retried with exponential backoff and full jitter.
+
+        Returns the number of retries needed to write the chunk.
+        """
+        retries = 0
+        while requests:
+            with BATCH_WRITE_ITEM.time():
+                resp = self.db.batch_write_item(RequestItems={self.table_name: requests})
+            requests = resp.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not requests:
+                break
+            retries += 1
+            if retries > max_retries:
+                raise RuntimeError(
+                    f"! Failed to write {len(requests)} items to table: {self.table_name} "
+                    f"after {max_retries} retries !"
+                )
+            backoff = min(BATCH_WRITE_BACKOFF_CAP, BATCH_WRITE_BACKOFF_BASE * 2 ** retries)
+            sleep(backoff * random())
+        return retries
+
+    def __batch_chunks(self, data: Any, columns: List[str] = None) -> Tuple[int, List[list]]:
+        """
+        Number of items of data and the PutRequest chunks (<= 25) writing them, one
+        request per key (the last item of a key wins)
+        """
+        if isinstance(data, np.ndarray):
+            items = self.prepare_items(data, columns)
+        else:
+            items = [self.prepare_item(row) for row in data if row]
+        key_schema = self.key_schema
+        unique = {}
+        for item in items:
+            unique[tuple(tuple(item.get(key, {}).items()) for key in key_schema)] = item
+        requests = [{"PutRequest": {"Item": item}} for item in unique.values()]
+        return len(items), [
+            requests[idx:idx + BATCH_WRITE_LIMIT]
+            for idx in range(0, len(requests), BATCH_WRITE_LIMIT)
+        ]
+
+    def put_batch(self, data: Any, max_retries: int = 8, columns: List[str] = None) -> dict:
+        """
+        Put multiple items into DynamoDB Table using BatchWriteItem
+
+        data is a list of dicts or a wire_format record array (only `columns` are stored).
+        Items with the same key are deduplicated, the last one wins: BatchWriteItem rejects
+        a request with duplicate keys and the chunks of a batch are written in any order.
+        Items are grouped into chunks of 25 (BatchWriteItem limit) and the chunks are
+        written in parallel on a bounded thread pool (batch_workers threads).
+        """
+        items, chunks = self.__batch_chunks(data, columns)
+        if len(chunks) <= 1 or self.batch_workers == 1:
+            retries = [self.__write_chunk(chunk, max_retries) for chunk in chunks]
+        else:
+            retries = list(self.__get_executor().map(
+                lambda chunk: self.__write_chunk(chunk, max_retries), chunks
+            ))
+
+        written = sum(len(chunk) for chunk in chunks)
+        return {
+            "items": written,
+            "duplicates": items - written,
+            "chunks": len(chunks),
+            "retries": sum(retries)
+        }
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.batch_workers,
+                thread_name_prefix="dynamodb-batch"
+            )
+        return self.__executor
+
     def get(self, key: dict) -> dict:
         """
         Get item for a particular key from DynamoDB table
@@ -317,7 +532,8 @@ class DynamoDbAPI():
         Have to use this: {"symbol": "AAPL", "minute": "09:32"}
         """
         item_key = self.prepare_item(key)
-        resp = self.db.get_item(TableName=self.table_name, Key=item_key)
+        with GET_ITEM.time():
+            resp = self.db.get_item(TableName=self.table_name, Key=item_key)
         return {
             "request_id": resp.get("ResponseMetadata", {}).get("RequestId"),
             "status_code": resp.get("ResponseMetadata", {}).get("HTTPStatusCode"),
@@ -359,13 +575,139 @@ class DynamoDbAPI():
             kwargs["FilterExpression"] = filter
             kwargs["ExpressionAttributeValues"] = expr_attr_map
 
-        resp = self.db.scan(**kwargs)
+        return self.__paginate(self.db.scan, kwargs, SCAN)
+
+    def __paginate(self, operation: Any, kwargs: dict, op_metrics: metrics.Operation) -> dict:
+        """
+        Call scan/query until LastEvaluatedKey is exhausted (every page is 1 MB max)
+        """
+        items = []
+        pages = 0
+        while True:
+            with op_metrics.time():
+                resp = operation(**kwargs)
+            pages += 1
+            items.extend(resp.get("Items", []))
+            last_key = resp.get("LastEvaluatedKey")
+            if not last_key:
+                break
+            kwargs["ExclusiveStartKey"] = last_key
         return {
             "request_id": resp.get("ResponseMetadata", {}).get("RequestId"),
             "status_code": resp.get("ResponseMetadata", {}).get("HTTPStatusCode"),
-            "items": resp.get("Items")
+            "items": items,
+            "pages": pages
+        }
+
+    def query(
+        self,
+        partition_key: str,
+        partition_value: Any,
+        sort_key: str = None,
+        since: Any = None,
+        projection_expr: str = None,
+        expr_attr_names: dict = None
+    ) -> dict:
+        """
+        Get the items of one partition key value from DynamoDB table, sorted by sort key
+        Only items with sort key > since are returned when since is given.
+
+        Ex:
+        query(
+            "symbol", "AAPL", sort_key="minute", since="09:45",
+            projection_expr="symbol, #m, #o",
+            expr_attr_names={"#m": "minute", "#o": "open"}
+        )
+        """
+        attr_names = {"#pk": partition_key}
+        attr_values = {":pk": self.__get_mapped_data(partition_value)}
+        key_condition = "#pk = :pk"
+        if since is not None:
+            if not sort_key:
+                raise ValueError("! sort_key is required to query with since !")
+            attr_names["#sk"] = sort_key
+            attr_values[":since"] = self.__get_mapped_data(since)
+            key_condition += " AND #sk > :since"
+
+        kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": key_condition,
+            "ExpressionAttributeValues": attr_values,
+        }
+        if projection_expr:
+            kwargs["ProjectionExpression"] = projection_expr
+            attr_names.update(expr_attr_names or {})
+        kwargs["ExpressionAttributeNames"] = attr_names
+
+        return self.__paginate(self.db.query, kwargs, QUERY)
+
+    def query_many(
+        self,
+        partition_key: str,
+        partition_values: List[Any],
+        sort_key: str = None,
+        since: Dict[Any, Any] = None,
+        projection_expr: str = None,
+        expr_attr_names: dict = None
+    ) -> Dict[Any, dict]:
+        """
+        query() of several partition key values in parallel (batch_workers at a time),
+        returns {partition value: query response}. since maps a value to its `since`.
+
+        Ex:
+        query_many("symbol", ["AAPL", "MSFT"], sort_key="minute", since={"AAPL": "09:45"})
+        """
+        since = since or {}
+
+        def query(value):
+            return self.query(
+                partition_key, value, sort_key=sort_key, since=since.get(value),
+                projection_expr=projection_expr, expr_attr_names=expr_attr_names
+            )
+
+        values = list(dict.fromkeys(partition_values))
+        if len(values) <= 1 or self.batch_workers == 1:
+            return {value: query(value) for value in values}
+        return dict(zip(values, self.__get_executor().map(query, values)))
+
+    async def put_async(self, data: dict) -> dict:
+        return await run_async(self.put, data)
+
+    async def put_batch_async(
+        self, data: Any, max_retries: int = 8, columns: List[str] = None
+    ) -> dict:
+        """
+        put_batch with every chunk in flight at once (one BatchWriteItem call per chunk),
+        deduplicated the same way
+        """
+        items, chunks = self.__batch_chunks(data, columns)
+        retries = await asyncio.gather(*[
+            run_async(self.__write_chunk, chunk, max_retries) for chunk in chunks
+        ])
+        written = sum(len(chunk) for chunk in chunks)
+        return {
+            "items": written,
+            "duplicates": items - written,
+            "chunks": len(chunks),
+            "retries": sum(retries)
         }
 
+    async def get_async(self, key: dict) -> dict:
+        return await run_async(self.get, key)
+
+    async def query_async(self, partition_key: str, partition_value: Any, **kwargs) -> dict:
+        """
+        query() on the shared thread pool, same keyword arguments
+        """
+        return await run_async(self.query, partition_key, partition_value, **kwargs)
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+        # The shared client stays open for the other users of aws_clients
+        self.db = None
+
 
 if __name__ == "__main__":
     print("TEST")
@@ -0,0 +1,230 @@
+"""
+Python: 3.7.9
+
+Buffered, size aware Kinesis PutRecords writer for the producer
+
+Records are aggregated in memory and written with PutRecords when the buffer reaches
+500 records, 5 MB or when the oldest buffered record has waited for `linger` seconds.
+Only the entries that failed in a PutRecords response are retried.
+
+PutRecords and the retry sleeps run outside of the buffer lock, so put() keeps buffering
+while a batch is written. Records that could not be written go back to the front of the
+buffer; the error of a failed background flush is raised by the next put(). The buffer can
+then hold more than one call's worth of records: a flush writes it in batches of at most
+max_records / max_bytes.
+"""
+import logging
+from random import random
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from typing import Any, List, Optional, Tuple
+from kinesis_api import KinesisAPI, MAX_RECORDS_PER_PUT, MAX_BYTES_PER_PUT, MAX_RECORD_BYTES
+
+
+logger = logging.getLogger(__name__)
+
+# Backoff (seconds) for retrying the failed entries of PutRecords
+RETRY_BACKOFF_BASE = 0.05
+RETRY_BACKOFF_CAP = 2.0
+
+
+def _record_size(record: dict) -> int:
+    return len(record["Data"]) + len(record["PartitionKey"].encode("utf-8"))
+
+
+class BufferedKinesisWriter:
+    def __init__(
+        self,
+        api: KinesisAPI,
+        linger: float = 0.1,
+        max_records: int = MAX_RECORDS_PER_PUT,
+        max_bytes: int = MAX_BYTES_PER_PUT,
+        max_retries: int = 8
+    ):
+        """
+        linger      : Max seconds a record waits in the buffer before it is flushed
+        max_records : Flush when this many records are buffered (<= 500)
+        max_bytes   : Flush when the buffered records reach this size (<= 5 MB)
+        """
+        self.api = api
+        self.linger = linger
+        self.max_records = min(max_records, MAX_RECORDS_PER_PUT)
+        self.max_bytes = min(max_bytes, MAX_BYTES_PER_PUT)
+        self.max_retries = max_retries
+
+        self.stats = {"records": 0, "bytes": 0, "calls": 0, "retried_records": 0}
+
+        self.__buffer = []
+        self.__buffer_bytes = 0
+        self.__deadline = None
+        self.__closed = False
+        self.__error = None
+        self.__cond = Condition()
+        # Held while a batch is written, keeps the batches in order
+        self.__send_lock = Lock()
+        self.__flusher = Thread(target=self.__linger_loop, name="kinesis-writer", daemon=True)
+        self.__flusher.start()
+
+    def __str__(self) -> str:
+        return (
+            f"<BufferedKinesisWriter(stream_name='{self.api.stream_name}', "
+            f"linger={self.linger}, max_records={self.max_records}, max_bytes={self.max_bytes})>"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, data: Any, partition_key: str) -> None:
+        """
+        Buffer a record. Blocks to flush when the buffer is full.
+        """
+        blob = self.api.encode_data(data)
+        partition_key = f"{partition_key}"
+        size = len(blob) + len(partition_key.encode("utf-8"))
+        if size > MAX_RECORD_BYTES:
+            raise ValueError(
+                f"! Record of {size} bytes exceeds the Kinesis record limit({MAX_RECORD_BYTES}) !"
+            )
+
+        record = {"Data": blob, "PartitionKey": partition_key}
+        while True:
+            with self.__cond:
+                if self.__error is not None:
+                    error, self.__error = self.__error, None
+                    raise error
+                if self.__closed:
+                    raise ValueError("! Writer is closed !")
+                if not self.__buffer or (
+                    len(self.__buffer) < self.max_records
+                    and self.__buffer_bytes + size <= self.max_bytes
+                ):
+                    self.__buffer.append(record)
+                    self.__buffer_bytes += size
+                    if self.__deadline is None:
+                        self.__deadline = monotonic() + self.linger
+                        self.__cond.notify()
+                    full = (
+                        len(self.__buffer) >= self.max_records
+                        or self.__buffer_bytes >= self.max_bytes
+                    )
+                    break
+            # No room for the record
+            self.__flush()
+        if full:
+            self.__flush()
+
+    def flush(self) -> None:
+        self.__flush()
+
+    def close(self) -> None:
+        """
+        Stop accepting records and write the buffered ones. When they cannot be written
+        the error is raised and they stay buffered, close() can be called again.
+        """
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify()
+        self.__flusher.join()
+        self.__flush()
+
+    def __take(self) -> Tuple[List[dict], int]:
+        """
+        Remove the records of the next PutRecords call from the front of the buffer (at
+        most max_records / max_bytes), returns them and their size. Call it under the
+        buffer lock.
+        """
+        count = 0
+        size = 0
+        for record in self.__buffer:
+            record_size = _record_size(record)
+            if count and (count >= self.max_records or size + record_size > self.max_bytes):
+                break
+            count += 1
+            size += record_size
+        records = self.__buffer[:count]
+        del self.__buffer[:count]
+        self.__buffer_bytes -= size
+        if not self.__buffer:
+            self.__deadline = None
+        return records, size
+
+    def __flush(self) -> None:
+        """
+        Write the records buffered when called, in batches. Stops at the first batch that
+        cannot be written (its failed records go back to the front) and raises the error.
+        """
+        with self.__cond:
+            remaining = len(self.__buffer)
+        while remaining > 0:
+            with self.__send_lock:
+                with self.__cond:
+                    records, size = self.__take()
+                if not records:
+                    return
+                remaining -= len(records)
+                failed, error = self.__send(records)
+                failed_size = sum(_record_size(record) for record in failed)
+                with self.__cond:
+                    self.stats["records"] += len(records) - len(failed)
+                    self.stats["bytes"] += size - failed_size
+                    if failed:
+                        self.__buffer[:0] = failed
+                        self.__buffer_bytes += failed_size
+                        if self.__deadline is None and not self.__closed:
+                            self.__deadline = monotonic() + self.linger
+                            self.__cond.notify()
+            if error is not None:
+                raise error
+
+    def __send(self, records: List[dict]) -> Tuple[List[dict], Optional[Exception]]:
+        """
+        Returns the records not written and the error, ([], None) when all were written
+        """
+        retries = 0
+        while True:
+            try:
+                resp = self.api.put_records(records)
+            except Exception as err:
+                return records, err
+            self.stats["calls"] += 1
+            if not resp.get("FailedRecordCount"):
+                return [], None
+            # Retry only the entries which failed (throttled/internal failure)
+            records = [
+                record for record, result in zip(records, resp["Records"])
+                if result.get("ErrorCode")
+            ]
+            retries += 1
+            if retries > self.max_retries:
+                return records, RuntimeError(
+                    f"! Failed to write {len(records)} records to stream: "
+                    f"{self.api.stream_name} after {self.max_retries} retries !"
+                )
+            self.stats["retried_records"] += len(records)
+            sleep(min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** retries) * random())
+
+    def __linger_loop(self) -> None:
+        while True:
+            with self.__cond:
+                while not self.__closed:
+                    if self.__deadline is None:
+                        self.__cond.wait()
+                        continue
+                    remaining = self.__deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__cond.wait(remaining)
+                if self.__closed:
+                    return
+            try:
+                self.__flush()
+            except Exception as err:
+                logger.warning(
+                    "Failed to flush records to stream: %s, retrying: %s",
+                    self.api.stream_name, err
+                )
+                with self.__cond:
+                    self.__error = err
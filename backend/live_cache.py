@@ -0,0 +1,174 @@
+"""
+Python: 3.7.9
+
+Live minute series of the symbols: a TimeSeriesStore in front of DynamoDB
+"""
+from threading import Lock, RLock
+from typing import Dict, List, Tuple
+from kinesis_api import DynamoDbAPI
+from timeseries_store import TimeSeriesStore
+import numpy as np
+import wire_format
+
+
+# Item attributes -> TICK_DTYPE fields read from DynamoDB
+DB_FIELDS = ["open", "high", "low", "close", "volume"]
+# Item attribute of the date ("YYYY-MM-DD", consumer.DB_COLUMNS)
+DB_DATE = "date"
+
+
+class LiveDataCache:
+    """
+    Serves the live series of the symbols from a TimeSeriesStore (hot tier) and loads
+    them from DynamoDB (cold tier) the first time they are requested. A refresh only
+    queries the minutes newer than the last stored one (Query on the symbol partition
+    key with minute > :since). The live series of a symbol is its latest date.
+    """
+
+    def __init__(
+        self,
+        db_api: DynamoDbAPI,
+        partition_key: str = "symbol",
+        sort_key: str = "minute",
+        store: TimeSeriesStore = None
+    ):
+        self.db_api = db_api
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.store = store if store is not None else TimeSeriesStore()
+        # Symbols loaded from DynamoDB
+        self.loaded = set()
+        self.__lock = Lock()
+        self.__symbol_locks = {}
+
+    def __str__(self) -> str:
+        return (
+            f"<LiveDataCache(table_name='{self.db_api.table_name}', "
+            f"symbols={self.store.symbols})>"
+        )
+
+    def lock(self, symbol: str) -> RLock:
+        """
+        Per-symbol lock, hold it to read the cache and act on it atomically
+        """
+        with self.__lock:
+            return self.__symbol_locks.setdefault(symbol, RLock())
+
+    def __records(self, symbol: str, items: List[dict]) -> np.ndarray:
+        """
+        DynamoDB items -> TICK_DTYPE rows. Items written without a date are put on the
+        symbol's latest date.
+        """
+        items = [item for item in items if "open" in item]
+        arr = np.zeros(len(items), dtype=wire_format.TICK_DTYPE)
+        if not items:
+            return arr
+        dated = np.array([DB_DATE in item for item in items], dtype=bool)
+        if dated.any():
+            arr["date"][dated] = wire_format.parse_dates(
+                [item[DB_DATE]["S"] for item in items if DB_DATE in item]
+            )
+        arr["date"][~dated] = self.store.last_key(symbol) // 10000 or self.store.date
+        arr["minute"] = wire_format.parse_minutes([item[self.sort_key]["S"] for item in items])
+        arr["symbol"] = symbol
+        for field in DB_FIELDS:
+            values = [item[field]["N"] if field in item else "nan" for item in items]
+            values = np.asarray(values, dtype=np.float64)
+            if arr.dtype[field].kind != "f":
+                values = np.nan_to_num(values)
+            arr[field] = values
+        for field in ["average", "notional"]:
+            arr[field] = np.nan
+        return arr
+
+    def __projection(self) -> Tuple[str, Dict[str, str]]:
+        names = {"#m": self.sort_key, "#d": DB_DATE}
+        names.update({f"#{field[0]}": field for field in DB_FIELDS})
+        return ", ".join(names), names
+
+    def refresh(self, symbol: str) -> Tuple[List[str], List[float]]:
+        """
+        Fetch the minutes newer than the last stored one (all of them the first time)
+        and return only the ones newer than the stored series
+        """
+        with self.lock(symbol):
+            since = None
+            if symbol in self.loaded and self.store.last_key(symbol):
+                since = wire_format.format_minutes(
+                    np.array([self.store.last_key(symbol) % 10000])
+                )[0]
+            projection, names = self.__projection()
+            resp = self.db_api.query(
+                self.partition_key,
+                symbol,
+                sort_key=self.sort_key,
+                since=since,
+                projection_expr=projection,
+                expr_attr_names=names
+            )
+            rows = self.store.append(self.__records(symbol, resp["items"])).get(symbol)
+            self.loaded.add(symbol)
+            if rows is None:
+                return [], []
+            return wire_format.format_minutes(rows["minute"]), rows["open"].tolist()
+
+    def load(self, symbols: List[str]) -> None:
+        """
+        Load the symbols not loaded from DynamoDB yet, with parallel queries
+        """
+        missing = [symbol for symbol in symbols if symbol not in self.loaded]
+        if not missing:
+            return
+        projection, names = self.__projection()
+        responses = self.db_api.query_many(
+            self.partition_key,
+            missing,
+            sort_key=self.sort_key,
+            projection_expr=projection,
+            expr_attr_names=names
+        )
+        for symbol, resp in responses.items():
+            with self.lock(symbol):
+                if symbol in self.loaded:
+                    continue
+                self.store.append(self.__records(symbol, resp["items"]))
+                self.loaded.add(symbol)
+
+    def append(self, symbol: str, rows: np.ndarray) -> Tuple[List[str], List[float]]:
+        """
+        Add TICK_DTYPE rows of a symbol pushed by the consumer, returns only the minutes
+        newer than the stored series. DynamoDB is not queried: the minutes stored before
+        are merged in when the symbol is first requested.
+        """
+        with self.lock(symbol):
+            rows = self.store.append(rows).get(symbol)
+            if rows is None:
+                return [], []
+            return wire_format.format_minutes(rows["minute"]), rows["open"].tolist()
+
+    def day(self, symbol: str) -> Tuple[int, int]:
+        """
+        Date (yyyymmdd, 0 when unknown) and number of minutes of the live series
+        """
+        return self.store.last_key(symbol) // 10000, self.store.count(symbol)
+
+    def get(self, symbol: str) -> Tuple[List[str], List[float]]:
+        """
+        Refresh and return the full series of a symbol (copies)
+        """
+        with self.lock(symbol):
+            self.refresh(symbol)
+            return self.snapshot(symbol)
+
+    def snapshot(self, symbol: str) -> Tuple[List[str], List[float]]:
+        """
+        Return the series of a symbol (copies) without refreshing it.
+        DynamoDB is only queried when the symbol was not loaded from it yet.
+        """
+        with self.lock(symbol):
+            if symbol not in self.loaded:
+                self.refresh(symbol)
+            if symbol not in self.store:
+                return [], []
+            columns = self.store.day(symbol, fields=["minute", "open"])
+            return wire_format.format_minutes(columns["minute"]), columns["open"].tolist()
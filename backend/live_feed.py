@@ -0,0 +1,238 @@
+"""
+Python: 3.7.9
+
+Delta protocol of the live graph feed
+
+Clients subscribe with get_live_data and a dict instead of the symbol string:
+    {"symbol": "AAPL", "mode": "delta", "window": 0.5, "format": "json" | "msgpack"}
+and get
+    graph_data  : the series once, {"symbol", "date", "seq", "labels", "data", ...}
+                  where seq is the number of points
+    graph_delta : the points appended since, coalesced over the client's window (seconds),
+                  {"symbol", "date", "seq", "labels", "data", "sent_at", "produced"} where
+                  seq is the position of the first point (msgpack bytes in msgpack format)
+
+A client holding n points of `date` appends a delta when seq <= n (skipping the first
+n - seq points, already in its series) and resyncs when seq > n or the date changed
+(points were missed): it sends get_live_data again, with its "date" and "seq" (n) to
+only get the points after them as a graph_delta when they are still in the series.
+
+Clients with the same symbol, window and format share a room, so every delta is encoded
+once per room whatever the number of clients.
+"""
+from threading import Lock
+from time import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    # JSON only
+    msgpack = None
+
+
+MODES = ("full", "delta")
+FORMATS = ("json", "msgpack")
+DEFAULT_WINDOW = 0.5
+MAX_WINDOW = 10.0
+# Windows are rounded to steps of 50 ms, bounding the rooms of a symbol
+WINDOW_STEP = 0.05
+
+
+def parse_subscription(params: Any) -> Dict[str, Any]:
+    """
+    get_live_data parameters -> {"symbol", "mode", "window", "format", "date", "seq"}.
+    A symbol string is the full mode. Raises ValueError for invalid parameters.
+    """
+    if isinstance(params, str):
+        params = {"symbol": params}
+    if not isinstance(params, dict) or not isinstance(params.get("symbol"), str):
+        raise ValueError("! get_live_data takes a symbol or {\"symbol\": ..., \"mode\": ...} !")
+    mode = params.get("mode", "full")
+    fmt = params.get("format", "json")
+    if mode not in MODES:
+        raise ValueError(f"! mode must be one of {list(MODES)} !")
+    if fmt not in FORMATS:
+        raise ValueError(f"! format must be one of {list(FORMATS)} !")
+    if fmt == "msgpack" and msgpack is None:
+        raise ValueError("! msgpack is not installed on the server, use format json !")
+    try:
+        window = float(params.get("window", DEFAULT_WINDOW))
+        date = int(params["date"]) if params.get("date") is not None else None
+        seq = int(params["seq"]) if params.get("seq") is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("! window, date and seq must be numbers !")
+    window = round(min(max(window, 0.0), MAX_WINDOW) / WINDOW_STEP) * WINDOW_STEP
+    return {
+        "symbol": params["symbol"], "mode": mode, "window": round(window, 2), "format": fmt,
+        "date": date, "seq": seq
+    }
+
+
+def room_name(symbol: str, window: float, fmt: str) -> str:
+    """
+    Room of the delta clients of a symbol with the same window and format
+    """
+    return f"{symbol}:delta:{window:.2f}:{fmt}"
+
+
+def make_delta(
+    symbol: str,
+    date: int,
+    seq: int,
+    labels: List[str],
+    data: List[float],
+    produced: float = None
+) -> dict:
+    """
+    graph_delta payload
+    """
+    return {
+        "symbol": symbol, "date": date, "seq": seq, "labels": labels, "data": data,
+        "sent_at": time(), "produced": produced
+    }
+
+
+def encode_delta(delta: dict, fmt: str) -> Any:
+    if fmt == "msgpack":
+        return msgpack.packb(delta, use_bin_type=True)
+    return delta
+
+
+class DeltaRoom:
+    """
+    Clients of a symbol with the same window and format, and the points not sent yet
+    """
+    __slots__ = ("name", "symbol", "window", "format", "sids", "date", "seq", "labels",
+                 "data", "produced", "flush_at")
+
+    def __init__(self, name: str, symbol: str, window: float, fmt: str):
+        self.name = name
+        self.symbol = symbol
+        self.window = window
+        self.format = fmt
+        self.sids = set()
+        self.date = 0
+        self.seq = 0
+        self.labels = []
+        self.data = []
+        self.produced = None
+        self.flush_at = None
+
+    def take(self) -> dict:
+        """
+        Pending points as a graph_delta payload, emptied
+        """
+        delta = make_delta(
+            self.symbol, self.date, self.seq, self.labels, self.data, self.produced
+        )
+        self.labels = []
+        self.data = []
+        self.produced = None
+        self.flush_at = None
+        return delta
+
+
+class DeltaFeed:
+    """
+    Rooms of the delta clients, coalescing the points published for their symbol.
+    send(event, data, room) emits to a room (server.broadcast).
+    """
+
+    def __init__(self, send: Callable[[str, Any, str], None]):
+        self.send = send
+        self.rooms = {}
+        self.__symbol_rooms = {}
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<DeltaFeed(rooms={len(self.rooms)}, symbols={len(self.__symbol_rooms)})>"
+
+    def join(self, sid: str, symbol: str, window: float, fmt: str) -> str:
+        """
+        Add a client to the room of its symbol, window and format, returns the room name
+        """
+        name = room_name(symbol, window, fmt)
+        with self.__lock:
+            room = self.rooms.get(name)
+            if room is None:
+                room = self.rooms[name] = DeltaRoom(name, symbol, window, fmt)
+                self.__symbol_rooms.setdefault(symbol, set()).add(name)
+            room.sids.add(sid)
+        return name
+
+    def leave(self, sid: str, names: Iterable[str] = None) -> List[str]:
+        """
+        Remove a client from its rooms, or only from the given ones (empty rooms are
+        dropped), returns the room names
+        """
+        left = []
+        with self.__lock:
+            for name, room in list(self.rooms.items()):
+                if sid not in room.sids or (names is not None and name not in names):
+                    continue
+                room.sids.discard(sid)
+                left.append(name)
+                if not room.sids:
+                    del self.rooms[name]
+                    symbol_rooms = self.__symbol_rooms[room.symbol]
+                    symbol_rooms.discard(name)
+                    if not symbol_rooms:
+                        del self.__symbol_rooms[room.symbol]
+        return left
+
+    def subscriptions(self) -> List[Tuple[str, float, str]]:
+        """
+        (symbol, window, format) of the rooms
+        """
+        with self.__lock:
+            return [(room.symbol, room.window, room.format) for room in self.rooms.values()]
+
+    def publish(
+        self,
+        symbol: str,
+        date: int,
+        seq: int,
+        labels: List[str],
+        data: List[float],
+        produced: float = None
+    ) -> None:
+        """
+        Add the points appended to a symbol's series at position seq to its rooms.
+        Points not following the pending ones (gap, new date) flush those first.
+        """
+        if not labels:
+            return
+        now = time()
+        sends = []
+        with self.__lock:
+            for name in self.__symbol_rooms.get(symbol, ()):
+                room = self.rooms[name]
+                if room.labels and (room.date != date or room.seq + len(room.labels) != seq):
+                    sends.append((room.format, room.name, room.take()))
+                if not room.labels:
+                    room.date = date
+                    room.seq = seq
+                    room.flush_at = now + room.window
+                room.labels.extend(labels)
+                room.data.extend(data)
+                if room.produced is None:
+                    room.produced = produced
+                if room.window == 0:
+                    sends.append((room.format, room.name, room.take()))
+        for fmt, name, delta in sends:
+            self.send("graph_delta", encode_delta(delta, fmt), name)
+
+    def flush(self, now: float = None) -> int:
+        """
+        Send the pending points of the rooms whose window is over, returns the rooms sent
+        """
+        now = time() if now is None else now
+        with self.__lock:
+            sends = [
+                (room.format, room.name, room.take()) for room in self.rooms.values()
+                if room.flush_at is not None and room.flush_at <= now
+            ]
+        for fmt, name, delta in sends:
+            self.send("graph_delta", encode_delta(delta, fmt), name)
+        return len(sends)
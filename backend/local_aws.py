@@ -0,0 +1,457 @@
+"""
+Python: 3.7.9
+
+In-memory local stand-ins for the boto3 DynamoDB and Kinesis clients.
+
+Only the calls used by kinesis_api are implemented. Every call can be slowed down
+by a fixed latency to mimic a network round trip, which makes them usable for
+benchmarking without AWS credentials.
+"""
+from collections import deque
+from datetime import datetime
+from hashlib import md5
+from random import random
+import re
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any
+from uuid import uuid4
+from botocore.exceptions import ClientError
+
+
+def _response_metadata() -> dict:
+    return {"RequestId": uuid4().hex, "HTTPStatusCode": 200}
+
+
+# "<name> <op> :<value>" conditions joined with AND (enough for key conditions/filters)
+CONDITION_RE = re.compile(r"\s*(#?\w+)\s*(=|<>|<=|>=|<|>)\s*(:\w+)\s*", re.ASCII)
+COMPARATORS = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _attr_value(value: dict) -> Any:
+    type_, val = list(value.items())[0]
+    return float(val) if type_ == "N" else val
+
+
+def _matcher(expression: str, names: dict, values: dict) -> Any:
+    """
+    Build a predicate over items from a simple condition expression
+    """
+    if not expression:
+        return lambda item: True
+    conditions = []
+    for part in re.split(r"\s+AND\s+", expression, flags=re.IGNORECASE):
+        match = CONDITION_RE.fullmatch(part)
+        if not match:
+            raise ValueError(f"Unsupported expression: {part}")
+        name, operator, placeholder = match.groups()
+        conditions.append(
+            (names.get(name, name), COMPARATORS[operator], _attr_value(values[placeholder]))
+        )
+    return lambda item: all(
+        name in item and compare(_attr_value(item[name]), value)
+        for name, compare, value in conditions
+    )
+
+
+def _project(item: dict, expression: str, names: dict) -> dict:
+    if not expression:
+        return item
+    fields = [names.get(field.strip(), field.strip()) for field in expression.split(",")]
+    return {field: item[field] for field in fields if field in item}
+
+
+class LocalDynamoDbClient:
+    """
+    Minimal in-memory replacement of the boto3 DynamoDB client
+
+    latency          : Seconds to sleep on every call (simulated round trip)
+    unprocessed_rate : Fraction (0.0 - 1.0) of batch_write_item requests to return
+                       back in UnprocessedItems (simulated throttling)
+    page_size        : Max items returned per scan/query page (stands in for the 1 MB limit)
+    """
+
+    def __init__(
+        self,
+        table_names: list = None,
+        key_schema: tuple = ("symbol", "minute"),
+        latency: float = 0.0,
+        unprocessed_rate: float = 0.0,
+        page_size: int = 1000
+    ):
+        self.key_schema = key_schema
+        self.latency = latency
+        self.unprocessed_rate = unprocessed_rate
+        self.page_size = page_size
+        self.tables = {name: {} for name in (table_names or ["stock-stream-data"])}
+        self.calls = {}
+        self.__lock = Lock()
+
+    def __call(self, operation: str) -> None:
+        with self.__lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+
+    def __item_key(self, item: dict) -> tuple:
+        return tuple(
+            list(item[key].values())[0] for key in self.key_schema if key in item
+        )
+
+    def list_tables(self, **kwargs) -> dict:
+        self.__call("list_tables")
+        return {"TableNames": list(self.tables), "ResponseMetadata": _response_metadata()}
+
+    def describe_table(self, TableName: str, **kwargs) -> dict:
+        self.__call("describe_table")
+        key_types = ["HASH", "RANGE"]
+        return {
+            "Table": {
+                "TableName": TableName,
+                "KeySchema": [
+                    {"AttributeName": key, "KeyType": key_type}
+                    for key, key_type in zip(self.key_schema, key_types)
+                ],
+            },
+            "ResponseMetadata": _response_metadata()
+        }
+
+    def put_item(self, TableName: str, Item: dict, **kwargs) -> dict:
+        self.__call("put_item")
+        with self.__lock:
+            self.tables[TableName][self.__item_key(Item)] = Item
+        return {"ResponseMetadata": _response_metadata()}
+
+    def batch_write_item(self, RequestItems: dict, **kwargs) -> dict:
+        self.__call("batch_write_item")
+        unprocessed = {}
+        with self.__lock:
+            for table_name, requests in RequestItems.items():
+                if len(requests) > 25:
+                    raise ValueError("Too many items requested for the BatchWriteItem call")
+                keys = [self.__item_key(request["PutRequest"]["Item"]) for request in requests]
+                if len(set(keys)) != len(keys):
+                    # Like DynamoDB, the whole request is rejected
+                    raise ClientError(
+                        {"Error": {
+                            "Code": "ValidationException",
+                            "Message": "Provided list of item keys contains duplicates"
+                        }},
+                        "BatchWriteItem"
+                    )
+                for request in requests:
+                    if self.unprocessed_rate and random() < self.unprocessed_rate:
+                        unprocessed.setdefault(table_name, []).append(request)
+                        continue
+                    item = request["PutRequest"]["Item"]
+                    self.tables[table_name][self.__item_key(item)] = item
+        return {"UnprocessedItems": unprocessed, "ResponseMetadata": _response_metadata()}
+
+    def get_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        self.__call("get_item")
+        item = self.tables[TableName].get(self.__item_key(Key))
+        resp = {"ResponseMetadata": _response_metadata()}
+        if item is not None:
+            resp["Item"] = item
+        return resp
+
+    def __page(self, items: list, kwargs: dict) -> dict:
+        """
+        Sort, paginate (ExclusiveStartKey/LastEvaluatedKey), filter and project items
+        """
+        names = kwargs.get("ExpressionAttributeNames", {})
+        values = kwargs.get("ExpressionAttributeValues", {})
+        items = sorted(items, key=self.__item_key)
+        start = kwargs.get("ExclusiveStartKey")
+        if start:
+            start = self.__item_key(start)
+            items = [item for item in items if self.__item_key(item) > start]
+        limit = min(kwargs.get("Limit", self.page_size), self.page_size)
+        page = items[:limit]
+        resp = {"ScannedCount": len(page), "ResponseMetadata": _response_metadata()}
+        if len(items) > limit:
+            resp["LastEvaluatedKey"] = {
+                key: page[-1][key] for key in self.key_schema if key in page[-1]
+            }
+        matches = _matcher(kwargs.get("FilterExpression"), names, values)
+        resp["Items"] = [
+            _project(item, kwargs.get("ProjectionExpression"), names)
+            for item in page if matches(item)
+        ]
+        resp["Count"] = len(resp["Items"])
+        return resp
+
+    def scan(self, TableName: str, **kwargs) -> dict:
+        self.__call("scan")
+        with self.__lock:
+            items = list(self.tables[TableName].values())
+        return self.__page(items, kwargs)
+
+    def query(self, TableName: str, KeyConditionExpression: str, **kwargs) -> dict:
+        self.__call("query")
+        matches = _matcher(
+            KeyConditionExpression,
+            kwargs.get("ExpressionAttributeNames", {}),
+            kwargs.get("ExpressionAttributeValues", {})
+        )
+        with self.__lock:
+            items = [item for item in self.tables[TableName].values() if matches(item)]
+        return self.__page(items, kwargs)
+
+
+# Kinesis partition keys are MD5 hashed into a 128 bit hash key space
+MAX_HASH_KEY = 2 ** 128 - 1
+
+
+class LocalKinesisClient:
+    """
+    Minimal in-memory replacement of the boto3 Kinesis client
+
+    Records are routed to shards by the MD5 hash of the partition key like Kinesis.
+    Shards can be split (split_shard) to exercise resharding.
+
+    latency      : Seconds to sleep on every call (simulated round trip)
+    page_size    : Max shards returned per list_shards call
+    failure_rate : Fraction (0.0 - 1.0) of put_records entries to fail (simulated throttling)
+    read_limit   : GetRecords calls per second and shard, more calls raise
+                   ProvisionedThroughputExceededException like Kinesis (0: no limit)
+    """
+
+    def __init__(
+        self,
+        stream_name: str = "stock-stream",
+        shard_count: int = 1,
+        latency: float = 0.0,
+        page_size: int = 100,
+        failure_rate: float = 0.0,
+        read_limit: int = 0
+    ):
+        self.stream_name = stream_name
+        self.latency = latency
+        self.page_size = page_size
+        self.failure_rate = failure_rate
+        self.read_limit = read_limit
+        self.calls = {}
+        # shard_id -> times of the GetRecords calls of the last second
+        self.reads = {}
+        self.shards = []
+        self.records = {}
+        self.__sequence = 0
+        self.__lock = Lock()
+
+        step = (MAX_HASH_KEY + 1) // shard_count
+        for idx in range(shard_count):
+            end = MAX_HASH_KEY if idx == shard_count - 1 else (idx + 1) * step - 1
+            self.__add_shard(idx * step, end)
+
+    def __call(self, operation: str) -> None:
+        with self.__lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            sleep(self.latency)
+
+    def __limit_reads(self, shard_id: str) -> None:
+        now = monotonic()
+        with self.__lock:
+            reads = self.reads.setdefault(shard_id, deque())
+            while reads and reads[0] <= now - 1.0:
+                reads.popleft()
+            if len(reads) >= self.read_limit:
+                self.calls["throttled"] = self.calls.get("throttled", 0) + 1
+                raise ClientError(
+                    {"Error": {
+                        "Code": "ProvisionedThroughputExceededException",
+                        "Message": f"Rate exceeded for shard {shard_id}"
+                    }},
+                    "GetRecords"
+                )
+            reads.append(now)
+
+    def __next_sequence_number(self) -> str:
+        self.__sequence += 1
+        return f"{self.__sequence:056d}"
+
+    def __add_shard(self, start: int, end: int, parent: str = None) -> dict:
+        shard = {
+            "ShardId": f"shardId-{len(self.shards):012d}",
+            "HashKeyRange": {"StartingHashKey": str(start), "EndingHashKey": str(end)},
+            "SequenceNumberRange": {"StartingSequenceNumber": f"{self.__sequence + 1:056d}"},
+        }
+        if parent:
+            shard["ParentShardId"] = parent
+        self.shards.append(shard)
+        self.records[shard["ShardId"]] = []
+        return shard
+
+    def __shard(self, shard_id: str) -> dict:
+        for shard in self.shards:
+            if shard["ShardId"] == shard_id:
+                return shard
+        raise ValueError(f"Shard {shard_id} not found in stream {self.stream_name}")
+
+    def __route(self, partition_key: str, explicit_hash_key: str = None) -> dict:
+        if explicit_hash_key is not None:
+            hash_key = int(explicit_hash_key)
+        else:
+            hash_key = int(md5(partition_key.encode("utf-8")).hexdigest(), 16)
+        for shard in self.shards:
+            if "EndingSequenceNumber" in shard["SequenceNumberRange"]:
+                continue
+            key_range = shard["HashKeyRange"]
+            if int(key_range["StartingHashKey"]) <= hash_key <= int(key_range["EndingHashKey"]):
+                return shard
+        raise ValueError(f"No open shard for partition key: {partition_key}")
+
+    def __append(self, data: Any, partition_key: str, explicit_hash_key: str = None) -> dict:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        shard = self.__route(partition_key, explicit_hash_key)
+        record = {
+            "SequenceNumber": self.__next_sequence_number(),
+            "ApproximateArrivalTimestamp": datetime.now(),
+            "Data": data,
+            "PartitionKey": partition_key,
+        }
+        self.records[shard["ShardId"]].append(record)
+        return {"ShardId": shard["ShardId"], "SequenceNumber": record["SequenceNumber"]}
+
+    def describe_stream(self, StreamName: str, **kwargs) -> dict:
+        self.__call("describe_stream")
+        return {
+            "StreamDescription": {
+                "StreamName": self.stream_name,
+                "StreamStatus": "ACTIVE",
+                "Shards": self.shards[:self.page_size],
+                "HasMoreShards": len(self.shards) > self.page_size,
+            },
+            "ResponseMetadata": _response_metadata()
+        }
+
+    def list_shards(self, StreamName: str = None, NextToken: str = None, **kwargs) -> dict:
+        self.__call("list_shards")
+        start = int(NextToken) if NextToken else 0
+        end = start + self.page_size
+        resp = {"Shards": self.shards[start:end], "ResponseMetadata": _response_metadata()}
+        if end < len(self.shards):
+            resp["NextToken"] = str(end)
+        return resp
+
+    def split_shard(self, StreamName: str, ShardToSplit: str, NewStartingHashKey: str) -> dict:
+        self.__call("split_shard")
+        with self.__lock:
+            parent = self.__shard(ShardToSplit)
+            key_range = parent["HashKeyRange"]
+            parent["SequenceNumberRange"]["EndingSequenceNumber"] = f"{self.__sequence:056d}"
+            self.__add_shard(
+                int(key_range["StartingHashKey"]), int(NewStartingHashKey) - 1, ShardToSplit
+            )
+            self.__add_shard(
+                int(NewStartingHashKey), int(key_range["EndingHashKey"]), ShardToSplit
+            )
+        return {"ResponseMetadata": _response_metadata()}
+
+    def put_record(self, StreamName: str, Data: Any, PartitionKey: str, **kwargs) -> dict:
+        self.__call("put_record")
+        with self.__lock:
+            resp = self.__append(Data, PartitionKey, kwargs.get("ExplicitHashKey"))
+        resp["ResponseMetadata"] = _response_metadata()
+        return resp
+
+    def put_records(self, StreamName: str, Records: list, **kwargs) -> dict:
+        self.__call("put_records")
+        if len(Records) > 500:
+            raise ValueError("Records exceeds the PutRecords limit of 500")
+        total = 0
+        for record in Records:
+            size = len(record["Data"]) + len(record["PartitionKey"])
+            if size > 1024 * 1024:
+                raise ValueError("Record exceeds the Kinesis record limit of 1 MB")
+            total += size
+        if total > 5 * 1024 * 1024:
+            raise ValueError("Records exceeds the PutRecords limit of 5 MB")
+
+        results = []
+        failed = 0
+        with self.__lock:
+            for record in Records:
+                if self.failure_rate and random() < self.failure_rate:
+                    failed += 1
+                    results.append({
+                        "ErrorCode": "ProvisionedThroughputExceededException",
+                        "ErrorMessage": "Rate exceeded for shard",
+                    })
+                    continue
+                results.append(self.__append(
+                    record["Data"], record["PartitionKey"], record.get("ExplicitHashKey")
+                ))
+        return {
+            "FailedRecordCount": failed,
+            "Records": results,
+            "ResponseMetadata": _response_metadata()
+        }
+
+    def get_shard_iterator(
+        self,
+        StreamName: str,
+        ShardId: str,
+        ShardIteratorType: str,
+        StartingSequenceNumber: str = None,
+        **kwargs
+    ) -> dict:
+        self.__call("get_shard_iterator")
+        with self.__lock:
+            records = self.records[self.__shard(ShardId)["ShardId"]]
+            if ShardIteratorType == "TRIM_HORIZON":
+                position = 0
+            elif ShardIteratorType == "LATEST":
+                position = len(records)
+            elif ShardIteratorType in ("AFTER_SEQUENCE_NUMBER", "AT_SEQUENCE_NUMBER"):
+                position = 0
+                for position, record in enumerate(records):
+                    if record["SequenceNumber"] >= StartingSequenceNumber:
+                        break
+                else:
+                    position = len(records)
+                if (
+                    ShardIteratorType == "AFTER_SEQUENCE_NUMBER"
+                    and position < len(records)
+                    and records[position]["SequenceNumber"] == StartingSequenceNumber
+                ):
+                    position += 1
+            else:
+                raise ValueError(f"Invalid ShardIteratorType: {ShardIteratorType}")
+        return {"ShardIterator": f"{ShardId}:{position}", "ResponseMetadata": _response_metadata()}
+
+    def get_records(self, ShardIterator: str, Limit: int = 10000, **kwargs) -> dict:
+        self.__call("get_records")
+        shard_id, position = ShardIterator.rsplit(":", 1)
+        position = int(position)
+        if self.read_limit:
+            self.__limit_reads(shard_id)
+        with self.__lock:
+            shard = self.__shard(shard_id)
+            records = self.records[shard_id]
+            batch = records[position:position + min(Limit, 10000)]
+            position += len(batch)
+            closed = "EndingSequenceNumber" in shard["SequenceNumberRange"]
+            next_iterator = f"{shard_id}:{position}"
+            if closed and position >= len(records):
+                # A closed shard returns no next iterator once it is fully read
+                next_iterator = None
+            behind = 0
+            if position < len(records):
+                arrival = records[position]["ApproximateArrivalTimestamp"]
+                behind = int((datetime.now() - arrival).total_seconds() * 1000)
+        return {
+            "Records": batch,
+            "NextShardIterator": next_iterator,
+            "MillisBehindLatest": behind,
+            "ResponseMetadata": _response_metadata()
+        }
@@ -0,0 +1,201 @@
+"""
+Python: 3.7.9
+
+Local stand-in of a Redis server for the Socket.IO message queue of several server
+processes (serve.py --workers 4 --message-queue redis://127.0.0.1:6379/0).
+
+Only the publish/subscribe commands are implemented (RESP2, and RESP3 after HELLO 3),
+which is all the Socket.IO Redis manager uses, so the multi-process setup runs without
+installing Redis. The Redis client library is still needed by the servers:
+pip install redis
+
+$ python local_redis.py --port 6379
+"""
+from argparse import ArgumentParser
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+from typing import List
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(*items: bytes, kind: bytes = b"*") -> bytes:
+    return kind + b"%d\r\n" % len(items) + b"".join(items)
+
+
+def _integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+class _Connection(StreamRequestHandler):
+    """
+    One client connection: reads RESP commands, subscribers get the published messages
+    """
+
+    def setup(self) -> None:
+        super().setup()
+        self.channels = set()
+        self.write_lock = Lock()
+        # RESP3 (HELLO 3) sends the pub/sub messages as push types
+        self.push_kind = b"*"
+
+    def send(self, data: bytes) -> None:
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def push(self, *items: bytes) -> None:
+        self.send(_array(*items, kind=self.push_kind))
+
+    def read_command(self) -> List[bytes]:
+        line = self.rfile.readline()
+        if not line:
+            return []
+        if not line.startswith(b"*"):
+            # Inline command (redis-cli, telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self) -> None:
+        server = self.server
+        try:
+            while True:
+                args = self.read_command()
+                if not args:
+                    return
+                command = args[0].upper()
+                if command == b"PUBLISH" and len(args) == 3:
+                    self.send(_integer(server.publish(args[1], args[2])))
+                elif command == b"SUBSCRIBE" and len(args) > 1:
+                    for channel in args[1:]:
+                        server.subscribe(self, channel)
+                        self.channels.add(channel)
+                        self.push(
+                            _bulk(b"subscribe"), _bulk(channel), _integer(len(self.channels))
+                        )
+                elif command == b"UNSUBSCRIBE":
+                    for channel in args[1:] or list(self.channels):
+                        server.unsubscribe(self, channel)
+                        self.channels.discard(channel)
+                        self.push(
+                            _bulk(b"unsubscribe"), _bulk(channel), _integer(len(self.channels))
+                        )
+                elif command == b"PING":
+                    if self.channels:
+                        self.send(_array(_bulk(b"pong"), _bulk(b"".join(args[1:2]))))
+                    else:
+                        self.send(_bulk(args[1]) if len(args) > 1 else b"+PONG\r\n")
+                elif command == b"HELLO":
+                    proto = int(args[1]) if len(args) > 1 else 2
+                    if proto not in (2, 3):
+                        self.send(b"-NOPROTO unsupported protocol version\r\n")
+                        continue
+                    self.push_kind = b">" if proto == 3 else b"*"
+                    fields = [
+                        _bulk(b"server"), _bulk(b"redis"), _bulk(b"version"), _bulk(b"6.0.0"),
+                        _bulk(b"proto"), _integer(proto)
+                    ]
+                    if proto == 3:
+                        # Map of len(fields) / 2 pairs
+                        self.send(b"%%%d\r\n" % (len(fields) // 2) + b"".join(fields))
+                    else:
+                        self.send(_array(*fields))
+                elif command == b"ECHO" and len(args) == 2:
+                    self.send(_bulk(args[1]))
+                elif command in (b"CLIENT", b"SELECT", b"AUTH"):
+                    self.send(b"+OK\r\n")
+                elif command == b"QUIT":
+                    self.send(b"+OK\r\n")
+                    return
+                else:
+                    self.send(b"-ERR unknown command '%s'\r\n" % args[0])
+        except (OSError, ValueError):
+            pass
+        finally:
+            for channel in list(self.channels):
+                server.unsubscribe(self, channel)
+
+
+class LocalRedisServer(ThreadingTCPServer):
+    """
+    Publish/subscribe Redis server, one thread per connection
+
+    published : Messages published
+    delivered : Messages sent to subscribers
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379):
+        super().__init__((host, port), _Connection)
+        self.published = 0
+        self.delivered = 0
+        self.__subscribers = {}
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        host, port = self.server_address
+        return f"<LocalRedisServer(address='{host}:{port}', channels={len(self.__subscribers)})>"
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def subscribe(self, conn: _Connection, channel: bytes) -> None:
+        with self.__lock:
+            self.__subscribers.setdefault(channel, set()).add(conn)
+
+    def unsubscribe(self, conn: _Connection, channel: bytes) -> None:
+        with self.__lock:
+            subscribers = self.__subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.__subscribers[channel]
+
+    def publish(self, channel: bytes, message: bytes) -> int:
+        """
+        Send a message to the subscribers of a channel, returns their number
+        """
+        with self.__lock:
+            subscribers = list(self.__subscribers.get(channel, ()))
+            self.published += 1
+        items = (_bulk(b"message"), _bulk(channel), _bulk(message))
+        sent = 0
+        for conn in subscribers:
+            try:
+                conn.push(*items)
+                sent += 1
+            except OSError:
+                pass
+        with self.__lock:
+            self.delivered += sent
+        return sent
+
+    def start(self) -> "LocalRedisServer":
+        """
+        Serve on a background thread
+        """
+        Thread(target=self.serve_forever, name="local-redis", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Local publish/subscribe Redis stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    redis_server = LocalRedisServer(args.host, args.port)
+    print(f"Serving {redis_server.url} (publish/subscribe only)")
+    try:
+        redis_server.serve_forever()
+    except KeyboardInterrupt:
+        redis_server.shutdown()
@@ -0,0 +1,334 @@
+"""
+Python: 3.7.9
+
+Reads of the market data files
+
+merge_ticks is a k-way heap merge over per-symbol (or per-day) intraday CSV files, each
+sorted by date and minute. It yields one minute-aligned TICK_DTYPE batch at a time and
+never holds more than one chunk of each file in memory, so multi-day or full-universe
+data can be replayed without loading (and sorting) everything up front. Every file stays
+open until it is read to the end (one file descriptor each, the soft limit of open files
+is raised up to the hard limit when needed).
+
+Columnar datasets (written by data/data_editor.py) are a directory with one .npy file
+per column and an index.json:
+    {"rows": 3900, "columns": {"open": "<f8", ...}, "groups": {"<key>": [start, end], ...}}
+Groups are contiguous row ranges (a minute of intraday data, a symbol of historical data).
+ColumnarDataset memory-maps the columns, so opening one takes milliseconds and the
+pages are shared between the processes reading it.
+"""
+from contextlib import ExitStack
+from glob import glob
+from heapq import heapify, heappop, heappush
+from io import StringIO
+from itertools import chain, islice
+from json import dump, load
+from os import makedirs, path, replace, stat
+from typing import Dict, Iterator, List
+import numpy as np
+import pandas as pd
+import wire_format
+
+try:
+    from resource import RLIM_INFINITY, RLIMIT_NOFILE, getrlimit, setrlimit
+except ImportError:
+    # Not available on Windows
+    getrlimit = None
+
+
+# Rows read from a file at a time, memory is ~ files x CHUNK_ROWS x 82 bytes
+CHUNK_ROWS = 1000
+# File descriptors kept free for the rest of the process (sockets, logs) by merge_ticks
+RESERVED_FILES = 64
+# Index file of a columnar dataset
+COLUMNAR_INDEX = "index.json"
+# Column order of the intraday CSV files
+CSV_COLUMNS = [
+    "date", "minute", "label", "high", "low", "open", "close", "average", "volume", "notional",
+    "numberOfTrades", "symbol"
+]
+
+
+def expand_files(sources: List[str]) -> List[str]:
+    """
+    CSV files, globs and directories (all *.csv inside) -> sorted list of CSV files
+    """
+    files = []
+    for source in sources:
+        if path.isdir(source):
+            files.extend(sorted(glob(path.join(source, "*.csv"))))
+        else:
+            files.extend(sorted(glob(source)) or [source])
+    return files
+
+
+def ensure_open_files(count: int) -> None:
+    """
+    Raise the soft limit of open files (ulimit -n) so `count` more files can be opened,
+    raises OSError when the hard limit is too low
+    """
+    if getrlimit is None:
+        return
+    soft, hard = getrlimit(RLIMIT_NOFILE)
+    needed = count + RESERVED_FILES
+    if soft == RLIM_INFINITY or needed <= soft:
+        return
+    if hard != RLIM_INFINITY and needed > hard:
+        raise OSError(
+            f"! Merging {count} files needs {needed} open files, the hard limit is {hard} !"
+        )
+    setrlimit(RLIMIT_NOFILE, (needed, hard))
+
+
+def tick_keys(arr: np.ndarray) -> np.ndarray:
+    """
+    Sort keys of ticks: yyyymmdd * 10000 + minutes since midnight
+    """
+    return arr["date"].astype(np.uint64) * 10000 + arr["minute"]
+
+
+class ChunkedTickFile:
+    """
+    Intraday CSV file sorted by date and minute, read one chunk at a time.
+    A chunk is split into runs of rows sharing a key (date and minute).
+    """
+
+    def __init__(self, file_path: str, chunk_rows: int = CHUNK_ROWS):
+        self.file_path = file_path
+        self.rows = None
+        self.run_keys = []
+        self.run_ends = []
+        self.run = 0
+        self.chunk_rows = chunk_rows
+        # Plain file + per chunk parse: pandas' chunked reader keeps ~1 MB of buffers per file
+        self.__file = open(file_path)
+        try:
+            self.__header = self.__file.readline().strip().split(",")
+            self.next_chunk()
+        except Exception:
+            self.__file.close()
+            raise
+
+    def __str__(self) -> str:
+        return f"<ChunkedTickFile(file_path='{self.file_path}', head={self.head()})>"
+
+    def next_chunk(self) -> bool:
+        while True:
+            lines = list(islice(self.__file, self.chunk_rows))
+            if not lines:
+                break
+            df = pd.read_csv(StringIO("".join(lines)), header=None, names=self.__header)
+            rows = wire_format.frame_to_records(df)
+            if len(rows):
+                keys = tick_keys(rows)
+                ends = np.flatnonzero(np.diff(keys)) + 1
+                self.rows = rows
+                self.run_keys = keys[np.concatenate(([0], ends))].tolist()
+                self.run_ends = ends.tolist() + [len(rows)]
+                self.run = 0
+                return True
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self.rows = None
+        self.__file.close()
+
+    def head(self) -> int:
+        """
+        Key of the next row, None at the end of the file
+        """
+        return None if self.rows is None else self.run_keys[self.run]
+
+    def take(self, key: int) -> List[np.ndarray]:
+        """
+        Rows with the given key (which must be the head), reading more chunks as needed
+        """
+        parts = []
+        while self.rows is not None and self.run_keys[self.run] == key:
+            start = self.run_ends[self.run - 1] if self.run else 0
+            parts.append(self.rows[start:self.run_ends[self.run]])
+            self.run += 1
+            if self.run == len(self.run_ends):
+                # Chunk used up, the key may continue in the next one
+                self.next_chunk()
+        return parts
+
+
+def merge_ticks(sources: List[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+    """
+    k-way merge of intraday CSV files (files, globs or directories), yields one
+    TICK_DTYPE record array per minute (per date and minute) sorted by symbol
+
+    All the files are opened up front (one descriptor each) and closed when the
+    generator is exhausted, closed or garbage collected.
+    """
+    file_paths = expand_files(sources)
+    ensure_open_files(len(file_paths))
+    with ExitStack() as stack:
+        files = []
+        for file_path in file_paths:
+            tick_file = ChunkedTickFile(file_path, chunk_rows)
+            stack.callback(tick_file.close)
+            files.append(tick_file)
+        heap = [
+            (tick_file.head(), idx) for idx, tick_file in enumerate(files)
+            if tick_file.head() is not None
+        ]
+        heapify(heap)
+
+        while heap:
+            key = heap[0][0]
+            parts = []
+            while heap and heap[0][0] == key:
+                _, idx = heappop(heap)
+                parts.extend(files[idx].take(key))
+                head = files[idx].head()
+                if head is not None:
+                    heappush(heap, (head, idx))
+            # Joining raw bytes is much faster than np.concatenate of many small record arrays
+            batch = np.frombuffer(
+                b"".join([part.tobytes() for part in parts]), wire_format.TICK_DTYPE
+            )
+            yield batch[np.argsort(batch["symbol"], kind="stable")]
+
+
+def format_labels(minutes: np.ndarray) -> List[str]:
+    """
+    minutes since midnight -> labels of the intraday CSV files ("09:31 AM", "10 AM", "1:05 PM")
+    """
+    labels = []
+    for minute in minutes.tolist():
+        hour, mins = divmod(minute, 60)
+        if hour < 12:
+            clock = f"{hour:02d}"
+        else:
+            clock = str(hour % 12 or 12)
+        clock = clock if mins == 0 else f"{clock}:{mins:02d}"
+        labels.append(f"{clock} {'AM' if hour < 12 else 'PM'}")
+    return labels
+
+
+def records_to_frame(arr: np.ndarray) -> pd.DataFrame:
+    """
+    TICK_DTYPE record array -> DataFrame with the columns of the intraday CSV files
+    """
+    columns = {}
+    for column in CSV_COLUMNS:
+        if column == "label":
+            columns[column] = format_labels(arr["minute"])
+        elif column == "date":
+            columns[column] = wire_format.format_dates(arr[column])
+        elif column == "minute":
+            columns[column] = wire_format.format_minutes(arr[column])
+        elif column == "symbol":
+            columns[column] = np.char.decode(arr[column], "ascii")
+        else:
+            columns[column] = arr[column]
+    return pd.DataFrame(columns, columns=CSV_COLUMNS)
+
+
+def is_columnar(data_dir: str) -> bool:
+    return path.isfile(path.join(data_dir, COLUMNAR_INDEX))
+
+
+def group_ranges(keys: np.ndarray) -> Dict[str, List[int]]:
+    """
+    Sorted keys -> {key: [start, end]} row ranges of equal keys
+    """
+    if not len(keys):
+        return {}
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    ends = np.append(starts[1:], len(keys)).tolist()
+    values = keys[starts]
+    if values.dtype.kind == "S":
+        values = np.char.decode(values, "ascii")
+    return {
+        str(key): [start, end] for key, start, end in zip(values.tolist(), starts.tolist(), ends)
+    }
+
+
+def write_columnar(out_dir: str, columns: Dict[str, np.ndarray], groups: dict) -> None:
+    """
+    Write a columnar dataset: one .npy file per column, index.json written last
+    """
+    makedirs(out_dir, exist_ok=True)
+    rows = len(next(iter(columns.values()), []))
+    for name, values in columns.items():
+        if len(values) != rows:
+            raise ValueError(f"! Column {name} has {len(values)} rows, expected {rows} !")
+        if values.dtype.hasobject:
+            # Object arrays are pickled and can not be memory-mapped
+            raise ValueError(f"! Column {name} has dtype object, use fixed width bytes !")
+        np.save(path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(values))
+    index = {
+        "rows": rows,
+        "columns": {name: values.dtype.str for name, values in columns.items()},
+        "groups": groups,
+    }
+    index_path = path.join(out_dir, COLUMNAR_INDEX)
+    with open(f"{index_path}.tmp", "w") as index_file:
+        dump(index, index_file)
+    replace(f"{index_path}.tmp", index_path)
+
+
+class ColumnarDataset:
+    """
+    Memory-mapped columnar dataset, nothing is read until a column is used
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        index_path = path.join(data_dir, COLUMNAR_INDEX)
+        self.mtime_ns = stat(index_path).st_mtime_ns
+        with open(index_path) as index_file:
+            index = load(index_file)
+        self.rows = index["rows"]
+        self.groups = index["groups"]
+        self.columns = {
+            name: np.load(path.join(data_dir, f"{name}.npy"), mmap_mode="r")
+            for name in index["columns"]
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"<ColumnarDataset(data_dir='{self.data_dir}', rows={self.rows}, "
+            f"groups={len(self.groups)})>"
+        )
+
+    def group(self, key: str) -> Dict[str, np.ndarray]:
+        """
+        Columns (read-only views) of one group, raises KeyError for an unknown key
+        """
+        start, end = self.groups[key]
+        return {name: values[start:end] for name, values in self.columns.items()}
+
+    def records(self, start: int = 0, end: int = None) -> np.ndarray:
+        """
+        Rows as a TICK_DTYPE record array (copy), for the wire format columns present
+        """
+        end = self.rows if end is None else end
+        arr = np.zeros(end - start, dtype=wire_format.TICK_DTYPE)
+        for field in wire_format.TICK_DTYPE.names:
+            if field in self.columns:
+                arr[field] = self.columns[field][start:end]
+        return arr
+
+    def minute_batches(self) -> Iterator[np.ndarray]:
+        """
+        Intraday dataset grouped by minute -> one TICK_DTYPE batch per minute
+        """
+        for start, end in self.groups.values():
+            yield self.records(start, end)
+
+
+def intraday_minutes(sources: List[str]) -> Iterator[np.ndarray]:
+    """
+    Minute batches of intraday data: columnar datasets (one per day, replayed in order)
+    when every source is one, else a k-way merge of the CSV files
+    """
+    if sources and all(is_columnar(source) for source in sources):
+        datasets = [ColumnarDataset(source) for source in sources]
+        datasets.sort(key=lambda dataset: int(next(iter(dataset.groups), 0)))
+        return chain.from_iterable(dataset.minute_batches() for dataset in datasets)
+    return merge_ticks(sources)
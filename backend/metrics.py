@@ -0,0 +1,373 @@
+"""
+Python: 3.7.9
+
+Counters, gauges and latency histograms of the stock stream, in Prometheus text format
+
+Every process (producer, consumer, server) records into the module's REGISTRY:
+    stock_stream_operation_seconds{operation}       : AWS calls and socket emits
+    stock_stream_operation_errors_total{operation}  : Calls that raised
+    stock_stream_rows_total{stage}                  : Rows produced, consumed, stored...
+    stock_stream_trace_seconds{stage}               : Per-batch trace, produced -> emitted
+
+The server exposes its registry on /metrics, the producer and consumer with
+start_http_server(port). Recording an event only appends to a deque (atomic, no lock),
+the events are folded into the counts in bulk every FOLD_SIZE events and on every
+scrape, so it stays well under 1 microsecond. Label lookups are done once by keeping
+the children:
+
+    GET_RECORDS = metrics.operation("get_records")
+    with GET_RECORDS.time():
+        client.get_records(...)
+
+time() builds a context manager per block (~1 us per event), hot paths (ex: a socket
+emit per client) keep the start time instead, which costs a clock read and an observe:
+
+    started = perf_counter()
+    socketio.emit(...)
+    EMIT.time_since(started)
+"""
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "stock_stream_"
+# Upper bounds (seconds) of the latency buckets: 100us to 10s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0
+)
+# Trace stages of a batch (tick_channel.STAGES), from the producer to the socket emit
+TRACE_STAGES = ["produced", "consumed", "parsed", "published", "received", "emitted"]
+# Events recorded before they are folded into the counts
+FOLD_SIZE = 1024
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter of one label set
+    """
+    __slots__ = ("total", "pending", "__lock")
+
+    def __init__(self):
+        self.total = 0.0
+        self.pending = deque()
+        self.__lock = Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.pending.append(amount)
+        if len(self.pending) >= FOLD_SIZE:
+            self.fold()
+
+    def fold(self) -> None:
+        with self.__lock:
+            pending = self.pending
+            # popleft is atomic: increments made while folding wait for the next fold
+            self.total += sum(pending.popleft() for _ in range(len(pending)))
+
+    @property
+    def value(self) -> float:
+        self.fold()
+        return self.total
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{labels} {format_value(self.value)}"]
+
+
+class Gauge:
+    """
+    Value of one label set that goes up and down, or read from a function when scraped
+    """
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        value = self.value if self.function is None else self.function()
+        return [f"{name}{labels} {format_value(value)}"]
+
+
+class Histogram:
+    """
+    Distribution of one label set over fixed buckets (counts are cumulative when rendered)
+    """
+    __slots__ = ("bounds", "counts", "sum", "pending", "__lock")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(bounds))
+        # One count per bucket, the last one is +Inf
+        self.counts = np.zeros(len(self.bounds) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.pending = deque()
+        self.__lock = Lock()
+
+    def observe(self, value: float) -> None:
+        self.pending.append(value)
+        if len(self.pending) >= FOLD_SIZE:
+            self.fold()
+
+    def fold(self) -> None:
+        with self.__lock:
+            pending = self.pending
+            values = np.fromiter(
+                (pending.popleft() for _ in range(len(pending))), dtype=np.float64
+            )
+            if not len(values):
+                return
+            # value <= bound falls in the bucket of the bound ("le")
+            self.counts += np.bincount(
+                np.searchsorted(self.bounds, values, side="left"), minlength=len(self.counts)
+            )
+            self.sum += float(values.sum())
+
+    @property
+    def count(self) -> int:
+        self.fold()
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q quantile (inf past the last bucket)
+        """
+        self.fold()
+        counts = self.counts.tolist()
+        rank = q * sum(counts)
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            total += count
+            if total >= rank and total:
+                return bound
+        return 0.0
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        self.fold()
+        with self.__lock:
+            counts = self.counts.tolist()
+            total_sum = self.sum
+        lines = []
+        total = 0
+        inner = labels[1:-1]
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            total += count
+            le = f'le="{format_value(bound)}"'
+            lines.append(f"{name}_bucket{{{inner + ',' if inner else ''}{le}}} {total}")
+        lines.append(f"{name}_sum{labels} {format_value(total_sum)}")
+        lines.append(f"{name}_count{labels} {total}")
+        return lines
+
+
+class Family:
+    """
+    A metric and its children, one per label values: family.labels("get_records")
+    """
+
+    def __init__(self, name: str, help: str, kind: type, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.__lock = Lock()
+
+    def labels(self, *values: str):
+        if len(values) != len(self.label_names):
+            raise ValueError(f"! {self.name} takes labels: {', '.join(self.label_names)} !")
+        child = self.children.get(values)
+        if child is None:
+            with self.__lock:
+                child = self.children.setdefault(values, self.kind())
+        return child
+
+    def render(self) -> List[str]:
+        kind = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}[self.kind]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {kind}"]
+        for values, child in sorted(self.children.items()):
+            lines.extend(child.samples(self.name, format_labels(self.label_names, values)))
+        return lines
+
+
+class Registry:
+    """
+    Metric families of a process, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.__lock = Lock()
+
+    def __family(self, name: str, help: str, kind: type, labels: Tuple[str, ...]) -> Family:
+        with self.__lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = Family(name, help, kind, labels)
+            elif family.kind is not kind or family.label_names != tuple(labels):
+                raise ValueError(f"! Metric already registered with other type/labels: {name} !")
+            return family
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self.__family(name, help, Counter, labels)
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self.__family(name, help, Gauge, labels)
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self.__family(name, help, Histogram, labels)
+
+    def render(self) -> str:
+        with self.__lock:
+            families = [self.families[name] for name in sorted(self.families)]
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+OPERATION_SECONDS = REGISTRY.histogram(
+    PREFIX + "operation_seconds", "Latency of AWS calls and socket emits", ("operation",)
+)
+OPERATION_ERRORS = REGISTRY.counter(
+    PREFIX + "operation_errors_total", "AWS calls and socket emits that raised", ("operation",)
+)
+ROWS = REGISTRY.counter(PREFIX + "rows_total", "Tick rows handled per stage", ("stage",))
+TRACE_SECONDS = REGISTRY.histogram(
+    PREFIX + "trace_seconds", "Latency of the tick batches between two trace stages", ("stage",)
+)
+
+
+class Timer:
+    """
+    Context manager observing the time spent in the block (and counting the errors)
+    """
+    __slots__ = ("operation", "started")
+
+    def __init__(self, operation: "Operation"):
+        self.operation = operation
+        self.started = perf_counter()
+
+    def __enter__(self) -> "Timer":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.operation.latency.observe(perf_counter() - self.started)
+        if exc_type is not None:
+            self.operation.errors.inc()
+        return False
+
+
+class Operation:
+    """
+    Latency histogram and error counter of an operation (ex: "get_records")
+    """
+    __slots__ = ("name", "latency", "errors")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = OPERATION_SECONDS.labels(name)
+        self.errors = OPERATION_ERRORS.labels(name)
+
+    def time(self) -> Timer:
+        return Timer(self)
+
+    def observe(self, seconds: float) -> None:
+        self.latency.observe(seconds)
+
+    def time_since(self, started: float) -> None:
+        """
+        Observe the time since `started` (a perf_counter() value), the cheap time()
+        """
+        self.latency.observe(perf_counter() - started)
+
+
+_operations = {}
+
+
+def operation(name: str) -> Operation:
+    """
+    Operation of the default registry, created on first use
+    """
+    op = _operations.get(name)
+    if op is None:
+        op = _operations.setdefault(name, Operation(name))
+    return op
+
+
+def rows(stage: str) -> Counter:
+    return ROWS.labels(stage)
+
+
+def record_trace(trace: Dict[str, float]) -> None:
+    """
+    Observe the latency between the consecutive stages of a batch trace
+    """
+    stages = [stage for stage in TRACE_STAGES if stage in trace]
+    for start, end in zip(stages, stages[1:]):
+        TRACE_SECONDS.labels(f"{start}->{end}").observe(max(0.0, trace[end] - trace[start]))
+    if len(stages) > 1:
+        TRACE_SECONDS.labels("total").observe(max(0.0, trace[stages[-1]] - trace[stages[0]]))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Scrapes every few seconds would flood the logs
+        return
+
+
+def start_http_server(port: int, addr: str = "", registry: Registry = REGISTRY):
+    """
+    Serve the registry on http://addr:port/metrics from a daemon thread, returns the server
+    """
+    handler = type("Handler", (MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,402 @@
+"""
+Python: 3.7.9
+
+Staged consumer pipeline: fetch -> parse -> sink, connected by bounded queues
+
+    fetch : ShardConsumer, one worker per shard. Every GetRecords response becomes a
+            work item, blocking while the parse queue of its shard is full (backpressure
+            slows the reads down instead of buffering without limit)
+    parse : Parser threads, the shards are spread over the parsers so the batches of a
+            shard are parsed and published (tick channel, candles, indicators) in order
+    sink  : Writer threads storing the parsed batches in DynamoDB, in any order
+
+A shard is checkpointed up to its last item that was written along with every item
+read before it (CheckpointTracker), so a restart never skips an unwritten batch.
+stats() reports the throughput, utilization and queue depth of every stage.
+
+Records that fail to parse are logged and skipped by the parse callable (a retry would
+fail the same way), the other records of their batch are written. A batch still failing
+to be written after SINK_ATTEMPTS fails its shard: the shard stops being read (its
+checkpoint cannot move past the batch, reading on would only pile up items), is reported
+by stats(), the failed shards gauge and drain(), and a restart resumes it from its
+checkpoint.
+"""
+import logging
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import perf_counter, sleep, time
+from typing import Any, Callable, Dict, List
+import zlib
+import numpy as np
+from shard_consumer import SHARD_END, ShardConsumer
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Work items waiting in the queue of every parser / in the sink queue
+PARSE_QUEUE_SIZE = 16
+SINK_QUEUE_SIZE = 64
+# Attempts of a sink write before its shard is failed (and stops being read)
+SINK_ATTEMPTS = 5
+SINK_BACKOFF = 0.5
+# Seconds between two checks of the stop flag while blocked on a queue
+QUEUE_POLL = 0.5
+
+
+class StageStats:
+    """
+    Work items, rows and busy time of a stage
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.failed = 0
+        self.started = perf_counter()
+        self.__lock = Lock()
+
+    def add(self, items: int, rows: int, seconds: float) -> None:
+        with self.__lock:
+            self.items += items
+            self.rows += rows
+            self.busy += seconds
+
+    def fail(self) -> None:
+        with self.__lock:
+            self.failed += 1
+
+    def summary(self, queue_depth: int = None) -> dict:
+        with self.__lock:
+            elapsed = max(perf_counter() - self.started, 1e-9)
+            summary = {
+                "items": self.items,
+                "rows": self.rows,
+                "failed": self.failed,
+                "items_per_sec": self.items / elapsed,
+                "rows_per_sec": self.rows / elapsed,
+                # Fraction of the stage's worker time spent working
+                "utilization": self.busy / (elapsed * self.workers),
+            }
+        if queue_depth is not None:
+            summary["queue"] = queue_depth
+        return summary
+
+
+class CheckpointTracker:
+    """
+    Checkpoints every shard up to its longest prefix of completed items
+
+    add(shard_id, sequence_number) in read order gives the item a ticket,
+    done(shard_id, ticket) once it is written. checkpoint(shard_id, sequence_number)
+    is called when the prefix grows, with the sequence number of its last item.
+    """
+
+    def __init__(self, checkpoint: Callable[[str, str], None]):
+        self.checkpoint = checkpoint
+        self.__shards = {}
+        self.__lock = Lock()
+
+    def add(self, shard_id: str, sequence_number: str) -> int:
+        with self.__lock:
+            shard = self.__shards.get(shard_id)
+            if shard is None:
+                shard = self.__shards[shard_id] = {
+                    "next": 0, "committed": 0, "sequence_numbers": {}, "done": set()
+                }
+            ticket = shard["next"]
+            shard["next"] += 1
+            shard["sequence_numbers"][ticket] = sequence_number
+            return ticket
+
+    def done(self, shard_id: str, ticket: int) -> None:
+        with self.__lock:
+            shard = self.__shards[shard_id]
+            shard["done"].add(ticket)
+            sequence_number = None
+            while shard["committed"] in shard["done"]:
+                shard["done"].remove(shard["committed"])
+                sequence_number = shard["sequence_numbers"].pop(shard["committed"])
+                shard["committed"] += 1
+            # Under the lock: checkpoints of a shard never go backwards
+            if sequence_number is not None:
+                self.checkpoint(shard_id, sequence_number)
+
+    def pending(self) -> Dict[str, int]:
+        """
+        shard_id -> items read but not checkpointed yet
+        """
+        with self.__lock:
+            return {
+                shard_id: shard["next"] - shard["committed"]
+                for shard_id, shard in self.__shards.items()
+            }
+
+
+class Pipeline:
+    """
+    Consumer pipeline of a stream
+
+    parse(records) -> np.ndarray : Parse (and publish) the records of a GetRecords
+                                   response, returns the rows to store (TICK_DTYPE)
+    sink(batch)                  : Store the rows, raising on failure
+
+    The consumer's handler, auto_checkpoint and on_shard_end are set by the pipeline.
+    """
+
+    def __init__(
+        self,
+        consumer: ShardConsumer,
+        parse: Callable[[List[dict]], np.ndarray],
+        sink: Callable[[np.ndarray], Any],
+        parsers: int = 2,
+        sinks: int = 4,
+        parse_queue_size: int = PARSE_QUEUE_SIZE,
+        sink_queue_size: int = SINK_QUEUE_SIZE
+    ):
+        self.consumer = consumer
+        self.parse = parse
+        self.sink = sink
+        self.tracker = CheckpointTracker(self.__checkpoint)
+        # shard_id -> error of the write that failed the shard
+        self.failed_shards = {}
+
+        # The pipeline checkpoints, the shard workers only feed it
+        consumer.handler = self.submit
+        consumer.auto_checkpoint = False
+        consumer.on_shard_end = self.__shard_end
+
+        self.parse_queues = [Queue(parse_queue_size) for _ in range(max(1, parsers))]
+        self.sink_queue = Queue(sink_queue_size)
+        self.fetch_stats = StageStats("fetch", 1)
+        self.parse_stats = StageStats("parse", len(self.parse_queues))
+        self.sink_stats = StageStats("sink", max(1, sinks))
+        self.__stop = Event()
+        self.__threads = [
+            Thread(target=self.__parse_loop, args=(queue,), name=f"parser-{idx}", daemon=True)
+            for idx, queue in enumerate(self.parse_queues)
+        ] + [
+            Thread(target=self.__sink_loop, name=f"sink-{idx}", daemon=True)
+            for idx in range(self.sink_stats.workers)
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"<Pipeline(stream_name='{self.consumer.api.stream_name}', "
+            f"parsers={len(self.parse_queues)}, sinks={self.sink_stats.workers})>"
+        )
+
+    def __put(self, queue: Queue, item: tuple) -> bool:
+        """
+        Blocking put that gives up when the pipeline stops, returns True when queued
+        """
+        while not self.__stop.is_set():
+            try:
+                queue.put(item, timeout=QUEUE_POLL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __get(self, queue: Queue) -> tuple:
+        while not self.__stop.is_set():
+            try:
+                return queue.get(timeout=QUEUE_POLL)
+            except Empty:
+                continue
+        return None
+
+    def __route(self, shard_id: str) -> Queue:
+        return self.parse_queues[zlib.crc32(shard_id.encode("utf-8")) % len(self.parse_queues)]
+
+    def submit(self, shard_id: str, records: List[dict]) -> None:
+        """
+        Handler of the shard workers: queue a GetRecords response for parsing
+        """
+        if shard_id in self.failed_shards:
+            # Could never be checkpointed, read again after a restart
+            return
+        started = perf_counter()
+        ticket = self.tracker.add(shard_id, records[-1]["sequence_number"])
+        if self.__put(self.__route(shard_id), (shard_id, ticket, records)):
+            # Time blocked on a full queue counts as busy (backpressure)
+            self.fetch_stats.add(1, len(records), perf_counter() - started)
+
+    def __shard_end(self, shard_id: str) -> None:
+        """
+        A closed shard is marked done once every item read before the end is written
+        """
+        self.tracker.done(shard_id, self.tracker.add(shard_id, SHARD_END))
+
+    def __fail_shard(self, shard_id: str, err: Exception) -> None:
+        logger.error(
+            "Stopped reading shard: %s, a batch could not be written after %d attempts: %s "
+            "(checkpointed up to the batch, restart to resume)", shard_id, SINK_ATTEMPTS, err
+        )
+        self.failed_shards[shard_id] = str(err)
+        self.consumer.stop_shard(shard_id)
+
+    def __checkpoint(self, shard_id: str, sequence_number: str) -> None:
+        self.consumer.checkpoint(shard_id, sequence_number)
+        if sequence_number == SHARD_END:
+            # Children of the shard can be read now
+            self.consumer.rediscover()
+
+    def __parse_loop(self, queue: Queue) -> None:
+        while True:
+            item = self.__get(queue)
+            if item is None:
+                return
+            shard_id, ticket, records = item
+            started = perf_counter()
+            try:
+                batch = self.parse(records)
+            except Exception:
+                # The parse callable skips the records that fail to parse: this batch failed
+                # as a whole (ex: publishing), skipped so the checkpoints of the shard move on
+                logger.exception(
+                    "Skipped %d records of shard: %s that failed to process (sequence numbers "
+                    "%s to %s)", len(records), shard_id, records[0]["sequence_number"],
+                    records[-1]["sequence_number"]
+                )
+                self.parse_stats.fail()
+                self.tracker.done(shard_id, ticket)
+                continue
+            self.parse_stats.add(1, len(batch), perf_counter() - started)
+            self.__put(self.sink_queue, (shard_id, ticket, batch))
+
+    def __sink_loop(self) -> None:
+        while True:
+            item = self.__get(self.sink_queue)
+            if item is None:
+                return
+            shard_id, ticket, batch = item
+            started = perf_counter()
+            error = None
+            for attempt in range(1, SINK_ATTEMPTS + 1):
+                try:
+                    if len(batch):
+                        self.sink(batch)
+                    error = None
+                    break
+                except Exception as err:
+                    error = err
+                    logger.warning(
+                        "Write of %d rows of shard: %s failed (attempt %d/%d): %s",
+                        len(batch), shard_id, attempt, SINK_ATTEMPTS, err
+                    )
+                    if attempt < SINK_ATTEMPTS and self.__stop.wait(SINK_BACKOFF * attempt):
+                        # Stopping: not checkpointed, read again after a restart
+                        break
+            if error is not None:
+                self.sink_stats.fail()
+                if not self.__stop.is_set():
+                    self.__fail_shard(shard_id, error)
+                continue
+            self.sink_stats.add(1, len(batch), perf_counter() - started)
+            self.tracker.done(shard_id, ticket)
+
+    def stats(self) -> dict:
+        fetch = self.fetch_stats.summary()
+        # Shard worker time spent blocked on full parse queues, per second
+        fetch["blocked"] = fetch.pop("utilization")
+        fetch["reads"] = self.consumer.stats()
+        return {
+            "fetch": fetch,
+            "parse": self.parse_stats.summary(sum(queue.qsize() for queue in self.parse_queues)),
+            "sink": self.sink_stats.summary(self.sink_queue.qsize()),
+            "pending": self.tracker.pending(),
+            "failed_shards": dict(self.failed_shards),
+        }
+
+    def register_metrics(self, registry: metrics.Registry = metrics.REGISTRY) -> None:
+        """
+        Export the queue depths, checkpoint backlog and lag as gauges (read when scraped)
+        """
+        queues = registry.gauge(
+            metrics.PREFIX + "pipeline_queue_depth", "Work items waiting per stage", ("stage",)
+        )
+        queues.labels("parse").set_function(
+            lambda: sum(queue.qsize() for queue in self.parse_queues)
+        )
+        queues.labels("sink").set_function(self.sink_queue.qsize)
+        registry.gauge(
+            metrics.PREFIX + "pipeline_pending", "Work items read but not checkpointed"
+        ).labels().set_function(lambda: sum(self.tracker.pending().values()))
+        registry.gauge(
+            metrics.PREFIX + "pipeline_failed_shards", "Shards stopped after a failed write"
+        ).labels().set_function(lambda: len(self.failed_shards))
+        registry.gauge(
+            metrics.PREFIX + "millis_behind_latest", "How far the slowest shard is behind"
+        ).labels().set_function(lambda: self.consumer.stats()["millis_behind_latest"])
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        reads = stats["fetch"]["reads"]
+        logger.info(
+            "fetch: %d reads (%d empty, %d throttled), %.0f rows/s, %d ms behind, "
+            "%.0f%% blocked | "
+            "parse: %.0f rows/s, %.0f%% busy, queue %d | sink: %.0f rows/s, %.0f%% busy, "
+            "queue %d | not checkpointed: %d | failed shards: %s",
+            reads["get_records"], reads["empty_reads"], reads["throttled"],
+            stats["fetch"]["rows_per_sec"], reads["millis_behind_latest"],
+            stats["fetch"]["blocked"] * 100,
+            stats["parse"]["rows_per_sec"], stats["parse"]["utilization"] * 100,
+            stats["parse"]["queue"], stats["sink"]["rows_per_sec"],
+            stats["sink"]["utilization"] * 100, stats["sink"]["queue"],
+            sum(stats["pending"].values()), sorted(stats["failed_shards"]) or "none"
+        )
+
+    def start(self) -> None:
+        self.__stop.clear()
+        for thread in self.__threads:
+            thread.start()
+        self.consumer.start()
+
+    def drain(self, timeout: float = None) -> bool:
+        """
+        Wait until every item read is written and checkpointed, returns False on timeout
+        or when a shard failed (its items are never checkpointed)
+        """
+        started = time()
+        while any(
+            pending for shard_id, pending in self.tracker.pending().items()
+            if shard_id not in self.failed_shards
+        ):
+            if timeout is not None and time() - started > timeout:
+                return False
+            sleep(0.01)
+        return not self.failed_shards
+
+    def stop(self) -> None:
+        self.consumer.stop()
+        self.__stop.set()
+
+    def join(self, timeout: float = None) -> None:
+        self.consumer.join(timeout)
+        for thread in self.__threads:
+            thread.join(timeout)
+
+    def run_forever(self, report_interval: float = None) -> None:
+        """
+        Start the stages and block until interrupted (Ctrl+C), logging the stage
+        stats every report_interval seconds when given
+        """
+        self.start()
+        reported = time()
+        try:
+            while not self.__stop.wait(1.0):
+                if report_interval and time() - reported >= report_interval:
+                    reported = time()
+                    self.log_stats()
+        except KeyboardInterrupt:
+            logger.info("Stopping pipeline...")
+        finally:
+            self.consumer.stop()
+            # Let the items already read reach DynamoDB before stopping the stages
+            self.drain(timeout=30.0)
+            self.stop()
+            self.join()
@@ -0,0 +1,133 @@
+"""
+Python: 3.7.9
+
+Adaptive GetRecords polling of a Kinesis shard
+
+A shard allows 5 GetRecords calls per second (shared by all its consumers), every
+call is billed, and an empty response only says there was nothing new yet. So:
+    - records, far behind the tip  : read again right away (catching up)
+    - records, at the tip          : read again after min_interval
+    - no records                   : back off after idle_reads empty reads in a row,
+                                     up to max_interval
+    - throttled (or failed)        : retry after a jittered exponential backoff
+and every read takes a token of a per-shard token bucket (reads_per_second).
+"""
+from random import random
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+
+# GetRecords limit of a shard
+MAX_READS_PER_SECOND = 5.0
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException", "LimitExceededException", "ThrottlingException"
+}
+THROTTLE_BACKOFF_BASE = 0.2
+THROTTLE_BACKOFF_CAP = 10.0
+
+
+def error_code(err: Exception) -> str:
+    """
+    AWS error code of a botocore ClientError ("" for anything else)
+    """
+    response = getattr(err, "response", None) or {}
+    return response.get("Error", {}).get("Code", "")
+
+
+def is_throttled(err: Exception) -> bool:
+    return error_code(err) in THROTTLING_ERRORS
+
+
+class TokenBucket:
+    """
+    rate tokens per second, at most `burst` tokens saved up
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("! rate must be > 0 !")
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.__tokens = self.burst
+        self.__updated = monotonic()
+        self.__lock = Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens, returns the seconds to wait before using them
+        """
+        with self.__lock:
+            now = monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= tokens
+            return max(0.0, -self.__tokens / self.rate)
+
+
+class PollScheduler:
+    """
+    Delay before the next GetRecords call of a shard, from the last response
+
+    min_interval     : Delay after a non-empty read at the tip of the stream
+    max_interval     : Longest delay between reads of an idle shard
+    backoff          : Delay multiplier of every empty read after idle_reads in a row
+    idle_reads       : Empty reads in a row before backing off (gaps between batches)
+    catchup_millis   : MillisBehindLatest above which reads follow each other right away
+    reads_per_second : Token bucket rate, every read takes a token
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.2,
+        max_interval: float = 5.0,
+        backoff: float = 2.0,
+        idle_reads: int = 3,
+        catchup_millis: int = 1000,
+        reads_per_second: float = MAX_READS_PER_SECOND
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.idle_reads = idle_reads
+        self.empty_reads = 0
+        self.catchup_millis = catchup_millis
+        self.bucket = TokenBucket(reads_per_second)
+        self.interval = min_interval
+        # Consecutive failed reads
+        self.retries = 0
+
+    def __str__(self) -> str:
+        return (
+            f"<PollScheduler(interval={self.interval:.2f}s, "
+            f"rate={self.bucket.rate}/s, retries={self.retries})>"
+        )
+
+    def after_read(self, records: int, millis_behind: int) -> float:
+        self.retries = 0
+        self.empty_reads = 0 if records else self.empty_reads + 1
+        if records and millis_behind > self.catchup_millis:
+            self.interval = self.min_interval
+            return 0.0
+        if self.empty_reads <= self.idle_reads:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, max(self.interval, 1e-3) * self.backoff)
+        return self.interval
+
+    def after_error(self, err: Exception) -> float:
+        """
+        Full jitter exponential backoff (throttling and other errors)
+        """
+        self.retries += 1
+        return random() * min(THROTTLE_BACKOFF_CAP, THROTTLE_BACKOFF_BASE * 2 ** self.retries)
+
+    def wait(self, delay: float, sleep: Any) -> bool:
+        """
+        Wait `delay` then for a token with sleep(seconds) (ex: Event.wait, returning True
+        to stop early). Returns True when stopped.
+        """
+        if delay > 0 and sleep(delay):
+            return True
+        delay = self.bucket.reserve()
+        return bool(delay > 0 and sleep(delay))
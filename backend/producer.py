@@ -5,65 +5,145 @@ Python: 3.7.9
 
 Reads stock data from CSV files and simulates stock streaming into AWS Kinesis Data Stream
 """
+from argparse import ArgumentParser
+from glob import glob
 from os import path
 from datetime import datetime
-from time import sleep
+import numpy as np
 import pandas as pd
 from kinesis_api import KinesisAPI
+from kinesis_writer import BufferedKinesisWriter
+from market_data import intraday_minutes
+from simulator import GBMGenerator, MinuteScheduler, RateReport, symbol_slices
+import metrics
+import wire_format
 
 
 CUR_DIR = path.realpath(path.dirname(__file__))
 BASE_DIR = path.dirname(CUR_DIR)
 DATA_DIR_ROOT = path.join(BASE_DIR, "data")
 
-CSV_FILENAME = "intraday-22-oct-merged.csv"
+# Per-symbol intraday files, one directory per day
+INTRADAY_DIRS = "intraday-*/"
+# Columnar (memory-mapped) copies of the intraday folders, see data/data_editor.py
+COLUMNAR_DIR = path.join(DATA_DIR_ROOT, "columnar")
 KINESIS_STREAM_NAME = "stock-stream"
-KINESIS_SHARD_PARTITION_KEY = "stock"
+# Max seconds a record is buffered before it is sent with PutRecords
+KINESIS_LINGER = 0.1
+# "binary": wire_format tick batches, "json": DataFrame.to_dict() as JSON
+WIRE_FORMAT = "binary"
+# Simulation speed: 1.0 is real time (one minute of data per minute), 0 is max throughput
+SPEED = 1.0
+# Print the achieved vs target rate every N minutes of data
+REPORT_EVERY = 10
+# Port of the Prometheus /metrics endpoint (0 to disable)
+METRICS_PORT = 9101
+
+
+def encode_batch(rows: np.ndarray, batch_id: int = 0):
+    """
+    Serialize a batch of rows (TICK_DTYPE record array) for Kinesis in the configured WIRE_FORMAT
+    """
+    if WIRE_FORMAT == "binary":
+        return wire_format.encode_records(rows, batch_id=batch_id)
+    return pd.DataFrame(wire_format.to_rows(rows)).to_dict()
 
 
-def simulate():
+def parse_speed(value: str) -> float:
     """
-    Simualte real time stream and post to Kinesis Data Stream Shard
-    All companies at regular interval
+    "60", "60x" or "max" -> speed multiplier (0 is max throughput)
     """
+    value = value.lower().rstrip("x")
+    return 0.0 if value == "max" else float(value)
 
-    # Load CSV into DataFrame
-    df = pd.read_csv(path.join(DATA_DIR_ROOT, CSV_FILENAME))
 
-    print(f"Shape of DataFrame: {df.shape}")
-    print("DataFrame:")
-    print(df, "\n")
+def simulate(files: list = None, speed: float = SPEED, synthetic: GBMGenerator = None):
+    """
+    Simualte real time stream and post to Kinesis Data Stream Shard
+    All companies at regular interval, one minute of data per 60 / speed seconds
 
-    # Groups of 10 rows
-    group = df.groupby(df.index // 10)
+    files: intraday CSV files or directories merged minute by minute, or columnar datasets
+           (default: INTRADAY_DIRS, their columnar copies when converted)
+    synthetic: GBM generator used instead of the CSV files
+    """
+    if synthetic is not None:
+        minutes = iter(synthetic)
+        print(f"Synthetic data: {synthetic}")
+    else:
+        files = files or (
+            sorted(glob(path.join(COLUMNAR_DIR, INTRADAY_DIRS)))
+            or sorted(glob(path.join(DATA_DIR_ROOT, INTRADAY_DIRS)))
+        )
+        # Memory-mapped columnar datasets, else a streamed k-way merge of the CSV files
+        minutes = intraday_minutes(files)
+        print(f"Replaying: {', '.join(files)}")
 
     # Connect to Kinesis using API
     api = KinesisAPI(stream_name=KINESIS_STREAM_NAME)
+    writer = BufferedKinesisWriter(api, linger=KINESIS_LINGER)
+    scheduler = MinuteScheduler(speed)
+    report = RateReport(scheduler)
 
     print("-" * 64, "\n")
 
     start = datetime.now()
-    print(f"[{start.strftime('%Y-%m-%d %H:%M:%S')}] Starting Kinesis producer...\n")
-
-    # Send records for a group of 10 companies every 1 minute
-    for idx, group in df.groupby(df.index // 10):
-        now = datetime.now()
-        print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] Sending data:")
-        print(group)
-        api.write_record(
-            data=group.to_dict(),
-            partition_key=KINESIS_SHARD_PARTITION_KEY
-        )
-        print("")
-        sleep(60.0)
+    print(f"[{start.strftime('%Y-%m-%d %H:%M:%S')}] Starting Kinesis producer {scheduler}...\n")
+
+    produced = metrics.rows("produced")
+    # Send the records of every minute when it is due on the monotonic schedule
+    for idx, batch in enumerate(minutes):
+        lag = scheduler.wait(idx)
+        # One record per company, partitioned by symbol to spread load across shards
+        for rows in symbol_slices(batch):
+            symbol = rows["symbol"][0].decode("ascii")
+            writer.put(data=encode_batch(rows, batch_id=idx), partition_key=symbol)
+        writer.flush()
+        produced.inc(len(batch))
+        report.add(len(batch))
+        if idx % REPORT_EVERY == 0 or lag > 1.0:
+            now = datetime.now()
+            behind = f" | behind schedule by {lag:.2f}s" if lag > 1.0 else ""
+            print(f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] {report}{behind}")
 
     end = datetime.now()
-    print(f"[{end.strftime('%Y-%m-%d %H:%M:%S')}] Finished producing. Exiting...\n")
+    print(f"\n[{end.strftime('%Y-%m-%d %H:%M:%S')}] Finished producing: {report}")
+    print(f"Kinesis writer: {writer.stats}\n")
+    writer.close()
     api.close()
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Stock Data Producer for AWS Kinesis")
+    parser.add_argument(
+        "files", nargs="*", help="Intraday CSV files or directories to replay together"
+    )
+    parser.add_argument(
+        "--speed", type=parse_speed, default=SPEED,
+        help="Speed multiplier: 1 (real time), 60 (a minute per second) or max"
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=0, metavar="SYMBOLS",
+        help="Generate GBM ticks for this many symbols instead of replaying CSV files"
+    )
+    parser.add_argument("--minutes", type=int, default=390, help="Synthetic minutes per day")
+    parser.add_argument("--days", type=int, default=1, help="Synthetic days to generate")
+    parser.add_argument("--seed", type=int, default=None, help="Synthetic random seed")
+    parser.add_argument("--format", choices=["binary", "json"], default=WIRE_FORMAT)
+    parser.add_argument(
+        "--metrics-port", type=int, default=METRICS_PORT, help="/metrics port (0 to disable)"
+    )
+    args = parser.parse_args()
+    WIRE_FORMAT = args.format
+
     print("====================================")
     print("Stock Data Producer for AWS Kinesis")
     print("====================================")
-    simulate()
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+        print(f"Metrics: http://localhost:{args.metrics_port}/metrics")
+    generator = None
+    if args.synthetic:
+        generator = GBMGenerator(
+            symbols=args.synthetic, minutes=args.minutes, days=args.days, seed=args.seed
+        )
+    simulate(files=args.files, speed=args.speed, synthetic=generator)
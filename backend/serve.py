@@ -0,0 +1,119 @@
+"""
+Python: 3.7.9
+
+Production entry point of the server: debug off, on a cooperative runtime (eventlet or
+gevent, pip install eventlet) where every Socket.IO connection is a green thread instead
+of an OS thread. The standard library is monkey patched before the server is imported,
+so the blocking calls (boto3 and the DynamoDB queries, sleeps, the tick channel) yield
+to the other connections.
+
+--workers N starts N server processes on ports --port .. --port + N - 1, put them behind
+a load balancer with sticky sessions (Socket.IO long-polling, ex: nginx ip_hash). Without
+a message queue every worker sends the live updates to its own clients. With one, the
+first worker (the broadcaster) sends them through the queue to the clients of every
+worker, and refreshes the symbols from DynamoDB once for all of them. The other workers
+announce the rooms of their clients to it (cluster.py) and only reply to their clients:
+
+$ python local_redis.py --port 6379   # or a Redis server, pip install redis
+$ python serve.py --workers 4 --port 5000 --message-queue redis://127.0.0.1:6379/0
+
+`python server.py` stays the threaded development server.
+"""
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from os import environ, path
+from subprocess import Popen
+import sys
+
+
+ASYNC_MODES = ("eventlet", "gevent", "threading")
+
+
+def default_async_mode() -> str:
+    """
+    First installed cooperative runtime, "threading" without any
+    """
+    for async_mode in ASYNC_MODES[:-1]:
+        if find_spec(async_mode) is not None:
+            return async_mode
+    return "threading"
+
+
+def patch(async_mode: str) -> None:
+    """
+    Monkey patch the standard library for a cooperative runtime and select it for the
+    server, call it before importing server
+    """
+    if async_mode == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+    elif async_mode == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+    environ["SERVER_ASYNC_MODE"] = async_mode
+
+
+def run_workers(args) -> None:
+    """
+    Start args.workers server processes on consecutive ports and wait for them
+    """
+    workers = []
+    for idx in range(args.workers):
+        command = [
+            sys.executable, path.realpath(__file__), "--workers", "1", "--host", args.host,
+            "--port", str(args.port + idx), "--async-mode", args.async_mode,
+            "--max-connections", str(args.max_connections)
+        ]
+        if args.message_queue:
+            command += ["--message-queue", args.message_queue]
+            if idx > 0:
+                command.append("--no-broadcast")
+        workers.append(Popen(command))
+    print(
+        f"Started {args.workers} workers ({args.async_mode}) on "
+        f"{args.host}:{args.port}-{args.port + args.workers - 1}"
+    )
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Stock stream server on a cooperative runtime")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000, help="Port of the first worker")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes")
+    parser.add_argument("--async-mode", choices=ASYNC_MODES, default=default_async_mode())
+    parser.add_argument(
+        "--max-connections", type=int, default=10000, help="Concurrent connections per worker"
+    )
+    parser.add_argument(
+        "--message-queue", default=environ.get("SOCKETIO_MESSAGE_QUEUE"),
+        help="Socket.IO message queue shared by the workers, ex: redis://127.0.0.1:6379/0"
+    )
+    parser.add_argument(
+        "--no-broadcast", action="store_true",
+        help="Another server sharing the message queue sends the live updates"
+    )
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.no_broadcast and not args.message_queue:
+        parser.error("--no-broadcast needs a --message-queue")
+
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        if args.async_mode == "threading":
+            print("! Serving with threads, eventlet or gevent holds more connections !")
+        if args.message_queue:
+            environ["SOCKETIO_MESSAGE_QUEUE"] = args.message_queue
+        environ["SERVER_BROADCASTER"] = "0" if args.no_broadcast else "1"
+        patch(args.async_mode)
+        import server
+        server.start(args.host, args.port, max_connections=args.max_connections)
@@ -1,27 +1,389 @@
-from os import urandom, path
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
+from contextlib import ExitStack
+from os import getenv, urandom, path
+from threading import Lock
+from time import perf_counter, time
+from typing import List, Set
+from flask import Flask, Response, render_template, request, jsonify
+from flask_socketio import SocketIO, emit, join_room
 from flask_cors import CORS
 from kinesis_api import DynamoDbAPI
-from time import sleep
-import pandas as pd
+from live_cache import LiveDataCache
+from live_feed import DeltaFeed, encode_delta, make_delta, parse_subscription, room_name
+from timeseries_store import FIELDS, TimeSeriesStore, to_key
+from historical_store import HistoricalStore, SHAPES, batch_body, batch_etag
+from tick_channel import TickSubscriber, LatencyStats, DEFAULT_ADDRESS
+from candles import CandleAggregator, MINUTES_PER_DAY, TIMEFRAMES, decode_candles
+from indicators import INDICATOR_DTYPE, IndicatorEngine
+from alerts import AlertEngine
+import numpy as np
+import cluster
+import metrics
+import wire_format
 
 
 CUR_DIR = path.realpath(path.dirname(__file__))
+BASE_DIR = path.dirname(CUR_DIR)
+HISTORICAL_DATA_DIR = path.join(BASE_DIR, "data", "historical_data")
+if not path.isdir(HISTORICAL_DATA_DIR):
+    # Copy of the historical data shipped along with the backend
+    HISTORICAL_DATA_DIR = path.join(CUR_DIR, "data")
+# Memory-mapped columnar copy of the historical data (data/data_editor.py), used when present
+HISTORICAL_COLUMNAR_DIR = path.join(BASE_DIR, "data", "columnar", "historical_data")
+# Intraday data loaded in the time-series store at start, comma separated columnar
+# datasets or CSV files/globs (ex: data/columnar/intraday-22-oct). Empty by default:
+# the producer replays that day, its minutes would not be new.
+INTRADAY_WARM_SOURCES = [source for source in getenv("INTRADAY_WARM", "").split(",") if source]
 DYNAMO_DB_TABLE = "stock-stream-data"
 DYNAMO_DB_PARTITION_KEY = "symbol"
 SYNAMO_DB_SORT_KEY = "minute"
+SOCKETIO_NAMESPACE = "/api/socket.io"
+# Seconds between two DynamoDB refreshes of a symbol, shared by all its clients
+LIVE_POLL_INTERVAL = 5.0
+# Max symbols of one batched request (?stocks=AAPL,MSFT,... / get_live_data_batch)
+MAX_BATCH_SYMBOLS = 100
+# Seconds between two checks of the delta rooms whose coalescing window is over
+DELTA_FLUSH_INTERVAL = 0.05
+# Unix socket path (or "host:port") the consumer publishes new ticks on
+TICK_CHANNEL_ADDRESS = DEFAULT_ADDRESS
+# Socket.IO runtime: "threading" (python server.py, the benchmarks), "eventlet" or "gevent"
+# (cooperative, serve.py patches the standard library before importing the server)
+ASYNC_MODE = getenv("SERVER_ASYNC_MODE", "threading")
+# Message queue shared by the Socket.IO servers of several processes (serve.py --workers),
+# ex: redis://127.0.0.1:6379/0. Empty: emits only reach the clients of this process.
+SOCKETIO_MESSAGE_QUEUE = getenv("SOCKETIO_MESSAGE_QUEUE") or None
+# Whether this process sends the broadcasts of the tick channel and the pollers. With a
+# message queue only one process does, through the queue, and the others announce the
+# rooms of their clients to it (cluster). serve.py sets it per worker.
+BROADCASTER = getenv("SERVER_BROADCASTER", "1") == "1"
+# Max concurrent connections of the eventlet server (its default of 1024 caps the sockets)
+MAX_CONNECTIONS = 10000
 
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = urandom(32).hex
-app.config["THREADED"] = True
-app.config["DEBUG"] = True
+app.config["DEBUG"] = getenv("SERVER_DEBUG", "0") == "1"
 CORS(app)
 
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=ASYNC_MODE,
+    message_queue=SOCKETIO_MESSAGE_QUEUE
+)
 
-db = DynamoDbAPI(table_name=DYNAMO_DB_TABLE)
+db = None
+live_cache = None
+
+# symbol -> sids of the clients in the symbol's room
+subscribers = {}
+# symbol -> background poller task
+pollers = {}
+# Sends the pending graph_delta of the delta mode rooms (started with the first client)
+delta_flusher = None
+subscription_lock = Lock()
+# Publishes the rooms of this process's clients to the broadcaster (message queue only)
+room_announcer = None
+# symbol -> time of its last batch on the tick channel, its poller skips DynamoDB while
+# it is recent
+last_ticks = {}
+
+historical_store = HistoricalStore(HISTORICAL_DATA_DIR, columnar_dir=HISTORICAL_COLUMNAR_DIR)
+# Intraday minutes of the symbols (hot tier of the live cache, DynamoDB is the cold tier)
+tick_store = TimeSeriesStore()
+
+# Tick-to-browser latency of the batches pushed by the consumer, per stage
+tick_latency = LatencyStats()
+
+# Mirror of the consumer's rolling candles (5m/15m/1h), updated from the tick channel
+candle_store = CandleAggregator()
+# Mirror of the consumer's latest indicators, backfilled from the historical data at start
+indicator_store = IndicatorEngine()
+# Alert rules registered by the clients, checked against every batch of the tick channel
+alert_engine = AlertEngine()
+
+EMIT = metrics.operation("emit")
+EMITTED_ROWS = metrics.rows("emitted")
+
+
+def init_db(db_api: DynamoDbAPI = None) -> None:
+    """
+    Connect to DynamoDB, or use the given DynamoDbAPI (ex: with a local stand-in client)
+    """
+    global db, live_cache
+    db = db_api or DynamoDbAPI(table_name=DYNAMO_DB_TABLE)
+    live_cache = LiveDataCache(db, DYNAMO_DB_PARTITION_KEY, SYNAMO_DB_SORT_KEY, tick_store)
+
+
+def get_live_cache() -> LiveDataCache:
+    if live_cache is None:
+        init_db()
+    return live_cache
+
+
+def broadcast(event: str, data: dict, room: str, local: bool = False) -> None:
+    """
+    Emit an event to a room (symbol or client sid), timed as the "emit" operation.
+    With a message queue the event goes through it to the clients of every process,
+    local events (ex: to a client of this process) skip it.
+    """
+    # One emit per room and tick: time_since instead of the EMIT.time() context manager
+    started = perf_counter()
+    try:
+        socketio.emit(event, data, room=room, namespace=SOCKETIO_NAMESPACE, ignore_queue=local)
+    except Exception:
+        EMIT.errors.inc()
+        raise
+    finally:
+        EMIT.time_since(started)
+
+
+# Delta mode clients, graph_delta coalesced per room (live_feed). On the broadcaster the
+# rooms of the other processes' clients are in too, joined with the process id (cluster).
+delta_feed = DeltaFeed(broadcast)
+
+
+def watched_symbols() -> Set[str]:
+    """
+    Symbols with clients, in this process or (broadcaster) in the others
+    """
+    with subscription_lock:
+        watched = {symbol for symbol, sids in subscribers.items() if sids}
+    return watched | remote_rooms.symbols()
+
+
+def start_poller(symbol: str) -> None:
+    """
+    Start the symbol's poller if it has none, call it under the subscription lock
+    """
+    if symbol not in pollers:
+        pollers[symbol] = socketio.start_background_task(poll_symbol, symbol)
+
+
+def join_remote(worker: str, room: cluster.Room) -> None:
+    """
+    A client of another process joined a room: refresh its symbol here, and coalesce its
+    delta room
+    """
+    symbol, window, fmt = room
+    if window is not None:
+        delta_feed.join(worker, symbol, window, fmt)
+        return
+    try:
+        # Merge the minutes of DynamoDB in like the other process did, so both count the
+        # same points (graph_delta seq)
+        get_live_cache().load([symbol])
+    except Exception as err:
+        print(f"! Failed to load live data for: {symbol} !")
+        print(err, "\n")
+    with subscription_lock:
+        start_poller(symbol)
+
+
+def leave_remote(worker: str, room: cluster.Room) -> None:
+    """
+    The clients of another process left a room (the symbol's poller exits by itself)
+    """
+    symbol, window, fmt = room
+    if window is not None:
+        delta_feed.leave(worker, [room_name(symbol, window, fmt)])
+
+
+# Rooms of the clients of the other processes, announced to the broadcaster
+remote_rooms = cluster.RemoteRooms(join_remote, leave_remote)
+
+
+def local_rooms() -> List[cluster.Room]:
+    """
+    Rooms of this process's clients, as announced to the broadcaster
+    """
+    with subscription_lock:
+        rooms = [(symbol, None, None) for symbol, sids in subscribers.items() if sids]
+    return rooms + delta_feed.subscriptions()
+
+
+def announce_rooms() -> None:
+    if room_announcer is not None:
+        room_announcer.announce()
+
+
+def announce_rooms_loop():
+    """
+    Background task: announce the rooms every ANNOUNCE_INTERVAL, so a restarted
+    broadcaster knows them again
+    """
+    while True:
+        announce_rooms()
+        socketio.sleep(cluster.ANNOUNCE_INTERVAL)
+
+
+def full_room(symbol: str) -> str:
+    """
+    Room of the full mode clients of a symbol, getting every graph_update
+    """
+    return f"{symbol}:full"
+
+
+def publish_delta(cache: LiveDataCache, symbol: str, labels: list, data: list, produced=None):
+    """
+    Add the minutes just appended to a symbol's live series to its delta rooms
+    """
+    date, points = cache.day(symbol)
+    delta_feed.publish(symbol, date, max(0, points - len(labels)), labels, data, produced)
+
+
+def flush_deltas():
+    """
+    Background task: send the graph_delta of the rooms whose window is over
+    """
+    while True:
+        socketio.sleep(DELTA_FLUSH_INTERVAL)
+        try:
+            delta_feed.flush()
+        except Exception as err:
+            print("! Failed to send live deltas !")
+            print(err, "\n")
+
+
+def poll_symbol(symbol):
+    """
+    Background task, one per symbol: refresh the symbol from DynamoDB once per
+    LIVE_POLL_INTERVAL and send the new minutes to the symbol's clients (broadcaster).
+    DynamoDB is not queried while the tick channel delivers the symbol's batches: the
+    consumer stores the same minutes. Exits when the last client of the symbol disconnects.
+    """
+    cache = get_live_cache()
+    while True:
+        socketio.sleep(LIVE_POLL_INTERVAL)
+        with subscription_lock:
+            if not subscribers.get(symbol) and symbol not in remote_rooms.symbols():
+                pollers.pop(symbol, None)
+                return
+        if time() - last_ticks.get(symbol, 0.0) < LIVE_POLL_INTERVAL:
+            continue
+        try:
+            with cache.lock(symbol):
+                labels, data = cache.refresh(symbol)
+                if labels and BROADCASTER:
+                    broadcast(
+                        "graph_update",
+                        {"symbol": symbol, "labels": labels, "data": data, "sent_at": time()},
+                        room=full_room(symbol)
+                    )
+                    publish_delta(cache, symbol, labels, data)
+        except Exception as err:
+            print(f"! Failed to refresh live data for: {symbol} !")
+            print(err, "\n")
+
+
+def on_candles(message):
+    """
+    Head candles pushed by the consumer: mirror them and broadcast them as
+    candle_update to the rooms of the subscribed symbols (broadcaster).
+    """
+    for timeframe, candles in decode_candles(message).items():
+        candle_store.upsert(timeframe, candles)
+        watched = watched_symbols() if BROADCASTER else None
+        if not watched:
+            continue
+        candles = candles[np.isin(candles["symbol"], np.asarray(sorted(watched), dtype="S8"))]
+        for candle in candles:
+            symbol = candle["symbol"].decode("ascii")
+            start = int(candle["start"])
+            volume = int(candle["volume"])
+            broadcast(
+                "candle_update",
+                {
+                    "symbol": symbol,
+                    "timeframe": timeframe,
+                    "label": wire_format.format_minutes(np.array([start % MINUTES_PER_DAY]))[0],
+                    "date": wire_format.format_dates(np.array([start // MINUTES_PER_DAY]))[0],
+                    "open": float(candle["open"]),
+                    "high": float(candle["high"]),
+                    "low": float(candle["low"]),
+                    "close": float(candle["close"]),
+                    "volume": volume,
+                    "vwap": float(candle["notional"]) / volume if volume else None,
+                },
+                room=symbol
+            )
+
+
+def on_indicators(blob):
+    """
+    Latest indicators pushed by the consumer: mirror them and broadcast them as
+    indicator_update to the rooms of the subscribed symbols (broadcaster).
+    """
+    values = np.frombuffer(blob, dtype=INDICATOR_DTYPE)
+    indicator_store.upsert(values)
+    if not BROADCASTER:
+        return
+    watched = watched_symbols()
+    for symbol in np.char.decode(values["symbol"], "ascii").tolist():
+        if symbol in watched:
+            broadcast(
+                "indicator_update",
+                {"symbol": symbol, **indicator_store.latest(symbol)},
+                room=symbol
+            )
+
+
+def on_alerts(batch):
+    """
+    Check a batch against the alert rules of this process's clients, triggered alerts
+    are sent to their owner
+    """
+    for alert in alert_engine.check(batch):
+        owner = alert.pop("owner")
+        broadcast("alert", alert, room=owner, local=True)
+
+
+def on_tick_batch(message):
+    """
+    Batch pushed by the consumer on the tick channel: check the alert rules, add the
+    minutes to the store and send the new ones to the symbol's clients right away.
+    Candle and indicator messages are mirrored by on_candles and on_indicators.
+    Only the broadcaster sends the minutes, the other processes keep their store up to
+    date for the series they reply.
+    """
+    if "candles" in message:
+        on_candles(message["candles"])
+    if "indicators" in message:
+        on_indicators(message["indicators"])
+    if "batch" not in message:
+        return
+    batch = wire_format.decode(message["batch"])
+    trace = message.get("trace", {})
+    received = time()
+    on_alerts(batch)
+    cache = get_live_cache()
+    for symbol in np.unique(batch["symbol"]).tolist():
+        rows = batch[(batch["symbol"] == symbol) & ~np.isnan(batch["open"])]
+        symbol = symbol.decode("ascii")
+        last_ticks[symbol] = received
+        with cache.lock(symbol):
+            labels, data = cache.append(symbol, rows)
+            if not labels or not BROADCASTER:
+                continue
+            trace["emitted"] = time()
+            broadcast(
+                "graph_update",
+                {
+                    "symbol": symbol, "labels": labels, "data": data,
+                    "sent_at": trace["emitted"], "trace": trace
+                },
+                room=full_room(symbol)
+            )
+            publish_delta(cache, symbol, labels, data, trace.get("produced"))
+            EMITTED_ROWS.inc(len(labels))
+    if BROADCASTER:
+        tick_latency.record(trace)
+        metrics.record_trace(trace)
+
+
+def start_tick_subscriber(address: str = None) -> TickSubscriber:
+    subscriber = TickSubscriber(on_tick_batch, address or TICK_CHANNEL_ADDRESS)
+    subscriber.start()
+    return subscriber
 
 
 @app.route("/")
@@ -29,54 +391,465 @@ def index():
     return render_template("index.html")
 
 
+def symbol_list(value) -> List[str]:
+    """
+    "AAPL,MSFT" or ["AAPL", "MSFT"] -> unique symbols, raises ValueError when there are
+    none or more than MAX_BATCH_SYMBOLS
+    """
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list) or not all(isinstance(symbol, str) for symbol in value):
+        raise ValueError("! symbols must be a list or a comma separated string !")
+    symbols = list(dict.fromkeys(symbol.strip() for symbol in value if symbol.strip()))
+    if not symbols or len(symbols) > MAX_BATCH_SYMBOLS:
+        raise ValueError(f"! Between 1 and {MAX_BATCH_SYMBOLS} symbols are required !")
+    return symbols
+
+
+def historical_response(body_of, etag: str) -> Response:
+    """
+    JSON response of body_of(gzip), 304 Not Modified when the client has the etag
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    response = Response(body_of(gzip), mimetype="application/json")
+    if gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(etag)
+    return response
+
+
 @app.route("/api/get_historical_data")
 def get_historical_data():
+    """
+    Daily data of a stock, served from the in-memory historical store
+
+    stock : Stock symbol (required)
+    shape : "records" (default) or "columnar" ({"date": [...], "open": [...], ...})
+    start : First date (YYYY-MM-DD) to include (optional)
+    end   : Last date (YYYY-MM-DD) to include (optional)
+
+    Supports ETag/If-None-Match (304 Not Modified) and gzip Content-Encoding.
+    """
     stock = request.args.get("stock")
-    file_ = path.join(CUR_DIR, "data", f"hist-{stock}.csv")
-    df = pd.read_csv(file_, index_col=0)
-    return jsonify(df.to_dict(orient="records"))
+    shape = request.args.get("shape", "records")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if shape not in SHAPES:
+        return jsonify({"error": f"shape must be one of {list(SHAPES)}"}), 400
+    try:
+        data = historical_store.get(stock)
+    except KeyError:
+        return jsonify({"error": f"No historical data for stock: {stock}"}), 404
+    return historical_response(
+        lambda gzip: data.body(shape, start, end, gzip=gzip), data.etag(shape, start, end)
+    )
+
+
+@app.route("/api/get_historical_data_batch")
+def get_historical_data_batch():
+    """
+    Daily data of several stocks in one response, from the in-memory historical store
+
+    stocks : Comma separated stock symbols (required, ex: AAPL,MSFT,TSLA)
+    shape  : "columnar" (default) or "records", the shape of the data of every stock
+    start  : First date (YYYY-MM-DD) to include (optional)
+    end    : Last date (YYYY-MM-DD) to include (optional)
+
+    Replies {"data": {"AAPL": {"date": [...], ...}, ...}, "missing": [...]}, supports
+    ETag/If-None-Match (304 Not Modified) and gzip Content-Encoding.
+    """
+    shape = request.args.get("shape", "columnar")
+    start = request.args.get("start")
+    end = request.args.get("end")
+    if shape not in SHAPES:
+        return jsonify({"error": f"shape must be one of {list(SHAPES)}"}), 400
+    try:
+        stocks = symbol_list(request.args.get("stocks", ""))
+    except ValueError as err:
+        return jsonify({"error": str(err).strip("! ")}), 400
+    datas, missing = historical_store.get_many(stocks)
+    return historical_response(
+        lambda gzip: batch_body(datas, missing, shape, start, end, gzip=gzip),
+        batch_etag(datas, missing, shape, start, end)
+    )
+
+
+def intraday_columns(
+    stock: str,
+    date: str = None,
+    start: str = None,
+    end: str = None,
+    limit: int = 0
+) -> dict:
+    """
+    Columnar intraday minutes of a loaded stock from the time-series store, raises
+    KeyError for an unknown stock and ValueError for an invalid date, start or end
+    """
+    day = to_key(date) // 10000 if date else tick_store.last_key(stock) // 10000
+    columns = tick_store.range(
+        stock,
+        to_key(start, day) if start else day * 10000,
+        to_key(end, day) if end else day * 10000 + 9999
+    )
+    if limit > 0:
+        columns = {name: values[-limit:] for name, values in columns.items()}
+    body = {
+        "labels": wire_format.format_minutes(columns["minute"]),
+        "dates": wire_format.format_dates(columns["date"]),
+    }
+    for field in FIELDS[2:]:
+        values = columns[field]
+        if values.dtype.kind == "f":
+            # NaN (missing) is not valid JSON
+            values = np.where(np.isnan(values), None, values)
+        body[field] = values.tolist()
+    return body
+
+
+@app.route("/api/get_intraday_data")
+def get_intraday_data():
+    """
+    Intraday minutes of a stock, served from the time-series store (loaded from
+    DynamoDB the first time)
+
+    stock : Stock symbol (required)
+    date  : Date (YYYY-MM-DD) of the minutes (optional, default: latest)
+    start : First minute (HH:MM or YYYY-MM-DD HH:MM) to include (optional)
+    end   : Last minute (HH:MM or YYYY-MM-DD HH:MM) to include (optional)
+    limit : Only the latest N minutes of the range (optional)
+
+    Replies {"symbol": ..., "labels": [...], "dates": [...], "open": [...], ...}
+    """
+    stock = request.args.get("stock", "")
+    try:
+        if not stock.isalnum():
+            raise KeyError(stock)
+        limit = int(request.args.get("limit", 0))
+        cache = get_live_cache()
+        with cache.lock(stock):
+            if stock not in cache.loaded:
+                cache.refresh(stock)
+            body = intraday_columns(
+                stock, request.args.get("date"), request.args.get("start"),
+                request.args.get("end"), limit
+            )
+    except (TypeError, ValueError):
+        return jsonify({"error": "date, start, end or limit is not valid"}), 400
+    except KeyError:
+        return jsonify({"error": f"No intraday data for stock: {stock}"}), 404
+    return jsonify({"symbol": stock, **body})
+
+
+@app.route("/api/get_intraday_data_batch")
+def get_intraday_data_batch():
+    """
+    Intraday minutes of several stocks in one response, from the time-series store
+    (the stocks not loaded yet are queried from DynamoDB in parallel)
+
+    stocks : Comma separated stock symbols (required, ex: AAPL,MSFT,TSLA)
+    date, start, end, limit : Same as /api/get_intraday_data, for every stock
 
+    Replies {"data": {"AAPL": {"labels": [...], "open": [...], ...}, ...}, "missing": [...]}
+    """
+    try:
+        stocks = symbol_list(request.args.get("stocks", ""))
+        limit = int(request.args.get("limit", 0))
+        cache = get_live_cache()
+        cache.load([stock for stock in stocks if stock.isalnum()])
+        data = {}
+        missing = []
+        for stock in stocks:
+            try:
+                with cache.lock(stock):
+                    data[stock] = intraday_columns(
+                        stock, request.args.get("date"), request.args.get("start"),
+                        request.args.get("end"), limit
+                    )
+            except KeyError:
+                missing.append(stock)
+    except (TypeError, ValueError) as err:
+        return jsonify({"error": str(err).strip("! ")}), 400
+    return jsonify({"data": data, "missing": missing})
 
-@socketio.on("connect", namespace="/api/socket.io")
+
+@app.route("/api/latency")
+def get_latency():
+    """
+    Per-stage latency (ms) of the ticks pushed from the consumer to the browser
+    """
+    return jsonify(tick_latency.summary())
+
+
+@app.route("/metrics")
+def get_metrics():
+    """
+    Counters and latency histograms of the server (socket emits, DynamoDB calls, traces)
+    in the Prometheus text format
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@socketio.on("connect", namespace=SOCKETIO_NAMESPACE)
 def on_connect():
     print("SocketIO: Connected!")
 
 
-@socketio.on_error(namespace="/api/socket.io")
+@socketio.on_error(namespace=SOCKETIO_NAMESPACE)
 def error_handler(err):
     print(f"ERROR: {err}")
 
 
-@socketio.on("get_live_data", namespace='/api/socket.io')
-def get_live_data(symbol):
+def subscribe(params: dict) -> dict:
+    """
+    Join the rooms of a subscription (live_feed.parse_subscription) and return the
+    symbol's series. Call it under the symbol's lock, with the reply emitted under it too,
+    so no update is missed or sent twice.
+    """
+    symbol = params["symbol"]
+    cache = get_live_cache()
+    labels, data = cache.snapshot(symbol)
+    join_room(symbol)
+    snapshot = {"symbol": symbol, "labels": labels, "data": data}
+    if params["mode"] == "full":
+        join_room(full_room(symbol))
+    else:
+        join_room(delta_feed.join(request.sid, symbol, params["window"], params["format"]))
+        date, _ = cache.day(symbol)
+        snapshot.update({"date": date, "seq": len(labels)})
+    return snapshot
+
+
+def watch(symbols: List[str], delta: bool) -> None:
+    """
+    Register the client as a subscriber of the symbols, starting their pollers (and the
+    delta flusher) when needed, and announce the rooms to the broadcaster
+    """
+    global delta_flusher
+    with subscription_lock:
+        for symbol in symbols:
+            subscribers.setdefault(symbol, set()).add(request.sid)
+            start_poller(symbol)
+        if delta and delta_flusher is None and BROADCASTER:
+            delta_flusher = socketio.start_background_task(flush_deltas)
+    announce_rooms()
+
+
+@socketio.on("get_live_data", namespace=SOCKETIO_NAMESPACE)
+def get_live_data(params):
+    """
+    Subscribe the client to a symbol: "AAPL" (full mode) or {"symbol": "AAPL",
+    "mode": "delta", "window": 0.5, "format": "json"} (live_feed). The series is sent once
+    as graph_data (with the latest indicators). New minutes follow as graph_update
+    broadcasts (full mode) or graph_delta coalesced over the window (delta mode), from the
+    symbol's poller and the tick channel, indicators as indicator_update.
+    """
+    try:
+        params = parse_subscription(params)
+    except ValueError as err:
+        emit("graph_data", {"error": str(err).strip("! ")}, namespace=SOCKETIO_NAMESPACE)
+        return
+    symbol = params["symbol"]
     print("Stock Symbol:", symbol)
 
-    resp = db.get_all(
-        projection_expr="symbol, #m, #o",
-        expr_attr_names={"#m": "minute", "#o": "open"},
-        filter="symbol = :stock",
-        expr_attr_values={":stock": symbol}
-    )
+    cache = get_live_cache()
+    with cache.lock(symbol):
+        snapshot = subscribe(params)
+        seq = params["seq"]
+        if (
+            params["mode"] == "delta" and params["date"] == snapshot["date"]
+            and seq is not None and 0 <= seq <= snapshot["seq"]
+        ):
+            # Resync of a client holding the first seq points: only send the others
+            delta = make_delta(
+                symbol, snapshot["date"], seq, snapshot["labels"][seq:], snapshot["data"][seq:]
+            )
+            emit(
+                "graph_delta", encode_delta(delta, params["format"]),
+                namespace=SOCKETIO_NAMESPACE
+            )
+        else:
+            emit(
+                "graph_data",
+                {**snapshot, "indicators": indicator_store.latest(symbol)},
+                json=True,
+                namespace=SOCKETIO_NAMESPACE
+            )
+    watch([symbol], params["mode"] == "delta")
+
+
+@socketio.on("get_live_data_batch", namespace=SOCKETIO_NAMESPACE)
+def get_live_data_batch(params):
+    """
+    Subscribe the client to several symbols at once: {"symbols": ["AAPL", "MSFT"],
+    "mode": ..., "window": ..., "format": ...} (same options as get_live_data).
+    The symbols not cached yet are queried from DynamoDB in parallel and all the series
+    are sent in one graph_data_batch: {"data": {"AAPL": <graph_data>, ...}}.
+    Updates follow per symbol like for get_live_data.
+    """
+    try:
+        if not isinstance(params, dict):
+            raise ValueError("! get_live_data_batch takes {\"symbols\": [...], ...} !")
+        subscriptions = [
+            parse_subscription({**params, "symbol": symbol, "date": None, "seq": None})
+            for symbol in symbol_list(params.get("symbols"))
+        ]
+    except ValueError as err:
+        emit("graph_data_batch", {"error": str(err).strip("! ")}, namespace=SOCKETIO_NAMESPACE)
+        return
+    symbols = [subscription["symbol"] for subscription in subscriptions]
+    print("Stock Symbols:", ", ".join(symbols))
 
-    labels = []
-    data = []
-    for item in resp["items"]:
-        labels.append(item["minute"]["S"])
-        data.append(float(item["open"]["N"]))
+    cache = get_live_cache()
+    cache.load(symbols)
+    # Every symbol's lock, in order (on_tick_batch takes one at a time)
+    with ExitStack() as stack:
+        for symbol in sorted(symbols):
+            stack.enter_context(cache.lock(symbol))
+        data = {}
+        for subscription in subscriptions:
+            symbol = subscription["symbol"]
+            data[symbol] = {**subscribe(subscription), "indicators": indicator_store.latest(symbol)}
+        emit("graph_data_batch", {"data": data}, json=True, namespace=SOCKETIO_NAMESPACE)
+    watch(symbols, subscriptions[0]["mode"] == "delta")
 
+
+@socketio.on("get_candles", namespace=SOCKETIO_NAMESPACE)
+def get_candles(params):
+    """
+    Candles of a symbol: {"symbol": "AAPL", "timeframe": "5m" | "15m" | "1h", "limit": 50}
+    Replies candle_data with labels, dates, open, high, low, close, volume and vwap lists.
+    The limit is capped to the candles kept for the timeframe.
+    """
+    if not isinstance(params, dict):
+        params = {}
+    symbol = params.get("symbol")
+    timeframe = params.get("timeframe", "5m")
+    limit = params.get("limit")
+    try:
+        if not isinstance(symbol, str) or not symbol or not symbol.isascii():
+            raise ValueError("! get_candles takes {\"symbol\": \"AAPL\", \"timeframe\": ...} !")
+        if not isinstance(timeframe, str) or timeframe not in TIMEFRAMES:
+            raise ValueError(f"! timeframe must be one of {list(TIMEFRAMES)} !")
+        if limit is not None:
+            if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+                raise ValueError("! limit must be a positive integer !")
+            limit = min(limit, TIMEFRAMES[timeframe][1])
+    except ValueError as err:
+        emit(
+            "candle_data",
+            {"symbol": symbol, "timeframe": timeframe, "error": str(err).strip("! ")},
+            json=True,
+            namespace=SOCKETIO_NAMESPACE
+        )
+        return
+    candles = candle_store.candles(symbol, timeframe, limit)
     emit(
-        "graph_data",
-        {"symbol": symbol, "labels": labels, "data": data},
+        "candle_data",
+        {"symbol": symbol, "timeframe": timeframe, **candles},
         json=True,
-        namespace="/api/socket.io"
+        namespace=SOCKETIO_NAMESPACE
     )
-    sleep(60.0)
 
 
-@socketio.on("disconnect", namespace="/api/socket.io")
-def on_disconnect():
+@socketio.on("add_alert", namespace=SOCKETIO_NAMESPACE)
+def add_alert(rule):
+    """
+    Register an alert rule for the client: "AAPL close > 120", "AAPL close change > 3% in 5m"
+    or {"symbol": "AAPL", "field": "close", "op": ">", "value": 120 | "change": 3, "window": 5}
+    Replies alert_added with the rule (and its id) or an error, alerts arrive as alert.
+    """
+    try:
+        rule = alert_engine.add(rule, owner=request.sid).to_dict()
+    except ValueError as err:
+        emit("alert_added", {"error": str(err).strip("! ")}, namespace=SOCKETIO_NAMESPACE)
+        return
+    emit("alert_added", rule, namespace=SOCKETIO_NAMESPACE)
+
+
+@socketio.on("remove_alert", namespace=SOCKETIO_NAMESPACE)
+def remove_alert(rule_id):
+    """
+    Remove an alert rule of the client, replies alert_rules with the remaining rules
+    (alert_removed with an error for an invalid id)
+    """
+    if not isinstance(rule_id, int) or isinstance(rule_id, bool):
+        emit(
+            "alert_removed", {"error": "rule id must be an integer"}, namespace=SOCKETIO_NAMESPACE
+        )
+        return
+    rule = alert_engine.rules.get(rule_id)
+    if rule is not None and rule.owner == request.sid:
+        alert_engine.remove(rule_id)
+    emit("alert_rules", alert_engine.rules_of(request.sid), namespace=SOCKETIO_NAMESPACE)
+
+
+@socketio.on("get_alerts", namespace=SOCKETIO_NAMESPACE)
+def get_alerts():
+    emit("alert_rules", alert_engine.rules_of(request.sid), namespace=SOCKETIO_NAMESPACE)
+
+
+@socketio.on("disconnect", namespace=SOCKETIO_NAMESPACE)
+def on_disconnect(reason=None):
+    with subscription_lock:
+        for sids in subscribers.values():
+            sids.discard(request.sid)
+    alert_engine.remove_owner(request.sid)
+    delta_feed.leave(request.sid)
+    announce_rooms()
     print("SocketIO: Disconnected!")
 
 
+def start_cluster() -> None:
+    """
+    With a message queue: the broadcaster applies the rooms announced by the other
+    processes, they announce theirs
+    """
+    global room_announcer
+    if SOCKETIO_MESSAGE_QUEUE is None:
+        return
+    if BROADCASTER:
+        socketio.start_background_task(remote_rooms.listen, SOCKETIO_MESSAGE_QUEUE)
+    else:
+        room_announcer = cluster.RoomAnnouncer(SOCKETIO_MESSAGE_QUEUE, local_rooms)
+        socketio.start_background_task(announce_rooms_loop)
+
+
+def start(
+    host: str = "127.0.0.1",
+    port: int = 5000,
+    db_api: DynamoDbAPI = None,
+    max_connections: int = MAX_CONNECTIONS
+) -> None:
+    """
+    Load the stores, connect to DynamoDB (or use db_api), the tick channel and the other
+    processes (message queue), and serve on host:port until interrupted
+    """
+    historical_store.preload()
+    indicator_store.backfill_csv(HISTORICAL_DATA_DIR)
+    if INTRADAY_WARM_SOURCES:
+        print(f"Warmed the time-series store: {tick_store.warm(INTRADAY_WARM_SOURCES):,} rows")
+    init_db(db_api)
+    start_tick_subscriber()
+    start_cluster()
+    if socketio.async_mode == "threading" and not app.debug:
+        try:
+            socketio.run(app, host=host, port=port, allow_unsafe_werkzeug=True)
+            return
+        except TypeError:
+            # Flask-SocketIO < 5 does not know allow_unsafe_werkzeug
+            pass
+    if socketio.async_mode == "eventlet":
+        socketio.run(app, host=host, port=port, max_size=max_connections)
+    else:
+        socketio.run(app, host=host, port=port)
+
+
 if __name__ == "__main__":
-    socketio.run(app)
+    start()
@@ -0,0 +1,370 @@
+"""
+Python: 3.7.9
+
+Shard aware Kinesis consumer engine
+
+Reads every shard of a stream in parallel (one worker thread per shard), follows
+resharding (child shards are read once their parents are fully consumed) and saves
+the last processed sequence number of every shard to a checkpoint store, so that a
+restart resumes with AFTER_SEQUENCE_NUMBER instead of re-reading from TRIM_HORIZON.
+
+Every shard keeps its NextShardIterator between reads and is polled adaptively
+(polling.PollScheduler): back off while it is empty, read right away while it is
+behind, at most 5 reads per second and jittered retries when throttled.
+stats() has the API calls and the lag (MillisBehindLatest) of every shard.
+"""
+from os import path, replace
+from json import dump, load
+import logging
+from threading import Event, Lock, Thread
+from time import time
+from typing import Callable, Dict, List
+import sqlite3
+from kinesis_api import KinesisAPI
+from polling import MAX_READS_PER_SECOND, PollScheduler, is_throttled
+
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint value of a shard that was closed by resharding and is fully read
+SHARD_END = "SHARD_END"
+# Counters of stats(), summed over the shards
+STAT_COUNTERS = [
+    "get_records", "get_shard_iterator", "records", "empty_reads", "throttled", "errors"
+]
+
+
+class CheckpointStore:
+    """
+    In-memory checkpoint store, base class of the persistent stores
+
+    Maps shard_id -> last processed sequence number (or SHARD_END)
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._checkpoints = {}
+
+    def get(self, shard_id: str) -> str:
+        with self._lock:
+            return self._checkpoints.get(shard_id)
+
+    def put(self, shard_id: str, sequence_number: str) -> None:
+        with self._lock:
+            self._checkpoints[shard_id] = sequence_number
+
+    def all(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._checkpoints)
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Checkpoints kept in a JSON file. The file is replaced atomically on every update.
+    """
+
+    def __init__(self, file_path: str):
+        super().__init__()
+        self.file_path = file_path
+        if path.exists(self.file_path):
+            with open(self.file_path) as checkpoint_file:
+                self._checkpoints = load(checkpoint_file)
+
+    def put(self, shard_id: str, sequence_number: str) -> None:
+        with self._lock:
+            self._checkpoints[shard_id] = sequence_number
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, "w") as checkpoint_file:
+                dump(self._checkpoints, checkpoint_file, indent=2)
+            replace(tmp_path, self.file_path)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """
+    Checkpoints kept in a SQLite database, one row per (stream, shard)
+    """
+
+    def __init__(self, db_path: str, stream_name: str):
+        super().__init__()
+        self.stream_name = stream_name
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "stream_name TEXT NOT NULL, shard_id TEXT NOT NULL, sequence_number TEXT NOT NULL, "
+            "PRIMARY KEY (stream_name, shard_id))"
+        )
+        self.conn.commit()
+        rows = self.conn.execute(
+            "SELECT shard_id, sequence_number FROM checkpoints WHERE stream_name = ?",
+            (self.stream_name,)
+        )
+        self._checkpoints = {shard_id: seq_num for shard_id, seq_num in rows}
+
+    def put(self, shard_id: str, sequence_number: str) -> None:
+        with self._lock:
+            self._checkpoints[shard_id] = sequence_number
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (stream_name, shard_id, sequence_number) "
+                "VALUES (?, ?, ?)",
+                (self.stream_name, shard_id, sequence_number)
+            )
+            self.conn.commit()
+
+
+class ShardConsumer:
+    """
+    Reads all shards of a Kinesis stream at once, one worker thread per shard
+
+    handler(shard_id, records) is called from the shard's worker thread with the
+    decoded records of every non-empty GetRecords response. When auto_checkpoint is
+    True the last sequence number is checkpointed once the handler returns.
+
+    on_shard_end(shard_id) is called once a shard closed by resharding is fully read,
+    by default it is checkpointed as SHARD_END right away.
+
+    poll_interval     : Delay between reads of a shard at the tip of the stream
+    max_poll_interval : Longest delay between reads of an idle shard (empty reads back off)
+    reads_per_second  : GetRecords calls per second and shard (Kinesis limit: 5)
+    """
+
+    def __init__(
+        self,
+        api: KinesisAPI,
+        handler: Callable[[str, List[dict]], None],
+        checkpoint_store: CheckpointStore = None,
+        initial_position: str = "TRIM_HORIZON",
+        records_limit: int = 5000,
+        poll_interval: float = 1.0,
+        discover_interval: float = 30.0,
+        auto_checkpoint: bool = True,
+        max_poll_interval: float = 10.0,
+        reads_per_second: float = MAX_READS_PER_SECOND,
+        on_shard_end: Callable[[str], None] = None
+    ):
+        self.api = api
+        self.handler = handler
+        self.checkpoint_store = checkpoint_store or CheckpointStore()
+        self.initial_position = initial_position
+        self.records_limit = records_limit
+        self.poll_interval = poll_interval
+        self.discover_interval = discover_interval
+        self.auto_checkpoint = auto_checkpoint
+        self.max_poll_interval = max_poll_interval
+        self.reads_per_second = reads_per_second
+        self.on_shard_end = on_shard_end
+
+        self.workers = {}
+        # shard_id -> counters, millis_behind_latest, interval, last_read
+        self.shard_stats = {}
+        self.__stats_lock = Lock()
+        self.__stop = Event()
+        # Shards whose worker was stopped by stop_shard, not read again until a restart
+        self.__stopped_shards = set()
+        self.__rediscover = Event()
+        self.__discoverer = None
+
+    def __str__(self) -> str:
+        return (
+            f"<ShardConsumer(stream_name='{self.api.stream_name}', "
+            f"shards={sorted(self.workers)})>"
+        )
+
+    def checkpoint(self, shard_id: str, sequence_number: str) -> None:
+        self.checkpoint_store.put(shard_id, sequence_number)
+
+    def __is_finished(self, shard_id: str) -> bool:
+        return self.checkpoint_store.get(shard_id) == SHARD_END
+
+    def __is_ready(self, shard: dict, shard_ids: set) -> bool:
+        """
+        A child shard is only read after its parent(s) are fully consumed, which keeps
+        the per partition key ordering across resharding.
+        """
+        for key in ("ParentShardId", "AdjacentParentShardId"):
+            parent = shard.get(key)
+            if parent and parent in shard_ids and not self.__is_finished(parent):
+                return False
+        return True
+
+    def discover(self) -> None:
+        """
+        List the shards of the stream and start a worker for every new readable shard
+        """
+        shards = self.api.list_shards()
+        shard_ids = {shard["ShardId"] for shard in shards}
+        self.api.shard_ids = [shard["ShardId"] for shard in shards]
+        for shard in shards:
+            shard_id = shard["ShardId"]
+            if shard_id in self.workers or self.__is_finished(shard_id):
+                continue
+            if not self.__is_ready(shard, shard_ids):
+                continue
+            worker = Thread(
+                target=self.__read_shard, args=(shard_id,), name=f"shard-{shard_id}", daemon=True
+            )
+            self.workers[shard_id] = worker
+            worker.start()
+
+    def __get_iterator(self, shard_id: str) -> str:
+        sequence_number = self.checkpoint_store.get(shard_id)
+        if sequence_number:
+            return self.api.get_shard_iterator(
+                iterator_type="AFTER_SEQUENCE_NUMBER",
+                sequence_number=sequence_number,
+                shard_id=shard_id
+            )
+        return self.api.get_shard_iterator(iterator_type=self.initial_position, shard_id=shard_id)
+
+    def __count(self, stats: dict, **values) -> None:
+        with self.__stats_lock:
+            for key, value in values.items():
+                stats[key] += value
+
+    def __read_shard(self, shard_id: str) -> None:
+        scheduler = PollScheduler(
+            min_interval=self.poll_interval,
+            max_interval=self.max_poll_interval,
+            reads_per_second=self.reads_per_second
+        )
+        stats = {counter: 0 for counter in STAT_COUNTERS}
+        stats.update({"millis_behind_latest": 0, "interval": 0.0, "last_read": None})
+        with self.__stats_lock:
+            self.shard_stats[shard_id] = stats
+
+        shard_iterator = None
+        delay = 0.0
+        while not self.__stop.is_set():
+            if scheduler.wait(delay, self.__stop.wait) or shard_id in self.__stopped_shards:
+                break
+            try:
+                if not shard_iterator:
+                    self.__count(stats, get_shard_iterator=1)
+                    shard_iterator = self.__get_iterator(shard_id)
+                self.__count(stats, get_records=1)
+                resp = self.api.fetch_records(shard_iterator, self.records_limit)
+            except Exception as err:
+                delay = scheduler.after_error(err)
+                if is_throttled(err):
+                    # Same iterator again once the shard's read limit allows it
+                    self.__count(stats, throttled=1)
+                    continue
+                # Expired iterator, network: resume from the last checkpoint
+                logger.warning(
+                    "Error reading shard: %s of stream: %s: %s", shard_id, self.api.stream_name, err
+                )
+                self.__count(stats, errors=1)
+                shard_iterator = None
+                continue
+
+            records = resp["records"]
+            if records:
+                try:
+                    self.handler(shard_id, records)
+                    if self.auto_checkpoint:
+                        self.checkpoint(shard_id, records[-1]["sequence_number"])
+                except Exception as err:
+                    # The records are read again from the last checkpoint
+                    logger.exception(
+                        "Failed to process %d records of shard: %s of stream: %s",
+                        len(records), shard_id, self.api.stream_name
+                    )
+                    self.__count(stats, errors=1)
+                    shard_iterator = None
+                    delay = scheduler.after_error(err)
+                    continue
+
+            delay = scheduler.after_read(len(records), resp["millis_behind_latest"])
+            self.__count(stats, records=len(records), empty_reads=int(not records))
+            with self.__stats_lock:
+                stats["millis_behind_latest"] = resp["millis_behind_latest"]
+                stats["interval"] = delay
+                stats["last_read"] = time()
+
+            shard_iterator = resp["next_shard_iterator"]
+            if not shard_iterator:
+                # Shard closed by resharding and fully read, children can be read now
+                if self.on_shard_end is not None:
+                    self.on_shard_end(shard_id)
+                    return
+                self.checkpoint(shard_id, SHARD_END)
+                self.rediscover()
+                return
+
+    def stats(self) -> dict:
+        """
+        API calls, records and lag of the shards being read (and of closed shards):
+        {"get_records": ..., "millis_behind_latest": max over shards, "shards": {...}}
+        """
+        with self.__stats_lock:
+            shards = {shard_id: dict(stats) for shard_id, stats in self.shard_stats.items()}
+        summary = {
+            counter: sum(stats[counter] for stats in shards.values())
+            for counter in STAT_COUNTERS
+        }
+        summary["millis_behind_latest"] = max(
+            [stats["millis_behind_latest"] for stats in shards.values()], default=0
+        )
+        summary["shards"] = shards
+        return summary
+
+    def stop_shard(self, shard_id: str) -> None:
+        """
+        Stop reading a shard (its worker exits after the current read), it stays
+        stopped until the consumer is restarted
+        """
+        self.__stopped_shards.add(shard_id)
+
+    def rediscover(self) -> None:
+        """
+        List the shards again now (ex: after a parent shard was checkpointed as SHARD_END)
+        """
+        self.__rediscover.set()
+
+    def __discover_loop(self) -> None:
+        while not self.__stop.is_set():
+            try:
+                self.discover()
+            except Exception:
+                logger.exception("Failed to list shards of stream: %s", self.api.stream_name)
+            self.__rediscover.wait(self.discover_interval)
+            self.__rediscover.clear()
+
+    def start(self) -> None:
+        self.__stop.clear()
+        self.__discoverer = Thread(target=self.__discover_loop, name="shard-discovery", daemon=True)
+        self.__discoverer.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+        self.__rediscover.set()
+
+    def join(self, timeout: float = None) -> None:
+        if self.__discoverer is not None:
+            self.__discoverer.join(timeout)
+        for worker in list(self.workers.values()):
+            worker.join(timeout)
+
+    def run_forever(self, report_interval: float = None) -> None:
+        """
+        Start the workers and block until interrupted (Ctrl+C)
+        Logs the read stats every report_interval seconds when given.
+        """
+        self.start()
+        reported = time()
+        try:
+            while not self.__stop.wait(1.0):
+                if report_interval and time() - reported >= report_interval:
+                    reported = time()
+                    stats = self.stats()
+                    logger.info(
+                        "[%s] records: %s, get_records: %s (%s empty, %s throttled), "
+                        "errors: %s, behind: %s ms",
+                        self.api.stream_name, stats["records"], stats["get_records"],
+                        stats["empty_reads"], stats["throttled"], stats["errors"],
+                        stats["millis_behind_latest"]
+                    )
+        except KeyboardInterrupt:
+            logger.info("Stopping shard consumer...")
+        finally:
+            self.stop()
+            self.join()
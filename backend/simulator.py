@@ -0,0 +1,172 @@
+"""
+Python: 3.7.9
+
+Market simulation sources and pacing for the producer
+
+Sources yield one wire_format record array per minute (every symbol's tick of that
+minute), either replayed from intraday CSV files (market_data.merge_ticks) or
+generated synthetically with geometric Brownian motion (GBM).
+
+MinuteScheduler paces the minutes on a monotonic clock: minute n is due at
+start + n * 60 / speed, so pacing never drifts with the time spent producing.
+"""
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+from typing import Iterator
+import numpy as np
+import wire_format
+
+
+MARKET_OPEN_MINUTE = 9 * 60 + 30
+MINUTES_PER_DAY = 390
+
+
+class MinuteScheduler:
+    """
+    Drift-free pacing of minute batches
+
+    speed: 1.0 replays in real time (60s per minute), 60.0 one minute per second,
+           0 (or inf) as fast as possible
+    """
+
+    def __init__(self, speed: float = 1.0, interval: float = 60.0):
+        self.speed = speed
+        self.delay = interval / speed if speed and speed != float("inf") else 0.0
+        self.start = None
+
+    def __str__(self) -> str:
+        speed = f"{self.speed}x" if self.delay else "max"
+        return f"<MinuteScheduler(speed={speed}, delay={self.delay:.3f}s)>"
+
+    def wait(self, index: int) -> float:
+        """
+        Sleep until minute `index` is due. Returns how late (seconds) it is, if behind.
+        """
+        now = monotonic()
+        if self.start is None:
+            self.start = now
+        if not self.delay:
+            return 0.0
+        remaining = self.start + index * self.delay - now
+        if remaining > 0:
+            sleep(remaining)
+            return 0.0
+        return -remaining
+
+
+class RateReport:
+    """
+    Achieved vs target ticks/sec of a simulation run
+    """
+
+    def __init__(self, scheduler: MinuteScheduler):
+        self.scheduler = scheduler
+        self.ticks = 0
+        self.minutes = 0
+        self.start = monotonic()
+
+    def add(self, ticks: int) -> None:
+        self.ticks += ticks
+        self.minutes += 1
+
+    def achieved(self) -> float:
+        elapsed = monotonic() - self.start
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def target(self) -> float:
+        """
+        Target ticks/sec (inf when running as fast as possible)
+        """
+        if not self.scheduler.delay or not self.minutes:
+            return float("inf")
+        return self.ticks / self.minutes / self.scheduler.delay
+
+    def __str__(self) -> str:
+        target = self.target()
+        target = "max" if target == float("inf") else f"{target:,.1f}"
+        return (
+            f"minutes: {self.minutes} | ticks: {self.ticks:,} | "
+            f"achieved: {self.achieved():,.1f} ticks/sec | target: {target} ticks/sec"
+        )
+
+
+def symbol_slices(batch: np.ndarray) -> Iterator[np.ndarray]:
+    """
+    Split a minute batch into one record array per symbol
+    """
+    batch = batch[np.argsort(batch["symbol"], kind="stable")]
+    symbols, starts = np.unique(batch["symbol"], return_index=True)
+    ends = list(starts[1:]) + [len(batch)]
+    for start, end in zip(starts.tolist(), ends):
+        yield batch[start:end]
+
+
+class GBMGenerator:
+    """
+    Synthetic ticks for thousands of symbols with geometric Brownian motion
+
+    Every minute is simulated with `steps` sub-steps per symbol (vectorized over all
+    symbols), giving open/high/low/close, average, volume and notional.
+    `minutes` trading minutes (from 09:30) are generated per day for `days` days.
+    """
+
+    def __init__(
+        self,
+        symbols: int = 1000,
+        minutes: int = MINUTES_PER_DAY,
+        days: int = 1,
+        start_price: float = 100.0,
+        mu: float = 0.05,
+        sigma: float = 0.3,
+        steps: int = 4,
+        date: int = 20201022,
+        seed: int = None
+    ):
+        self.symbols = np.array([f"S{idx:06d}".encode("ascii") for idx in range(symbols)])
+        self.minutes = minutes
+        self.days = days
+        self.start_price = start_price
+        self.mu = mu
+        self.sigma = sigma
+        self.steps = steps
+        self.date = date
+        self.rng = np.random.default_rng(seed)
+
+    def __str__(self) -> str:
+        return (
+            f"<GBMGenerator(symbols={len(self.symbols)}, minutes={self.minutes}, "
+            f"days={self.days}, ticks={len(self.symbols) * self.minutes * self.days:,})>"
+        )
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        prices = self.start_price * np.exp(self.rng.normal(0.0, 0.5, len(self.symbols)))
+        start = datetime.strptime(str(self.date), "%Y%m%d")
+        for day in range(self.days):
+            date = int((start + timedelta(days=day)).strftime("%Y%m%d"))
+            for idx in range(self.minutes):
+                batch = self.__minute(prices, date, MARKET_OPEN_MINUTE + idx)
+                prices = batch["close"].copy()
+                yield batch
+
+    def __minute(self, prices: np.ndarray, date: int, minute: int) -> np.ndarray:
+        count = len(self.symbols)
+        # Sub-step as a fraction of a trading year (252 days x 390 minutes)
+        dt = 1.0 / (252 * MINUTES_PER_DAY * self.steps)
+        drift = (self.mu - 0.5 * self.sigma ** 2) * dt
+        shock = self.sigma * np.sqrt(dt)
+        steps = np.exp(drift + shock * self.rng.standard_normal((count, self.steps)))
+        path_ = prices[:, None] * np.cumprod(steps, axis=1)
+
+        batch = np.zeros(count, dtype=wire_format.TICK_DTYPE)
+        batch["date"] = date
+        batch["minute"] = minute
+        batch["symbol"] = self.symbols
+        batch["open"] = prices
+        batch["close"] = path_[:, -1]
+        batch["high"] = np.maximum(prices, path_.max(axis=1))
+        batch["low"] = np.minimum(prices, path_.min(axis=1))
+        batch["average"] = path_.mean(axis=1)
+        batch["volume"] = self.rng.integers(100, 20000, count)
+        batch["notional"] = batch["volume"] * batch["average"]
+        batch["numberOfTrades"] = batch["volume"] // 100 + 1
+        return batch
@@ -0,0 +1,335 @@
+"""
+Python: 3.7.9
+
+Local IPC channel streaming parsed tick batches from the consumer to the server
+
+The consumer publishes every parsed batch on a Unix socket (or "host:port" TCP address)
+and any number of server processes subscribe to it, so new candles reach the browser
+without waiting for the DynamoDB write and the next poll.
+
+Both sides authenticate with the shared secret of TICK_CHANNEL_AUTHKEY and refuse to
+start without one. The default socket is in a private (0700) runtime directory. Messages
+are framed as a JSON header and the raw bytes of the batches (encode_message), nothing
+received is unpickled.
+
+Every message carries a trace of per-stage timestamps (epoch seconds):
+produced -> consumed -> parsed -> published -> received -> emitted
+"""
+from collections import deque
+from json import dumps, loads
+import logging
+from multiprocessing.connection import Client, Listener
+from os import getenv, getuid, lstat, makedirs, path, remove
+from queue import Full, Queue
+from stat import S_ISDIR, S_ISSOCK
+from struct import Struct
+from tempfile import gettempdir
+from threading import Lock, Thread
+from time import sleep, time
+from typing import Any, Callable
+
+
+logger = logging.getLogger(__name__)
+
+# Environment variable of the shared secret of the publisher and the subscribers
+AUTHKEY_ENV = "TICK_CHANNEL_AUTHKEY"
+MIN_AUTHKEY_BYTES = 16
+# Private directory of the sockets: $XDG_RUNTIME_DIR/stock-stream, else <tmp>/stock-stream-<uid>
+RUNTIME_DIR = (
+    path.join(getenv("XDG_RUNTIME_DIR"), "stock-stream") if getenv("XDG_RUNTIME_DIR")
+    else path.join(gettempdir(), f"stock-stream-{getuid()}")
+)
+DEFAULT_ADDRESS = path.join(RUNTIME_DIR, "ticks.sock")
+# Larger frames are refused by the subscriber
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+STAGES = ["produced", "consumed", "parsed", "published", "received", "emitted"]
+
+HEADER_SIZE = Struct("<I")
+
+
+def default_authkey() -> bytes:
+    """
+    Shared secret from TICK_CHANNEL_AUTHKEY, raises ValueError when missing or too short
+    """
+    authkey = getenv(AUTHKEY_ENV, "").encode("utf-8")
+    if len(authkey) < MIN_AUTHKEY_BYTES:
+        raise ValueError(
+            f"! Set {AUTHKEY_ENV} to a secret of at least {MIN_AUTHKEY_BYTES} bytes shared by "
+            f"the consumer and the server (ex: python -c 'import secrets; "
+            f"print(secrets.token_hex(16))') !"
+        )
+    return authkey
+
+
+def parse_address(address: str) -> Any:
+    """
+    "host:port" -> TCP address tuple, anything else is a Unix socket path
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def make_private_dir(directory: str) -> None:
+    """
+    Create a directory only the current user can access (0700), raises PermissionError
+    when it exists with other permissions or owner (or is a symlink)
+    """
+    makedirs(directory, mode=0o700, exist_ok=True)
+    info = lstat(directory)
+    if not S_ISDIR(info.st_mode) or info.st_uid != getuid() or info.st_mode & 0o077:
+        raise PermissionError(
+            f"! Socket directory: {directory} must be owned by the current user with mode 0700 !"
+        )
+
+
+def encode_message(message: dict) -> bytes:
+    """
+    Message -> frame: header length (uint32), JSON header, raw bytes of the binary values
+
+    The bytes values (ex: "batch") and the bytes values of dict values (ex: "candles" per
+    timeframe) are appended raw, every other value (ex: "trace") goes in the header.
+    """
+    header = {"values": {}, "blobs": []}
+    blobs = []
+    for key, value in message.items():
+        if isinstance(value, bytes):
+            header["blobs"].append([key, None, len(value)])
+            blobs.append(value)
+        elif isinstance(value, dict) and value and all(
+            isinstance(blob, bytes) for blob in value.values()
+        ):
+            for name, blob in value.items():
+                header["blobs"].append([key, name, len(blob)])
+                blobs.append(blob)
+        else:
+            header["values"][key] = value
+    header = dumps(header, separators=(",", ":")).encode("utf-8")
+    return b"".join([HEADER_SIZE.pack(len(header)), header] + blobs)
+
+
+def decode_message(frame: bytes) -> dict:
+    """
+    Frame of encode_message -> message, raises ValueError when malformed
+    """
+    (size,) = HEADER_SIZE.unpack_from(frame)
+    offset = HEADER_SIZE.size + size
+    header = loads(frame[HEADER_SIZE.size:offset].decode("utf-8"))
+    message = header["values"]
+    for key, name, length in header["blobs"]:
+        blob = frame[offset:offset + length]
+        if len(blob) != length:
+            raise ValueError("! Truncated tick message !")
+        offset += length
+        if name is None:
+            message[key] = blob
+        else:
+            message.setdefault(key, {})[name] = blob
+    return message
+
+
+class TickPublisher:
+    """
+    Accepts subscribers and sends every published message to all of them.
+    Each subscriber has a bounded queue and its own sender thread, so a slow
+    subscriber only loses its oldest messages and never blocks the consumer.
+    """
+
+    def __init__(
+        self,
+        address: str = DEFAULT_ADDRESS,
+        authkey: bytes = None,
+        queue_size: int = 1000
+    ):
+        """
+        authkey : Shared secret of the subscribers, default: TICK_CHANNEL_AUTHKEY
+        """
+        authkey = authkey or default_authkey()
+        self.address = address
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.dropped = 0
+        self.__lock = Lock()
+        listen_address = parse_address(address)
+        if isinstance(listen_address, str):
+            make_private_dir(path.dirname(path.abspath(listen_address)))
+            if path.exists(listen_address) and S_ISSOCK(lstat(listen_address).st_mode):
+                # Stale socket file of a previous run
+                remove(listen_address)
+        self.__listener = Listener(listen_address, authkey=authkey)
+        self.__acceptor = Thread(target=self.__accept_loop, name="tick-publisher", daemon=True)
+        self.__acceptor.start()
+
+    def __str__(self) -> str:
+        return f"<TickPublisher(address='{self.address}', subscribers={len(self.subscribers)})>"
+
+    def __accept_loop(self) -> None:
+        while True:
+            try:
+                conn = self.__listener.accept()
+            except OSError:
+                # Listener closed
+                return
+            except Exception as err:
+                # Wrong authkey, client gone during the handshake
+                logger.warning("Tick subscriber failed to connect: %s", err)
+                continue
+            queue = Queue(maxsize=self.queue_size)
+            with self.__lock:
+                self.subscribers.append(queue)
+            Thread(target=self.__send_loop, args=(conn, queue), daemon=True).start()
+
+    def __send_loop(self, conn: Any, queue: Queue) -> None:
+        try:
+            while True:
+                frame = queue.get()
+                if frame is None:
+                    break
+                conn.send_bytes(frame)
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self.__lock:
+                if queue in self.subscribers:
+                    self.subscribers.remove(queue)
+            conn.close()
+
+    def publish(self, message: dict) -> None:
+        message.setdefault("trace", {})["published"] = time()
+        with self.__lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        frame = encode_message(message)
+        for queue in subscribers:
+            while True:
+                try:
+                    queue.put_nowait(frame)
+                    break
+                except Full:
+                    # Drop the oldest message of a slow subscriber
+                    try:
+                        queue.get_nowait()
+                        self.dropped += 1
+                    except Exception:
+                        pass
+
+    def close(self) -> None:
+        with self.__lock:
+            subscribers = list(self.subscribers)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(None)
+            except Full:
+                pass
+        self.__listener.close()
+
+
+class TickSubscriber:
+    """
+    Connects to a TickPublisher (reconnecting when it goes away) and calls
+    on_message(message) for every received message on a background thread.
+    It waits for the messages with poll (select), so it also runs as a green thread
+    of a monkey patched server (eventlet, gevent) without blocking it.
+    """
+
+    def __init__(
+        self,
+        on_message: Callable[[dict], None],
+        address: str = DEFAULT_ADDRESS,
+        authkey: bytes = None,
+        retry_interval: float = 1.0
+    ):
+        """
+        authkey : Shared secret of the publisher, default: TICK_CHANNEL_AUTHKEY
+        """
+        self.on_message = on_message
+        self.address = address
+        self.authkey = authkey or default_authkey()
+        self.retry_interval = retry_interval
+        self.connected = False
+        self.__running = False
+        self.__thread = None
+
+    def __str__(self) -> str:
+        return f"<TickSubscriber(address='{self.address}', connected={self.connected})>"
+
+    def start(self) -> None:
+        self.__running = True
+        self.__thread = Thread(target=self.__receive_loop, name="tick-subscriber", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__running = False
+
+    def __receive_loop(self) -> None:
+        while self.__running:
+            try:
+                conn = Client(parse_address(self.address), authkey=self.authkey)
+            except (OSError, EOFError):
+                sleep(self.retry_interval)
+                continue
+            except Exception as err:
+                # AuthenticationError: the publisher has another authkey
+                logger.warning("Failed to connect to the tick channel: %s: %s", self.address, err)
+                sleep(self.retry_interval)
+                continue
+            self.connected = True
+            try:
+                while self.__running:
+                    if not conn.poll(self.retry_interval):
+                        continue
+                    frame = conn.recv_bytes(MAX_MESSAGE_BYTES)
+                    try:
+                        message = decode_message(frame)
+                        message.setdefault("trace", {})["received"] = time()
+                        self.on_message(message)
+                    except Exception:
+                        logger.exception("Failed to handle tick message")
+            except (EOFError, OSError):
+                pass
+            finally:
+                self.connected = False
+                conn.close()
+
+
+class LatencyStats:
+    """
+    Rolling per-stage latencies computed from message traces
+    """
+
+    def __init__(self, size: int = 1000):
+        self.__lock = Lock()
+        self.__samples = {}
+        self.size = size
+
+    def record(self, trace: dict) -> None:
+        stages = [stage for stage in STAGES if stage in trace]
+        with self.__lock:
+            for start, end in zip(stages, stages[1:]):
+                self.__append(f"{start}->{end}", trace[end] - trace[start])
+            if len(stages) > 1:
+                self.__append("total", trace[stages[-1]] - trace[stages[0]])
+
+    def __append(self, name: str, value: float) -> None:
+        samples = self.__samples.get(name)
+        if samples is None:
+            samples = self.__samples[name] = deque(maxlen=self.size)
+        samples.append(value)
+
+    def summary(self) -> dict:
+        """
+        Latency percentiles in milliseconds per stage transition
+        """
+        with self.__lock:
+            samples = {name: sorted(values) for name, values in self.__samples.items()}
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": values[len(values) // 2] * 1e3,
+                "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1e3,
+                "max_ms": values[-1] * 1e3,
+            }
+            for name, values in samples.items() if values
+        }
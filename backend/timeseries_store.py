@@ -0,0 +1,267 @@
+"""
+Python: 3.7.9
+
+In-process time-series store of the intraday minutes, the server's hot query tier
+
+Every symbol keeps its columns (date, minute, OHLC, volume, notional) in preallocated
+NumPy buffers sorted by key (yyyymmdd * 10000 + minute, market_data.tick_keys), grown by
+doubling. Appending newer minutes copies them at the end of the buffers, older ones
+(late or replayed ticks, DynamoDB backfills) are merged in place. Range and latest-N
+queries are a binary search on the keys and a slice copy of the columns:
+
+    store = TimeSeriesStore()
+    store.warm(["data/columnar/intraday-22-oct"])  # or data/intraday-*-merged.csv
+    store.range("AAPL", to_key("09:30", 20201022), to_key("10:00", 20201022))
+    store.latest("AAPL", 30, fields=["close", "volume"])
+
+DynamoDB stays the cold tier: LiveDataCache loads the symbols missing here from it.
+"""
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List
+from market_data import intraday_minutes, tick_keys
+import numpy as np
+import wire_format
+
+
+# Rows preallocated per symbol, a full trading day of minutes fits without growing
+INITIAL_CAPACITY = 512
+# Stored columns (dtypes of wire_format.TICK_DTYPE), the key is always returned too
+FIELDS = ["date", "minute", "open", "high", "low", "close", "volume", "notional"]
+
+
+def to_key(value: str, date: int = 0) -> int:
+    """
+    "YYYY-MM-DD HH:MM", "YYYY-MM-DD" (start of the day) or "HH:MM" (on date) -> key.
+    Raises ValueError for any other format.
+    """
+    value = value.strip()
+    if len(value) == 5:
+        parsed = datetime.strptime(value, "%H:%M")
+        return date * 10000 + parsed.hour * 60 + parsed.minute
+    parsed = datetime.strptime(value, "%Y-%m-%d %H:%M" if len(value) > 10 else "%Y-%m-%d")
+    day = parsed.year * 10000 + parsed.month * 100 + parsed.day
+    return day * 10000 + parsed.hour * 60 + parsed.minute
+
+
+class SymbolSeries:
+    """
+    Columns of one symbol, sorted by key and unique, in buffers of `capacity` rows
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.size = 0
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.columns = {
+            field: np.zeros(capacity, dtype=wire_format.TICK_DTYPE[field]) for field in FIELDS
+        }
+
+    def __str__(self) -> str:
+        return f"<SymbolSeries(size={self.size}, capacity={len(self.keys)})>"
+
+    def reserve(self, size: int) -> None:
+        """
+        Grow the buffers (at least doubling them) to hold `size` rows
+        """
+        capacity = len(self.keys)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        keys = np.zeros(capacity, dtype=np.uint64)
+        keys[:self.size] = self.keys[:self.size]
+        self.keys = keys
+        for field, values in self.columns.items():
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[field] = grown
+
+    def last_key(self) -> int:
+        return int(self.keys[self.size - 1]) if self.size else 0
+
+    def append(self, rows: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        """
+        Add TICK_DTYPE rows sorted by their (unique) keys. Rows newer than the series are
+        copied at the end, older ones replace the row of the same key or are inserted.
+        Returns the mask of the rows that were newer.
+        """
+        if self.size and keys[0] <= self.keys[self.size - 1]:
+            newer = keys > self.keys[self.size - 1]
+            self.__merge(rows[~newer], keys[~newer])
+            rows, keys = rows[newer], keys[newer]
+        else:
+            newer = np.ones(len(keys), dtype=bool)
+        start = self.size
+        end = start + len(keys)
+        self.reserve(end)
+        self.keys[start:end] = keys
+        for field, values in self.columns.items():
+            values[start:end] = rows[field]
+        self.size = end
+        return newer
+
+    def __merge(self, rows: np.ndarray, keys: np.ndarray) -> None:
+        size = self.size
+        positions = np.searchsorted(self.keys[:size], keys)
+        found = self.keys[np.minimum(positions, size - 1)] == keys
+        for field, values in self.columns.items():
+            values[positions[found]] = rows[field][found]
+        missing = ~found
+        added = int(missing.sum())
+        if not added:
+            return
+        self.reserve(size + added)
+        merged_keys = np.concatenate((self.keys[:size], keys[missing]))
+        order = np.argsort(merged_keys, kind="stable")
+        self.keys[:size + added] = merged_keys[order]
+        for field, values in self.columns.items():
+            values[:size + added] = np.concatenate((values[:size], rows[field][missing]))[order]
+        self.size = size + added
+
+    def bounds(self, start: int = None, end: int = None) -> slice:
+        """
+        Rows with start <= key <= end (binary search)
+        """
+        keys = self.keys[:self.size]
+        lo = 0 if start is None else int(np.searchsorted(keys, start, side="left"))
+        hi = self.size if end is None else int(np.searchsorted(keys, end, side="right"))
+        return slice(lo, max(lo, hi))
+
+    def select(self, rows: slice, fields: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Copies of the key and the fields (default: all) of a slice of rows
+        """
+        columns = {"key": self.keys[rows].copy()}
+        for field in fields or FIELDS:
+            columns[field] = self.columns[field][rows].copy()
+        return columns
+
+
+class TimeSeriesStore:
+    """
+    SymbolSeries per symbol, fed with TICK_DTYPE batches (warm start, tick channel,
+    DynamoDB backfills) and queried by key range or latest N rows
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.capacity = capacity
+        self.series = {}
+        # Latest date seen, for the rows stored without one (DynamoDB items)
+        self.date = 0
+        self.__lock = Lock()
+
+    def __str__(self) -> str:
+        return f"<TimeSeriesStore(symbols={len(self.series)}, rows={len(self)})>"
+
+    def __len__(self) -> int:
+        return sum(series.size for series in self.series.values())
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.series
+
+    @property
+    def symbols(self) -> List[str]:
+        return sorted(self.series)
+
+    def append(self, batch: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Add a TICK_DTYPE batch (any symbols, any minutes, the last of duplicate keys wins).
+        Returns symbol -> rows newer than its series (sorted by key), ex: to broadcast.
+        """
+        if not len(batch):
+            return {}
+        keys = tick_keys(batch)
+        order = np.lexsort((keys, batch["symbol"]))
+        batch, keys = batch[order], keys[order]
+        symbols = batch["symbol"]
+        # lexsort is stable: keep the last row of a (symbol, key)
+        last = np.ones(len(batch), dtype=bool)
+        last[:-1] = (symbols[1:] != symbols[:-1]) | (keys[1:] != keys[:-1])
+        batch, keys, symbols = batch[last], keys[last], symbols[last]
+        starts = np.concatenate(([0], np.flatnonzero(symbols[1:] != symbols[:-1]) + 1))
+        ends = np.append(starts[1:], len(batch))
+
+        added = {}
+        with self.__lock:
+            self.date = max(self.date, int(batch["date"].max()))
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                symbol = symbols[start].decode("ascii")
+                series = self.series.get(symbol)
+                if series is None:
+                    series = self.series[symbol] = SymbolSeries(self.capacity)
+                rows = batch[start:end]
+                added[symbol] = rows[series.append(rows, keys[start:end])]
+        return added
+
+    def warm(self, sources: List[str]) -> int:
+        """
+        Load intraday data: columnar datasets (data/columnar/intraday-*) or CSV files,
+        globs and directories (data/intraday-*-merged.csv). Returns the rows loaded.
+        """
+        batches = list(intraday_minutes(sources))
+        if not batches:
+            return 0
+        records = np.frombuffer(
+            b"".join([batch.tobytes() for batch in batches]), wire_format.TICK_DTYPE
+        )
+        self.append(records)
+        return len(records)
+
+    def __series(self, symbol: str) -> SymbolSeries:
+        series = self.series.get(symbol)
+        if series is None:
+            raise KeyError(symbol)
+        return series
+
+    def range(
+        self,
+        symbol: str,
+        start: int = None,
+        end: int = None,
+        fields: List[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Columns (copies) of the rows with start <= key <= end (to_key), raises KeyError
+        for an unknown symbol
+        """
+        with self.__lock:
+            series = self.__series(symbol)
+            return series.select(series.bounds(start, end), fields)
+
+    def latest(self, symbol: str, n: int, fields: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Columns (copies) of the latest n rows, raises KeyError for an unknown symbol
+        """
+        with self.__lock:
+            series = self.__series(symbol)
+            return series.select(slice(max(0, series.size - n), series.size), fields)
+
+    def day(self, symbol: str, date: int = None, fields: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Columns (copies) of the rows of a date (default: the latest date of the symbol)
+        """
+        with self.__lock:
+            series = self.__series(symbol)
+            if date is None:
+                date = series.last_key() // 10000
+            return series.select(series.bounds(date * 10000, date * 10000 + 9999), fields)
+
+    def count(self, symbol: str, date: int = None) -> int:
+        """
+        Rows of a date (default: the latest date of the symbol), 0 for an unknown symbol
+        """
+        with self.__lock:
+            series = self.series.get(symbol)
+            if series is None:
+                return 0
+            if date is None:
+                date = series.last_key() // 10000
+            rows = series.bounds(date * 10000, date * 10000 + 9999)
+            return rows.stop - rows.start
+
+    def last_key(self, symbol: str) -> int:
+        """
+        Key of the latest row of a symbol, 0 when it has none
+        """
+        with self.__lock:
+            series = self.series.get(symbol)
+            return series.last_key() if series is not None else 0
@@ -0,0 +1,481 @@
+"""
+Python: 3.7.9
+
+Local write-ahead log of the parsed ticks, drained into DynamoDB in the background
+
+The consumer's sink appends every parsed batch to an append-only log of fixed-size
+records (wire_format.TICK_DTYPE rows) before the shard is checkpointed, and a drainer
+thread bulk-loads the log into DynamoDB at whatever rate the table takes, retrying
+with backoff while it is slow or failing. Ingestion no longer waits on (or crashes
+with) the table, and the log is a second durable copy of the data besides Kinesis.
+
+The log is a directory of segments ("000000000001.wal", ...), each a memory-mapped
+file of a 64 bytes header and `capacity` rows:
+
+    magic (4s) | version (u1) | flags (u1) | header size (u2) | row size (u4)
+    | capacity (u8) | committed rows (u8) | drained rows (u8)
+
+Rows are written, then the committed count (msync'd in order when sync=True), so a
+crash never exposes a partial batch. The drainer resumes from the drained count, rows
+drained twice are overwritten with the same values (DynamoDB puts are idempotent).
+Drained segments are kept (up to retain_segments) to rebuild the table with replay.
+
+Throttling, 5xx and network errors are retried until the table takes the rows. Errors
+the table returns for the rows themselves (PERMANENT_ERRORS, ex: ValidationException)
+would fail forever and block the log, so the batch is split until the failing rows are
+isolated, those are moved to the dead-letter log (the "dead-letter" directory of the log)
+and the drainer moves on. They can be replayed once the cause is fixed:
+
+$ python wal.py status
+$ python wal.py replay --table stock-stream-data
+$ python wal.py replay --dead-letter --table stock-stream-data
+"""
+from argparse import ArgumentParser
+from glob import glob
+import logging
+import mmap
+from os import makedirs, path, remove
+from struct import Struct
+import sys
+from threading import Condition, Event, Thread
+from time import perf_counter
+from typing import Callable, Iterator, List
+import numpy as np
+from polling import TokenBucket, error_code
+import metrics
+import wire_format
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STKW"
+VERSION = 1
+HEADER = Struct("<4sBBHIQQQ")
+HEADER_SIZE = 64
+# Rows per segment (~37 MB of TICK_DTYPE rows)
+SEGMENT_ROWS = 500000
+# Rows per bulk load of the drainer
+DRAIN_BATCH = 5000
+# Drained segments kept for replay, older ones are deleted
+RETAIN_SEGMENTS = 20
+# Undrained segments before append blocks (bounds the disk used while the table is down)
+MAX_PENDING_SEGMENTS = 40
+# Backoff (seconds) of the drainer while the table fails
+DRAIN_BACKOFF_BASE = 0.5
+DRAIN_BACKOFF_CAP = 30.0
+# Seconds between two checks of the stop flag while idle
+IDLE_WAIT = 0.5
+# Errors of the rows themselves, retrying them can never succeed
+PERMANENT_ERRORS = {
+    "ValidationException", "SerializationException", "ItemCollectionSizeLimitExceededException"
+}
+# Sub-directory of the rows the table rejected, and its rows per segment (~0.8 MB)
+DEAD_LETTER_DIR = "dead-letter"
+DEAD_LETTER_ROWS = 10000
+
+
+def is_permanent(err: Exception) -> bool:
+    return error_code(err) in PERMANENT_ERRORS
+
+
+class Segment:
+    """
+    One memory-mapped segment file of the log
+    """
+
+    def __init__(self, file_path: str, capacity: int = None):
+        """
+        Opens the segment, creating it with `capacity` rows when it does not exist
+        """
+        self.path = file_path
+        row_size = wire_format.TICK_DTYPE.itemsize
+        if not path.exists(file_path):
+            if not capacity:
+                raise ValueError(f"! Segment not found: {file_path} !")
+            with open(file_path, "wb") as file:
+                file.truncate(HEADER_SIZE + capacity * row_size)
+                file.write(HEADER.pack(MAGIC, VERSION, 0, HEADER_SIZE, row_size, capacity, 0, 0))
+        self.__file = open(file_path, "r+b")
+        self.__mmap = mmap.mmap(self.__file.fileno(), 0)
+        magic, version, _, header_size, size, capacity, committed, drained = HEADER.unpack_from(
+            self.__mmap
+        )
+        if magic != MAGIC or version > VERSION or size != row_size:
+            self.close()
+            raise ValueError(f"! Not a tick write-ahead log segment: {file_path} !")
+        self.capacity = capacity
+        self.committed = committed
+        self.drained = drained
+        self.rows = np.frombuffer(
+            self.__mmap, dtype=wire_format.TICK_DTYPE, count=capacity, offset=header_size
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"<Segment(path='{self.path}', committed={self.committed}, "
+            f"drained={self.drained}, capacity={self.capacity})>"
+        )
+
+    @property
+    def full(self) -> bool:
+        return self.committed >= self.capacity
+
+    def __write_header(self, sync: bool) -> None:
+        HEADER.pack_into(
+            self.__mmap, 0, MAGIC, VERSION, 0, HEADER_SIZE, wire_format.TICK_DTYPE.itemsize,
+            self.capacity, self.committed, self.drained
+        )
+        if sync:
+            self.__mmap.flush(0, HEADER_SIZE)
+
+    def append(self, rows: np.ndarray, sync: bool = True) -> int:
+        """
+        Write as many rows as fit, returns the number of rows written
+        """
+        count = min(len(rows), self.capacity - self.committed)
+        if count <= 0:
+            return 0
+        start = self.committed
+        self.rows[start:start + count] = rows[:count]
+        if sync:
+            # msync takes a page aligned offset
+            offset = HEADER_SIZE + start * self.rows.itemsize
+            aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+            self.__mmap.flush(aligned, offset + count * self.rows.itemsize - aligned)
+        # Rows first, then the count that makes them visible
+        self.committed += count
+        self.__write_header(sync)
+        return count
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        Copy of the committed rows [start, end)
+        """
+        return np.array(self.rows[start:min(end, self.committed)])
+
+    def mark_drained(self, drained: int, sync: bool = True) -> None:
+        self.drained = drained
+        self.__write_header(sync)
+
+    def close(self) -> None:
+        self.rows = None
+        self.__mmap.close()
+        self.__file.close()
+
+
+def segment_paths(directory: str) -> List[str]:
+    return sorted(glob(path.join(directory, "*.wal")))
+
+
+class WriteAheadLog:
+    """
+    Append-only log of tick rows with a background drainer
+
+    sink(rows)      : Bulk load of the rows (TICK_DTYPE) into the table, raising on failure
+    sync            : msync every append (survives power loss), else the rows are durable
+                      once in the page cache (survives a crash of the process)
+    rows_per_second : Cap on the drain rate (default: as fast as the sink goes)
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sink: Callable[[np.ndarray], None] = None,
+        segment_rows: int = SEGMENT_ROWS,
+        sync: bool = True,
+        drain_batch: int = DRAIN_BATCH,
+        retain_segments: int = RETAIN_SEGMENTS,
+        max_pending_segments: int = MAX_PENDING_SEGMENTS,
+        rows_per_second: float = None
+    ):
+        makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sink = sink
+        self.segment_rows = segment_rows
+        self.sync = sync
+        self.drain_batch = drain_batch
+        self.retain_segments = retain_segments
+        self.max_pending_segments = max(1, max_pending_segments)
+        self.bucket = TokenBucket(rows_per_second, burst=drain_batch) if rows_per_second else None
+
+        self.appended_rows = 0
+        self.drained_rows = 0
+        self.dead_letter_rows = 0
+        self.failures = 0
+        # Log of the rows the table rejected, created on first use
+        self.dead_letter = None
+        self.__started = perf_counter()
+        # Fully drained segments kept for replay (closed), then the open ones
+        self.retained = []
+        self.segments = []
+        for file_path in segment_paths(directory):
+            segment = Segment(file_path)
+            if segment.full and segment.drained >= segment.committed:
+                segment.close()
+                self.retained.append(file_path)
+            else:
+                self.segments.append(segment)
+        self.__next_index = 1 + max(
+            [int(path.basename(file_path)[:-4]) for file_path in segment_paths(directory)] or [0]
+        )
+        self.__changed = Condition()
+        self.__stop = Event()
+        self.__drainer = None
+
+    def __str__(self) -> str:
+        return (
+            f"<WriteAheadLog(directory='{self.directory}', segments={len(self.segments)}, "
+            f"pending_rows={self.pending()})>"
+        )
+
+    def __new_segment(self) -> Segment:
+        file_path = path.join(self.directory, f"{self.__next_index:012d}.wal")
+        self.__next_index += 1
+        segment = Segment(file_path, capacity=self.segment_rows)
+        self.segments.append(segment)
+        return segment
+
+    def append(self, rows: np.ndarray) -> None:
+        """
+        Durably append rows (TICK_DTYPE) to the log, blocks while max_pending_segments
+        segments are waiting for the drainer
+        """
+        rows = np.asarray(rows, dtype=wire_format.TICK_DTYPE)
+        with self.__changed:
+            while len(self.segments) > self.max_pending_segments and not self.__stop.is_set():
+                self.__changed.wait(IDLE_WAIT)
+            written = 0
+            while written < len(rows):
+                segment = self.segments[-1] if self.segments else None
+                if segment is None or segment.full:
+                    segment = self.__new_segment()
+                written += segment.append(rows[written:], self.sync)
+            self.appended_rows += len(rows)
+            self.__changed.notify_all()
+
+    def pending(self) -> int:
+        """
+        Rows appended but not drained yet
+        """
+        with self.__changed:
+            return sum(segment.committed - segment.drained for segment in self.segments)
+
+    def __next_batch(self) -> tuple:
+        """
+        Oldest segment with undrained rows and its next rows, (None, None) when drained
+        """
+        with self.__changed:
+            for segment in self.segments:
+                if segment.drained < segment.committed:
+                    start = segment.drained
+                    return segment, segment.read(start, start + self.drain_batch)
+            return None, None
+
+    def __retire(self, segment: Segment) -> None:
+        """
+        Close a full and drained segment, deleting the oldest ones past retain_segments
+        """
+        with self.__changed:
+            if not (segment.full and segment.drained >= segment.committed):
+                return
+            # When it was the segment appended to, the next append creates a new one
+            self.segments.remove(segment)
+            segment.close()
+            self.retained.append(segment.path)
+            while len(self.retained) > self.retain_segments:
+                remove(self.retained.pop(0))
+            self.__changed.notify_all()
+
+    def __dead_letter(self, rows: np.ndarray, err: Exception) -> None:
+        if self.dead_letter is None:
+            # Never drained, so append must not block on its pending segments
+            self.dead_letter = WriteAheadLog(
+                path.join(self.directory, DEAD_LETTER_DIR), segment_rows=DEAD_LETTER_ROWS,
+                sync=self.sync, max_pending_segments=sys.maxsize
+            )
+        self.dead_letter.append(rows)
+        self.dead_letter_rows += len(rows)
+        logger.error(
+            "Moved %d rows rejected by the table to the dead-letter log: %s (symbols: %s): %s",
+            len(rows), self.dead_letter.directory,
+            ", ".join(sorted(set(np.char.decode(rows["symbol"], "ascii").tolist()))), err
+        )
+
+    def __load(self, rows: np.ndarray) -> None:
+        """
+        Sink the rows, the ones failing with a permanent error go to the dead-letter log
+        (found by splitting the batch in halves). Other errors are raised.
+        """
+        try:
+            self.sink(rows)
+        except Exception as err:
+            if not is_permanent(err):
+                raise
+            if len(rows) == 1:
+                self.__dead_letter(rows, err)
+                return
+            # Rows written before the error are written again, puts are idempotent
+            middle = len(rows) // 2
+            self.__load(rows[:middle])
+            self.__load(rows[middle:])
+
+    def drain_once(self) -> int:
+        """
+        Load the next batch of undrained rows into the sink, returns the rows loaded
+        (or moved to the dead-letter log)
+        """
+        segment, rows = self.__next_batch()
+        if segment is None or not len(rows):
+            return 0
+        if self.bucket is not None:
+            delay = self.bucket.reserve(len(rows))
+            if delay > 0 and self.__stop.wait(delay):
+                return 0
+        self.__load(rows)
+        with self.__changed:
+            segment.mark_drained(segment.drained + len(rows), self.sync)
+            self.drained_rows += len(rows)
+        self.__retire(segment)
+        return len(rows)
+
+    def __drain_loop(self) -> None:
+        backoff = DRAIN_BACKOFF_BASE
+        while not self.__stop.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception as err:
+                # Throttled or unavailable: the rows stay in the log, the table is retried
+                # until it takes them
+                self.failures += 1
+                logger.warning(
+                    "Drain of the write-ahead log failed, retry in %.1fs: %s", backoff, err
+                )
+                self.__stop.wait(backoff)
+                backoff = min(DRAIN_BACKOFF_CAP, backoff * 2)
+                continue
+            backoff = DRAIN_BACKOFF_BASE
+            if not drained:
+                with self.__changed:
+                    if self.pending() == 0:
+                        self.__changed.wait(IDLE_WAIT)
+
+    def start(self) -> None:
+        if self.sink is None:
+            raise ValueError("! A sink is required to drain the write-ahead log !")
+        self.__stop.clear()
+        self.__drainer = Thread(target=self.__drain_loop, name="wal-drainer", daemon=True)
+        self.__drainer.start()
+
+    def wait_drained(self, timeout: float = None) -> bool:
+        """
+        Wait until every appended row is drained, returns False on timeout
+        """
+        started = perf_counter()
+        with self.__changed:
+            while self.pending():
+                if timeout is not None and perf_counter() - started > timeout:
+                    return False
+                self.__changed.wait(0.01)
+        return True
+
+    def stop(self) -> None:
+        self.__stop.set()
+        with self.__changed:
+            self.__changed.notify_all()
+
+    def join(self, timeout: float = None) -> None:
+        if self.__drainer is not None:
+            self.__drainer.join(timeout)
+
+    def close(self) -> None:
+        """
+        Stop the drainer and close the segments (undrained rows are drained on next start)
+        """
+        self.stop()
+        self.join()
+        with self.__changed:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+        if self.dead_letter is not None:
+            self.dead_letter.close()
+
+    def stats(self) -> dict:
+        elapsed = max(perf_counter() - self.__started, 1e-9)
+        with self.__changed:
+            return {
+                "segments": len(self.segments),
+                "retained_segments": len(self.retained),
+                "appended_rows": self.appended_rows,
+                "drained_rows": self.drained_rows,
+                "pending_rows": sum(
+                    segment.committed - segment.drained for segment in self.segments
+                ),
+                "drained_rows_per_sec": self.drained_rows / elapsed,
+                "dead_letter_rows": self.dead_letter_rows,
+                "failures": self.failures,
+            }
+
+    def register_metrics(self, registry: metrics.Registry = metrics.REGISTRY) -> None:
+        registry.gauge(
+            metrics.PREFIX + "wal_pending_rows", "Rows in the write-ahead log not in DynamoDB yet"
+        ).labels().set_function(self.pending)
+        registry.gauge(
+            metrics.PREFIX + "wal_dead_letter_rows",
+            "Rows rejected by DynamoDB and moved to the dead-letter log"
+        ).labels().set_function(lambda: self.dead_letter_rows)
+
+
+def read_log(directory: str, batch_rows: int = DRAIN_BATCH) -> Iterator[np.ndarray]:
+    """
+    Committed rows of every segment of a log, oldest first, in batches
+    """
+    for file_path in segment_paths(directory):
+        segment = Segment(file_path)
+        try:
+            for start in range(0, segment.committed, batch_rows):
+                yield segment.read(start, start + batch_rows)
+        finally:
+            segment.close()
+
+
+def replay(directory: str, sink: Callable[[np.ndarray], None]) -> int:
+    """
+    Load every row of the log (drained or not) into the sink, returns the row count
+    """
+    rows = 0
+    for batch in read_log(directory):
+        sink(batch)
+        rows += len(batch)
+    return rows
+
+
+if __name__ == "__main__":
+    from kinesis_api import DynamoDbAPI
+    import consumer
+
+    parser = ArgumentParser(description="Write-ahead log of the consumer")
+    parser.add_argument("command", choices=["status", "replay"])
+    parser.add_argument("--dir", default=consumer.WAL_DIR, help="Log directory")
+    parser.add_argument("--table", default=consumer.DYNAMO_DB_TABLE, help="Table to rebuild")
+    parser.add_argument(
+        "--dead-letter", action="store_true", help="The rows the table rejected instead"
+    )
+    args = parser.parse_args()
+    if args.dead_letter:
+        args.dir = path.join(args.dir, DEAD_LETTER_DIR)
+
+    print("====================================")
+    print("Consumer Write-Ahead Log")
+    print("====================================")
+    if args.command == "status":
+        for file_path in segment_paths(args.dir):
+            segment = Segment(file_path)
+            print(segment)
+            segment.close()
+    else:
+        db_api = DynamoDbAPI(args.table)
+        started = perf_counter()
+        count = replay(args.dir, lambda rows: consumer.insert_db(db_api, rows))
+        print(f"Replayed {count:,} rows into {args.table} in {perf_counter() - started:.1f}s")
+        db_api.close()
@@ -0,0 +1,217 @@
+"""
+Python: 3.7.9
+
+Compact binary wire format for batches of OHLCV ticks
+
+A record is a small fixed header followed by the rows of the batch as a packed
+NumPy record array (TICK_DTYPE), so decoding is a zero-copy np.frombuffer view.
+
+Header (little endian, 24 bytes):
+    magic (4s) | version (u1) | flags (u1) | header size (u2) | row count (u4)
+    | batch id (u4) | created at, epoch seconds (f8)
+
+Records not starting with MAGIC are JSON (the previous format) and are still accepted.
+"""
+from json import loads
+from struct import Struct
+from time import time
+from typing import Any, List
+import numpy as np
+
+
+MAGIC = b"STKB"
+VERSION = 1
+HEADER = Struct("<4sBBHIId")
+
+# One row of a batch, field names follow the columns of the intraday CSV files
+TICK_DTYPE = np.dtype([
+    ("date", "<u4"),            # yyyymmdd
+    ("minute", "<u2"),          # minutes since midnight
+    ("symbol", "S8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("average", "<f8"),
+    ("volume", "<i8"),
+    ("notional", "<f8"),
+    ("numberOfTrades", "<u4"),
+])
+FLOAT_FIELDS = ["open", "high", "low", "close", "average", "notional"]
+
+
+# Digit weights of fixed width "HH:MM" and "YYYY-MM-DD" strings (separators weigh 0)
+MINUTE_WEIGHTS = np.array([600, 60, 0, 10, 1], dtype=np.uint32)
+DATE_WEIGHTS = np.array([10000000, 1000000, 100000, 10000, 0, 1000, 100, 0, 10, 1], np.uint32)
+
+
+def _parse_digits(values: Any, weights: np.ndarray) -> np.ndarray:
+    """
+    Fixed width ASCII digit strings -> integers, vectorized over the bytes of the strings
+    """
+    width = len(weights)
+    chars = np.asarray(values, dtype=f"S{width}").view(np.uint8).reshape(-1, width)
+    digits = chars.astype(np.uint32) - ord("0")
+    return (digits * weights).sum(axis=1, dtype=np.uint32)
+
+
+def parse_minutes(values: Any) -> np.ndarray:
+    """
+    "HH:MM" strings -> minutes since midnight
+    """
+    return _parse_digits(values, MINUTE_WEIGHTS).astype(np.uint16)
+
+
+def parse_dates(values: Any) -> np.ndarray:
+    """
+    "YYYY-MM-DD" strings -> yyyymmdd integers
+    """
+    return _parse_digits(values, DATE_WEIGHTS)
+
+
+def format_minutes(minutes: np.ndarray) -> List[str]:
+    """
+    minutes since midnight -> "HH:MM" strings
+    """
+    return [f"{minute // 60:02d}:{minute % 60:02d}" for minute in minutes.tolist()]
+
+
+def format_dates(dates: np.ndarray) -> List[str]:
+    """
+    yyyymmdd integers -> "YYYY-MM-DD" strings
+    """
+    return [
+        f"{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}" for date in dates.tolist()
+    ]
+
+
+def frame_to_records(df: Any) -> np.ndarray:
+    """
+    Convert a DataFrame with the intraday CSV columns into a TICK_DTYPE record array
+    """
+    arr = np.zeros(len(df), dtype=TICK_DTYPE)
+    for field in FLOAT_FIELDS:
+        arr[field] = np.nan
+    for field in TICK_DTYPE.names:
+        if field not in df:
+            continue
+        if field == "date":
+            arr[field] = parse_dates(df[field].to_numpy())
+        elif field == "minute":
+            arr[field] = parse_minutes(df[field].to_numpy())
+        elif field == "symbol":
+            arr[field] = np.asarray(df[field].to_numpy(), dtype="S8")
+        else:
+            arr[field] = df[field].to_numpy()
+    return arr
+
+
+def columns_to_records(columns: dict) -> np.ndarray:
+    """
+    Convert a DataFrame.to_dict() style dict {column: {row index: value}} (the JSON
+    record format) into a TICK_DTYPE record array, for any number of rows.
+    Missing prices are NaN.
+    """
+    # Every column shares the index of the producer's DataFrame
+    indices = sorted(next(iter(columns.values()), {}), key=int)
+    arr = np.zeros(len(indices), dtype=TICK_DTYPE)
+    for field in FLOAT_FIELDS:
+        arr[field] = np.nan
+    for field in TICK_DTYPE.names:
+        column = columns.get(field)
+        if not column:
+            continue
+        values = [column.get(index) for index in indices]
+        if field == "date":
+            arr[field] = parse_dates(values)
+        elif field == "minute":
+            arr[field] = parse_minutes(values)
+        elif field == "symbol":
+            arr[field] = np.asarray(values, dtype="S8")
+        else:
+            # None (missing) -> NaN, integer columns keep 0 for missing
+            floats = np.asarray(values, dtype=np.float64)
+            if arr.dtype[field].kind != "f":
+                floats = np.nan_to_num(floats)
+            arr[field] = floats
+    return arr
+
+
+def encode_records(arr: np.ndarray, batch_id: int = 0, created_at: float = None) -> bytes:
+    """
+    TICK_DTYPE record array -> binary record
+    """
+    arr = np.ascontiguousarray(arr, dtype=TICK_DTYPE)
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, HEADER.size, len(arr), batch_id,
+        time() if created_at is None else created_at
+    )
+    return header + arr.tobytes()
+
+
+def encode_frame(df: Any, batch_id: int = 0, created_at: float = None) -> bytes:
+    """
+    DataFrame (intraday CSV columns) -> binary record
+    """
+    return encode_records(frame_to_records(df), batch_id, created_at)
+
+
+def is_binary(blob: Any) -> bool:
+    return isinstance(blob, (bytes, bytearray, memoryview)) and bytes(blob[:4]) == MAGIC
+
+
+def decode_header(blob: bytes) -> dict:
+    magic, version, flags, header_size, rows, batch_id, created_at = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("! Not a binary tick batch !")
+    if version > VERSION:
+        raise ValueError(f"! Unsupported wire format version: {version} !")
+    return {
+        "version": version,
+        "flags": flags,
+        "header_size": header_size,
+        "rows": rows,
+        "batch_id": batch_id,
+        "created_at": created_at,
+    }
+
+
+def decode(blob: bytes) -> np.ndarray:
+    """
+    Binary record -> read-only TICK_DTYPE record array (zero-copy view of blob)
+    """
+    header = decode_header(blob)
+    expected = header["header_size"] + header["rows"] * TICK_DTYPE.itemsize
+    if len(blob) < expected:
+        raise ValueError(f"! Truncated tick batch: {len(blob)} of {expected} bytes !")
+    return np.frombuffer(
+        blob, dtype=TICK_DTYPE, count=header["rows"], offset=header["header_size"]
+    )
+
+
+def decode_data(blob: Any) -> Any:
+    """
+    Decode a Kinesis record's data: binary tick batch, else JSON
+    """
+    if is_binary(blob):
+        return decode(blob)
+    return loads(blob)
+
+
+def to_rows(arr: np.ndarray, keys: List[str] = None) -> List[dict]:
+    """
+    Record array -> list of row dicts with native Python values
+    ("minute" as "HH:MM", "date" as "YYYY-MM-DD", "symbol" as str)
+    """
+    keys = keys or list(TICK_DTYPE.names)
+    columns = {}
+    for key in keys:
+        if key == "minute":
+            columns[key] = format_minutes(arr[key])
+        elif key == "date":
+            columns[key] = format_dates(arr[key])
+        elif key == "symbol":
+            columns[key] = [symbol.decode("ascii") for symbol in arr[key].tolist()]
+        else:
+            columns[key] = arr[key].tolist()
+    return [dict(zip(keys, values)) for values in zip(*(columns[key] for key in keys))]
@@ -1,43 +1,90 @@
 # ADD/MODIFY DATA FILES #####
 
 import os
+import sys
+import numpy as np
 import pandas as pd
 
 DATA_DIR_ROOT = "."
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
 
+from market_data import (  # noqa: E402
+    group_ranges, merge_ticks, records_to_frame, tick_keys, write_columnar
+)
 
-def df_to_csv(df, fname):
+COLUMNAR_DIR = f"{DATA_DIR_ROOT}/columnar"
+
+
+def df_to_csv(df, fname, append=False):
     """
-    Writes CSV file given dataframe and filename
+    Writes CSV file given dataframe and filename (appends without header if append=True)
     """
-    df.to_csv(f"{DATA_DIR_ROOT}/{fname}.csv", sep=',', index=False)
+    df.to_csv(
+        f"{DATA_DIR_ROOT}/{fname}.csv", sep=',', index=False, mode="a" if append else "w",
+        header=not append
+    )
     return
 
 
-def merge_stocks(data_dir, data_files):
+def merge_stocks(data_dir, data_files, batch_minutes=60):
     """
-    Merges all the files in a folder into one CSV sorted By Time and Symbol
+    Merges all the files in a folder sorted By Time and Symbol
+    Streams a k-way merge of the files: yields dataframes of `batch_minutes` minutes
+    and holds only one chunk of every file in memory
     """
+    batches = []
+    for batch in merge_ticks([f"{data_dir}/{symbol}" for symbol in sorted(data_files)]):
+        batches.append(batch)
+        if len(batches) == batch_minutes:
+            yield records_to_frame(np.concatenate(batches))
+            batches = []
+    if batches:
+        yield records_to_frame(np.concatenate(batches))
+
 
-    dataframes = [
-        pd.read_csv(
-            f"{data_dir}/{symbol}",
-            sep=",",
-        )
-        for symbol in data_files
-    ]
+def intraday_to_columnar(data_dir, out_dir):
+    """
+    Converts a folder of intraday CSV files to a columnar dataset sorted By Time and Symbol
+    (one .npy per column, grouped by minute)
+    """
+    batches = list(merge_ticks([data_dir]))
+    if not batches:
+        return 0
+    records = np.concatenate(batches)
+    columns = {name: records[name] for name in records.dtype.names}
+    write_columnar(out_dir, columns, group_ranges(tick_keys(records)))
+    return len(records)
 
-    merged_df = pd.concat(dataframes)
-    sort_merged_df = merged_df.sort_values(["minute", "symbol"])
 
-    return sort_merged_df
+def historical_to_columnar(data_dir, out_dir):
+    """
+    Converts the historical hist-<symbol>.csv files to a columnar dataset sorted By
+    Symbol and Date (one .npy per column, grouped by symbol)
+    """
+    dataframes = []
+    for fname in sorted(os.listdir(data_dir)):
+        if fname.startswith("hist-") and fname.endswith(".csv"):
+            df = pd.read_csv(f"{data_dir}/{fname}", sep=",", index_col=0)
+            df["symbol"] = fname[len("hist-"):-len(".csv")]
+            dataframes.append(df.sort_values("date"))
+    if not dataframes:
+        return 0
+    df = pd.concat(dataframes)
+    columns = {
+        column: df[column].to_numpy() if pd.api.types.is_numeric_dtype(df[column])
+        else np.asarray(df[column].to_numpy(), dtype="S")
+        for column in df.columns
+    }
+    write_columnar(out_dir, columns, group_ranges(columns["symbol"]))
+    return len(df)
 
 
 def init():
     """
     Main Function
     """
-    choice = input("1: Merge Stocks \t 2: Exit \n => ")
+    choice = input("1: Merge Stocks \t 2: Convert to Columnar \t 3: Exit \n => ")
     if choice == "1":
         # Merge Files
         try:
@@ -45,12 +92,29 @@ def init():
             merged_fname = "intraday-22-oct-merged"
             data_files = os.listdir(data_dir)
 
-            print("Merging Stocks...")
-            merged_df = merge_stocks(data_dir, data_files)
-            # print(merged_df.head())
+            print("Merging Stocks and writing merged file to csv...")
+            for idx, merged_df in enumerate(merge_stocks(data_dir, data_files)):
+                df_to_csv(merged_df, merged_fname, append=idx > 0)
+            print("Done")
+
+        except Exception as err:
+            print(f"Error: {err}")
 
-            print("Writing merged file to csv...")
-            df_to_csv(merged_df, merged_fname)
+    elif choice == "2":
+        # Convert every intraday folder and the historical data
+        try:
+            for fname in sorted(os.listdir(DATA_DIR_ROOT)):
+                data_dir = f"{DATA_DIR_ROOT}/{fname}"
+                if fname.startswith("intraday-") and os.path.isdir(data_dir):
+                    print(f"Converting {fname}...")
+                    rows = intraday_to_columnar(data_dir, f"{COLUMNAR_DIR}/{fname}")
+                    print(f"{rows} rows written to {COLUMNAR_DIR}/{fname}")
+
+            print("Converting historical_data...")
+            rows = historical_to_columnar(
+                f"{DATA_DIR_ROOT}/historical_data", f"{COLUMNAR_DIR}/historical_data"
+            )
+            print(f"{rows} rows written to {COLUMNAR_DIR}/historical_data")
             print("Done")
 
         except Exception as err:
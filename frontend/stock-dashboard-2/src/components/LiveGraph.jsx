@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react'
+import React, { useEffect, useRef, useState } from 'react'
 import { Container, Row, Col, Dropdown, DropdownButton } from 'react-bootstrap';
 import { Line } from 'react-chartjs-2';
 import io from 'socket.io-client';
@@ -20,6 +20,9 @@ const STOCK_DETAILS = {
 };
 
 
+// Delta mode of the live feed: snapshot once, then the new points coalesced over WINDOW seconds
+const LIVE_FEED = { mode: 'delta', window: 0.5, format: 'json' };
+
 const init_live_data = {
     labels: [],
     datasets: [
@@ -38,6 +41,8 @@ const init_live_data = {
 const LiveGraph = (props) => {
     const [curStock, setCurStock] = useState(STOCKS[0]);
     const [liveData, setLiveData] = useState(init_live_data);
+    // Date and number of points of the series held, checked against every delta
+    const series = useRef({ date: null, seq: 0 });
 
     const handleStockSymbolChange = (eventKey) => {
         setCurStock(eventKey);
@@ -51,8 +56,13 @@ const LiveGraph = (props) => {
             console.log(`SocketIO: Connected! (${socket.id})`);
             socket.emit('message', 'Connected');
         }).emit(
-            'get_live_data', curStock
+            'get_live_data', { symbol: curStock, ...LIVE_FEED }
         ).on('graph_data', (resp) => {
+            if (resp.error) {
+                console.error(`Live data of ${curStock}: ${resp.error}`);
+                return;
+            }
+            series.current = { date: resp.date, seq: resp.seq };
             const newState = {
                 ...liveData,
                 labels: [...resp.labels],
@@ -60,6 +70,38 @@ const LiveGraph = (props) => {
             }
             newState.datasets[0].data = [...resp.data];
             setLiveData(newState);
+        }).on('graph_delta', (resp) => {
+            // New points starting at position resp.seq of the series
+            const { date, seq } = series.current;
+            if (resp.date !== date || resp.seq > seq) {
+                // Points were missed: resync, only the points after ours are sent back
+                socket.emit('get_live_data', { symbol: curStock, ...LIVE_FEED, date, seq });
+                return;
+            }
+            if (resp.produced) {
+                const latency = Date.now() - resp.produced * 1000;
+                console.debug(`Tick-to-browser latency of ${curStock}: ${latency.toFixed(1)} ms`);
+            }
+            // Points before seq are already in the series
+            const skip = seq - resp.seq;
+            const labels = resp.labels.slice(skip);
+            const data = resp.data.slice(skip);
+            if (!labels.length) {
+                return;
+            }
+            series.current = { date, seq: seq + labels.length };
+            setLiveData((prevData) => {
+                const newState = {
+                    ...prevData,
+                    labels: [...prevData.labels, ...labels],
+                    datasets: [...prevData.datasets]
+                }
+                newState.datasets[0] = {
+                    ...prevData.datasets[0],
+                    data: [...prevData.datasets[0].data, ...data]
+                };
+                return newState;
+            });
         });
 
         socket.on('diconnect', () => {